@@ -0,0 +1,60 @@
+"""
+Benchmark the memory of multi-case SOWFA turbine frames
+
+Builds the frame load_cases returns for a synthetic campaign (100 cases of
+5 turbines and 10 channels by default) and compares its memory with the
+compact frame (float32 channels, small int turbine, Categorical case,
+sorted (case, turbine, time) index).
+
+usage: python benchmarks/bench_compact.py [num_cases] [num_steps]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from wind_tools.sowfa import read_sowfa_df, sowfa_analysis
+
+CHANNELS = ['nacYaw', 'rotSpeedFiltered', 'rotSpeed', 'thrust', 'torqueGen', 'powerRotor', 'powerGenerator',
+            'torqueRotor', 'azimuth', 'pitch']
+
+
+def synthetic_cases(num_cases, num_steps, num_turbines=5):
+    """The frame load_cases would return for num_cases cases, with case names as object strings"""
+
+    df_list = list()
+    for i in range(num_cases):
+        columns = {'time': np.repeat(0.02 * np.arange(num_steps), num_turbines),
+                   'turbine': np.tile(np.arange(num_turbines), num_steps)}
+        for chan in CHANNELS:
+            columns[chan] = np.random.uniform(0., 5e6, num_steps * num_turbines)
+        df = pd.DataFrame(columns)
+        df['case'] = pd.Series(['yaw_case_%03d' % i] * len(df), dtype=object)
+        df_list.append(df)
+
+    return pd.concat(df_list, ignore_index=True)
+
+
+def main(num_cases=100, num_steps=10000):
+
+    df = synthetic_cases(num_cases, num_steps)
+    memory = df.memory_usage(deep=True).sum() / 1e6
+    print('%d cases, %d rows' % (num_cases, len(df)))
+    print('default  %8.0f MB' % memory)
+
+    start = time.time()
+    df_compact = read_sowfa_df.compact_frame(df)
+    elapsed = time.time() - start
+    memory_compact = df_compact.memory_usage(deep=True, index=True).sum() / 1e6
+    print('compact  %8.0f MB  (%.1fx smaller, converted in %.2f s)' % (memory_compact, memory / memory_compact, elapsed))
+
+    for name, frame in [('default', df), ('compact', df_compact)]:
+        start = time.time()
+        sowfa_analysis.get_average_channel(frame, 'powerGenerator', 0.)
+        print('get_average_channel %-8s %6.2f s' % (name, time.time() - start))
+
+
+if __name__ == '__main__':
+    main(*[int(float(a)) for a in sys.argv[1:3]])
@@ -0,0 +1,119 @@
+"""
+Benchmark reading a SOWFA flow array
+
+Writes a synthetic array.mean style file and compares the original list
+comprehension coordinate construction against the current reader. Each
+variant runs in its own process so peak RSS can be reported separately.
+'cached' is a FlowField read through the memory-mapped binary cache.
+
+usage: python benchmarks/bench_flow_field.py [num_points]
+"""
+
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+from wind_tools.flow import flow_field
+
+
+def write_synthetic_flow_file(filename, dimensions, spacing=(10., 10., 10.), origin=(0., 0., 0.)):
+    """Write a synthetic flow array with the SOWFA 10 line header"""
+
+    num_points = int(np.prod(dimensions))
+    with open(filename, 'w') as f:
+        f.write('# vtk DataFile Version 3.0\n')
+        f.write('array.mean\n')
+        f.write('ASCII\n')
+        f.write('DATASET STRUCTURED_POINTS\n')
+        f.write('DIMENSIONS %d %d %d\n' % tuple(dimensions))
+        f.write('ORIGIN %g %g %g\n' % tuple(origin))
+        f.write('SPACING %g %g %g\n' % tuple(spacing))
+        f.write('POINT_DATA %d\n' % num_points)
+        f.write('VECTORS vectorData float\n')
+        f.write('LOOKUP_TABLE default\n')
+
+        # Write in blocks to keep memory down
+        block = 1000000
+        for start in range(0, num_points, block):
+            n = min(block, num_points - start)
+            data = np.random.uniform(0., 10., (n, 3))
+            np.savetxt(f, data, fmt='%.4f', delimiter='\t')
+
+
+def legacy_read_flow_frame_SOWFA(filename):
+    """The original reader, kept here as the reference"""
+
+    with open(filename, 'r') as f:
+        for i in range(10):
+            read_data = f.readline()
+            if 'SPACING' in read_data:
+                spacing = tuple([float(d) for d in read_data.rstrip().split(' ')[1:]])
+            if 'DIMENSIONS' in read_data:
+                dimensions = tuple([float(d) for d in read_data.rstrip().split(' ')[1:]])
+            if 'ORIGIN' in read_data:
+                origin = tuple([float(d) for d in read_data.rstrip().split(' ')[1:]])
+
+    xRange = np.arange(0, dimensions[0] * spacing[0], spacing[0])
+    yRange = np.arange(0, dimensions[1] * spacing[1], spacing[1])
+    zRange = np.arange(0, dimensions[2] * spacing[2], spacing[2])
+
+    pts = np.array([(x, y, z) for z in zRange for y in yRange for x in xRange])
+
+    df = pd.read_csv(filename, skiprows=10, sep='\t', header=None, names=['u', 'v', 'w'])
+    df['x'] = pts[:, 0]
+    df['y'] = pts[:, 1]
+    df['z'] = pts[:, 2]
+
+    return df, spacing, dimensions, origin
+
+
+def _run(name, filename, queue):
+    if name == 'legacy':
+        func = legacy_read_flow_frame_SOWFA
+    elif name == 'current':
+        func = lambda f: flow_field.read_flow_frame_SOWFA(f, cache=False)
+    else:
+        # Memory-mapped binary cache, populated before the timed runs
+        func = flow_field.read_flow_field_SOWFA
+    start = time.time()
+    func(filename)
+    elapsed = time.time() - start
+
+    # ru_maxrss is in kilobytes on linux
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.))
+
+
+def main(num_points=10**7):
+
+    nz = 100
+    nx = ny = int(np.sqrt(num_points / nz))
+    dimensions = (nx, ny, nz)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'array.mean')
+        print('Writing synthetic %d x %d x %d flow file...' % dimensions)
+        write_synthetic_flow_file(filename, dimensions)
+
+        # Populate the binary cache before timing the cached read
+        flow_field.read_flow_field_SOWFA(filename)
+
+        for name in ['legacy', 'current', 'cached']:
+            queue = mp.Queue()
+            p = mp.Process(target=_run, args=(name, filename, queue))
+            p.start()
+            elapsed, peak_rss = queue.get()
+            p.join()
+            print('%-8s %8.2f s   peak RSS %8.0f MB' % (name, elapsed, peak_rss))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(float(sys.argv[1])))
+    else:
+        main()
@@ -0,0 +1,93 @@
+"""
+Benchmark scanning the metadata of a campaign
+
+Writes num_cases cases (500 by default) with a controlDict and a 100
+turbine turbineArrayProperties, then times reading the start time and
+turbine coordinates of every case with the original line scanning readers,
+and with the read_foam_dict based ones, first read and memoized.
+
+usage: python benchmarks/bench_foam_dict.py [num_cases]
+"""
+
+import os
+import re
+import sys
+import time
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from wind_tools.layout.layoutFunctions import make_turbine_array
+from wind_tools.sowfa import read_foam_dict
+from wind_tools.sowfa.read_sowfa_df import get_turbine_coord
+from wind_tools.sowfa.readControlDict import readControlDict
+
+
+def legacy_read_control_dict(file):
+    """The original readControlDict, kept here as the reference"""
+
+    f = open(file, "r")
+    lines = f.readlines()
+    f.close()
+
+    properties = dict()
+    for line in lines:
+        line = line.strip()
+        if "startTime" in line and not "startFrom" in line:
+            properties['start time'] = float(line.split(';')[0].split()[1])
+
+    return properties
+
+
+def legacy_get_turbine_coord(case_folder):
+    """The original regex line scanning get_turbine_coord, kept here as the reference"""
+
+    x = list()
+    y = list()
+    with open(os.path.join(case_folder, 'constant', 'turbineArrayProperties'), 'r') as f:
+        for line in f:
+            if 'baseLocation' in line:
+                data = re.findall(r"[-+]?\d*\.\d+|\d+", line)
+                x.append(float(data[0]))
+                y.append(float(data[1]))
+
+    turbine_loc = pd.DataFrame({'x': x, 'y': y})
+    turbine_loc.index.name = 'Turbine'
+
+    return turbine_loc
+
+
+def main(num_cases=500):
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        case_folders = [os.path.join(tmp_dir, 'case_%03d' % i) for i in range(num_cases)]
+        for case_folder in case_folders:
+            os.makedirs(os.path.join(case_folder, 'constant'))
+            os.makedirs(os.path.join(case_folder, 'system'))
+            make_turbine_array(np.random.uniform(0., 1e4, 100), np.random.uniform(0., 1e4, 100),
+                               os.path.join(case_folder, 'constant', 'turbineArrayProperties'))
+            with open(os.path.join(case_folder, 'system', 'controlDict'), 'w') as f:
+                f.write('startFrom startTime;\nstartTime 20000;\nendTime 22000;\ndeltaT 0.02;\n')
+
+        start = time.time()
+        for case_folder in case_folders:
+            legacy_read_control_dict(os.path.join(case_folder, 'system', 'controlDict'))
+            legacy_get_turbine_coord(case_folder)
+        print('legacy   %8.2f s' % (time.time() - start))
+
+        for name in ['read', 'memoized']:
+            start = time.time()
+            for case_folder in case_folders:
+                readControlDict(os.path.join(case_folder, 'system', 'controlDict'))
+                get_turbine_coord(case_folder)
+            print('%-8s %8.2f s' % (name, time.time() - start))
+
+        read_foam_dict.clear_memo()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,47 @@
+"""
+Benchmark repeated sampling of a VTK slice
+
+Samples a synthetic slice (1M cells by default) many times at a small set of
+points, as done when tuning controllers, once through the original griddata
+closure (which rebuilds the spatial index on every call) and once through a
+SliceInterpolant, which builds its KD-tree once.
+
+usage: python benchmarks/bench_interpolant.py [num_cells] [num_calls]
+"""
+
+import sys
+import time
+
+import numpy as np
+from scipy.interpolate import griddata
+
+from wind_tools.slices import readVTK
+
+
+def main(num_cells=10**6, num_calls=20):
+
+    cellCenters = np.random.uniform(0., 3000., (num_cells, 2))
+    cellData = np.random.uniform(0., 10., (num_cells, 3))
+    samplePoints = (np.random.uniform(0., 3000., 1000), np.random.uniform(0., 3000., 1000))
+
+    def legacy_interpolant(samplePoints):
+        return griddata(cellCenters, cellData, samplePoints, method='nearest')
+
+    start = time.time()
+    for i in range(num_calls):
+        expected = legacy_interpolant(samplePoints)
+    print('griddata          %8.3f s per call' % ((time.time() - start) / num_calls))
+
+    start = time.time()
+    interpolant = readVTK.SliceInterpolant(cellCenters, cellData, workers=-1)
+    print('SliceInterpolant  %8.3f s to build the tree' % (time.time() - start))
+    start = time.time()
+    for i in range(num_calls):
+        sampled = interpolant(samplePoints)
+    print('SliceInterpolant  %8.5f s per call' % ((time.time() - start) / num_calls))
+
+    assert np.allclose(sampled, expected)
+
+
+if __name__ == '__main__':
+    main(*[int(float(a)) for a in sys.argv[1:3]])
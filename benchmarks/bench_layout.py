@@ -0,0 +1,115 @@
+"""
+Benchmark the pairwise turbine geometry of a layout
+
+Times the original cell by cell angle and pair tables of visualize_layout
+against pairwise_geometry and pair_table on a random farm (150 turbines by
+default), then the dense pairwise_geometry against the KD-tree
+neighbor_geometry for a radius of 2 km on a 2,000 turbine cluster of farms.
+Last, the wake relations of the first farm for 360 wind directions, one
+set_direction per direction against a single wake_matrices call.
+
+usage: python benchmarks/bench_layout.py [num_turbines]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import squareform, pdist
+
+from wind_tools.layout import layoutFunctions
+
+
+def legacy_pair_table(turbineLoc):
+    """The original angle matrix and pair list of visualize_layout, kept here as the reference"""
+
+    dist = pd.DataFrame(squareform(pdist(turbineLoc)), index=turbineLoc.index, columns=turbineLoc.index)
+    angle = pd.DataFrame()
+    turbines = turbineLoc.index
+    for t1 in turbines:
+        for t2 in turbines:
+            x1, y1 = turbineLoc.loc[t1, 'x'], turbineLoc.loc[t1, 'y']
+            x2, y2 = turbineLoc.loc[t2, 'x'], turbineLoc.loc[t2, 'y']
+            a = 270.0 - np.arctan2(y2 - y1, x2 - x1) * 180.0 / np.pi
+            angle.loc[t1, t2] = a + 360.0 if a < 0 else (a - 360.0 if a > 360 else a)
+
+    for t1 in turbines:
+        for t2 in turbines:
+            if dist.loc[t1, t2] == 0.0:
+                dist.loc[t1, t2] = np.nan
+                angle.loc[t1, t2] = np.nan
+
+    ordList = pd.DataFrame()
+    for t1 in turbines:
+        for t2 in turbines:
+            temp = pd.DataFrame({'T1': [t1], 'T2': [t2], 'Dist': [dist.loc[t1, t2]], 'angle': angle.loc[t1, t2]})
+            ordList = pd.concat([ordList, temp])
+
+    ordList.dropna(how='any', inplace=True)
+    ordList.sort_values('Dist', inplace=True, ascending=False)
+
+    return ordList
+
+
+def main(num_turbines=150):
+
+    turbineLoc = pd.DataFrame({'x': np.random.uniform(0., 20000., num_turbines),
+                               'y': np.random.uniform(0., 20000., num_turbines)},
+                              index=['T%03d' % i for i in range(num_turbines)])
+
+    start = time.time()
+    legacy = legacy_pair_table(turbineLoc)
+    print('legacy  %8.3f s' % (time.time() - start))
+
+    start = time.time()
+    pairs = layoutFunctions.pair_table(turbineLoc, ascending=False)
+    print('current %8.3f s' % (time.time() - start))
+
+    assert np.allclose(legacy.Dist.to_numpy(), pairs.Dist.to_numpy())
+    assert np.allclose(np.sort(legacy.angle.to_numpy()), np.sort(pairs.angle.to_numpy()))
+
+    # Ten farms of 200 turbines, 1 km apart within a farm, spread over 200 km
+    farms = np.random.uniform(0., 200000., (10, 2))
+    grid = np.stack(np.meshgrid(np.arange(20) * 1000., np.arange(10) * 1000.), axis=-1).reshape(-1, 2)
+    xy = (farms[:, None, :] + grid[None, :, :]).reshape(-1, 2)
+    turbineLoc = pd.DataFrame({'x': xy[:, 0], 'y': xy[:, 1]})
+
+    start = time.time()
+    dense = layoutFunctions.pair_table(turbineLoc, layoutFunctions.pairwise_geometry(turbineLoc))
+    dense = dense[dense.Dist <= 2000.]
+    print('dense   %8.3f s %8d pairs' % (time.time() - start, len(dense)))
+
+    start = time.time()
+    pairs = layoutFunctions.pair_table(turbineLoc, layoutFunctions.neighbor_geometry(turbineLoc, 2000.))
+    print('kd-tree %8.3f s %8d pairs' % (time.time() - start, len(pairs)))
+
+    assert len(dense) == len(pairs)
+
+    # Wind rose of one farm, rotating the farm so the wind comes from the west each time
+    turbineLoc = turbineLoc.iloc[:200]
+    directions = np.arange(360.)
+    start = time.time()
+    for direction in directions:
+        rotated = layoutFunctions.set_direction(turbineLoc, direction - 270.)
+        dx = rotated.x.to_numpy()[None, :] - rotated.x.to_numpy()[:, None]
+        dy = rotated.y.to_numpy()[None, :] - rotated.y.to_numpy()[:, None]
+        waked = (dx > 0.) & (np.abs(dy) <= dx * np.tan(np.deg2rad(15.)))
+    print('rotate  %8.3f s' % (time.time() - start))
+
+    start = time.time()
+    wakes = layoutFunctions.wake_matrices(turbineLoc, directions, sector_width=30.)
+    print('einsum  %8.3f s' % (time.time() - start))
+
+    start = time.time()
+    layoutFunctions.wake_matrices(turbineLoc, directions, sector_width=30., max_dist=5000.)
+    print('sparse  %8.3f s' % (time.time() - start))
+
+    assert (wakes['waked'][-1] == waked).mean() > 0.999
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,165 @@
+"""
+Benchmark the VTK POLYDATA slice reader
+
+Writes a synthetic SOWFA style slice of quads (2M polygons by default) and
+compares the original line-by-line parser against the current bulk parser,
+then the throughput of the same slice written as BINARY legacy VTK and as
+XML PolyData (.vtp) with raw appended data.
+
+usage: python benchmarks/bench_readVTK.py [num_polygons]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+from wind_tools.slices import readVTK
+
+
+def synthetic_slice(num_polygons):
+    """Points, (count, i_0, .. i_3) quads and a U field of roughly num_polygons quads"""
+
+    nx = int(np.sqrt(num_polygons))
+    ny = num_polygons // nx
+    x, y = np.meshgrid(np.arange(nx + 1) * 10., np.arange(ny + 1) * 10.)
+    points = np.column_stack([x.ravel(), y.ravel(), np.full(x.size, 90.)])
+    i, j = np.meshgrid(np.arange(nx), np.arange(ny))
+    corner = (j * (nx + 1) + i).ravel()
+    polygons = np.column_stack([np.full(nx * ny, 4), corner, corner + 1, corner + nx + 2, corner + nx + 1])
+    u = np.random.uniform(0., 10., (len(polygons), 3))
+
+    return points, polygons, u
+
+
+def write_synthetic_slice(filename, num_polygons):
+    """Write an ASCII POLYDATA slice of roughly num_polygons quads with a U field"""
+
+    points, polygons, u = synthetic_slice(num_polygons)
+
+    with open(filename, 'w') as f:
+        f.write('# vtk DataFile Version 2.0\nsampleSurface\nASCII\nDATASET POLYDATA\n')
+        f.write('POINTS %d float\n' % len(points))
+        np.savetxt(f, points, fmt='%g')
+        f.write('POLYGONS %d %d\n' % (len(polygons), polygons.size))
+        np.savetxt(f, polygons, fmt='%d')
+        f.write('\nCELL_DATA %d\nFIELD attributes 1\n' % len(polygons))
+        f.write('U 3 %d float\n' % len(polygons))
+        np.savetxt(f, u, fmt='%g')
+
+    return len(polygons)
+
+
+def write_synthetic_binary_slice(filename, num_polygons):
+    """Write the same slice as a BINARY (big-endian) POLYDATA file"""
+
+    points, polygons, u = synthetic_slice(num_polygons)
+
+    with open(filename, 'wb') as f:
+        f.write(b'# vtk DataFile Version 2.0\nsampleSurface\nBINARY\nDATASET POLYDATA\n')
+        f.write(b'POINTS %d float\n' % len(points))
+        f.write(points.astype('>f4').tobytes() + b'\n')
+        f.write(b'POLYGONS %d %d\n' % (len(polygons), polygons.size))
+        f.write(polygons.astype('>i4').tobytes() + b'\n')
+        f.write(b'CELL_DATA %d\nFIELD attributes 1\n' % len(polygons))
+        f.write(b'U 3 %d float\n' % len(polygons))
+        f.write(u.astype('>f4').tobytes() + b'\n')
+
+
+def write_synthetic_vtp_slice(filename, num_polygons):
+    """Write the same slice as an XML PolyData file with raw appended data"""
+
+    points, polygons, u = synthetic_slice(num_polygons)
+    arrays = [('U', 'Float32', 3, u.astype('<f4')),
+              ('Points', 'Float32', 3, points.astype('<f4')),
+              ('connectivity', 'Int64', 1, polygons[:, 1:].astype('<i8')),
+              ('offsets', 'Int64', 1, np.cumsum(polygons[:, 0]).astype('<i8'))]
+    offsets = np.cumsum([0] + [8 + values.nbytes for name, dtype, components, values in arrays])
+    element = '<DataArray type="%s" Name="%s" NumberOfComponents="%d" format="appended" offset="%d"/>\n'
+    elements = [element % (dtype, name, components, offset)
+                for (name, dtype, components, values), offset in zip(arrays, offsets)]
+
+    with open(filename, 'wb') as f:
+        f.write(b'<?xml version="1.0"?>\n')
+        f.write(b'<VTKFile type="PolyData" version="1.0" byte_order="LittleEndian" header_type="UInt64">\n')
+        f.write(('<PolyData>\n<Piece NumberOfPoints="%d" NumberOfPolys="%d">\n' % (len(points), len(polygons))).encode())
+        f.write(('<CellData>\n%s</CellData>\n<Points>\n%s</Points>\n<Polys>\n%s%s</Polys>\n' % tuple(elements)).encode())
+        f.write(b'</Piece>\n</PolyData>\n<AppendedData encoding="raw">\n_')
+        for name, dtype, components, values in arrays:
+            f.write(np.uint64(values.nbytes).tobytes() + values.tobytes())
+        f.write(b'\n</AppendedData>\n</VTKFile>\n')
+
+
+def legacy_readVTK(filename):
+    """The original reader (single attribute), kept here as the reference"""
+
+    file = open(filename, 'r')
+    lines = file.readlines()
+    file.close()
+
+    lineCounter = 0
+    while lineCounter < len(lines):
+        line = lines[lineCounter].strip()
+
+        if line == 'DATASET POLYDATA':
+            lineCounter += 1
+            line = lines[lineCounter].strip().split()
+            nPoints = int(line[1])
+            pointsXYZ = np.array([x.split() for x in lines[lineCounter+1:lineCounter+1+nPoints]]).astype(float)
+            lineCounter = lineCounter + nPoints
+
+        if line[0:8] == 'POLYGONS':
+            nPolygons = int(line.split()[1])
+            polygons = [[int(xx) for xx in x.split()[1:]] for x in lines[lineCounter+1:lineCounter+1+nPolygons]]
+            cellCenters = np.array([pointsXYZ[verts].mean(axis=0) for verts in polygons])
+            lineCounter = lineCounter + nPolygons
+
+        if line[0:9] == 'CELL_DATA':
+            lineCounter += 2
+            cellData = np.array([x.split() for x in lines[lineCounter+1:lineCounter+1+nPolygons]]).astype(float)
+            lineCounter = lineCounter + nPolygons
+
+        lineCounter += 1
+
+    return cellCenters, cellData, pointsXYZ
+
+
+def main(num_polygons=2000000):
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'U_slice_1.vtk')
+        num_polygons = write_synthetic_slice(filename, num_polygons)
+        print('%d polygons, %.0f MB' % (num_polygons, os.path.getsize(filename) / 1e6))
+
+        start = time.time()
+        cellCenters, cellData, pointsXYZ = legacy_readVTK(filename)
+        print('legacy  %8.2f s' % (time.time() - start))
+
+        start = time.time()
+        dataType, cellCenters_new, cellData_new, pointsXYZ_new = readVTK.readVTK(filename)
+        print('current %8.2f s' % (time.time() - start))
+
+        assert np.allclose(cellCenters, cellCenters_new) and np.allclose(cellData, cellData_new)
+
+        # Throughput of the same slice in each format, through the current reader
+        for name, write_func in [('ascii', write_synthetic_slice),
+                                 ('binary', write_synthetic_binary_slice),
+                                 ('vtp', write_synthetic_vtp_slice)]:
+            filename = os.path.join(tmp_dir, 'U_slice_1.%s' % ('vtp' if name == 'vtp' else 'vtk'))
+            np.random.seed(0)
+            write_func(filename, num_polygons)
+            size = os.path.getsize(filename) / 1e6
+            start = time.time()
+            readVTK.readVTK(filename)
+            elapsed = time.time() - start
+            print('%-7s %8.0f MB %8.2f s %8.0f MB/s %8.2f Mpolygons/s'
+                  % (name, size, elapsed, size / elapsed, num_polygons / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(float(sys.argv[1])))
+    else:
+        main()
@@ -0,0 +1,115 @@
+"""
+Benchmark loading SOWFA turbineOutput cases
+
+Writes synthetic cases of 10 channels each and compares the original loader
+(index aligned channels, frame grown case by case) against the current
+positional, single concat loader with the c and pyarrow csv engines.
+
+usage: python benchmarks/bench_read_sowfa.py [num_cases] [num_rows]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from wind_tools.sowfa import read_sowfa_df
+
+CHANNELS = ['nacYaw', 'rotSpeedFiltered', 'rotSpeed', 'thrust', 'torqueGen', 'powerRotor', 'powerGenerator',
+            'torqueRotor', 'azimuth', 'pitch']
+
+
+def write_synthetic_case(folder_name, num_rows, num_turbines=5):
+    """Write the 10 channel files of a case with num_rows rows each"""
+
+    os.makedirs(folder_name)
+    num_steps = num_rows // num_turbines
+    turbine = np.tile(np.arange(num_turbines), num_steps)
+    time = np.repeat(20000. + 0.02 * np.arange(1, num_steps + 1), num_turbines)
+    for chan in CHANNELS:
+        with open(os.path.join(folder_name, chan), 'w') as f:
+            f.write('#Turbine    Time(s)    dt(s)    %s\n' % chan)
+            data = np.column_stack([turbine, time, np.full(len(time), 0.02), np.random.uniform(0., 5e6, len(time))])
+            np.savetxt(f, data, fmt=['%d', '%.4f', '%g', '%.9g'], delimiter=' ')
+
+
+def legacy_read_sowfa_df(folder_name):
+    """The original reader, kept here as the reference"""
+
+    outputNames = [f for f in os.listdir(folder_name) if os.path.isfile(os.path.join(folder_name, f))]
+    for c_idx, chan in enumerate(outputNames):
+        df_inner = pd.read_csv(os.path.join(folder_name, chan), sep=' ', header=None, skiprows=1)
+        df_inner.columns = ['turbine', 'time', 'dt', chan]
+        df_inner = df_inner[['time', 'turbine', chan]].set_index(['time', 'turbine'])
+        if c_idx == 0:
+            df = df_inner.copy(deep=True)
+        else:
+            df[chan] = df_inner[chan]
+    df = df.reset_index()
+    df['time'] = df.time - df.time.min()
+
+    return df
+
+
+def legacy_load_cases(case_list, case_folder, sub_folder):
+    """The original case loop, with df.append (gone from pandas 2) written as the equivalent concat"""
+
+    df = pd.DataFrame()
+    for case_name in case_list:
+        df_inner = legacy_read_sowfa_df(os.path.join(case_folder, case_name, sub_folder))
+        df_inner['case'] = case_name
+        df = pd.concat([df, df_inner])
+    df['time'] = df.time - df.time.min()
+
+    return df
+
+
+def main(num_cases=10, num_rows=100000, max_workers=4):
+
+    sub_folder = os.path.join('turbineOutput', '20000')
+    case_list = ['case_%03d' % i for i in range(num_cases)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for case in case_list:
+            write_synthetic_case(os.path.join(tmp_dir, case, sub_folder), num_rows)
+        size = sum(os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(tmp_dir) for f in files) / 1e6
+        print('%d cases x %d channels x %d rows, %.0f MB' % (num_cases, len(CHANNELS), num_rows, size))
+
+        start = time.time()
+        df_legacy = legacy_load_cases(case_list, tmp_dir, sub_folder)
+        print('legacy          %8.2f s' % (time.time() - start))
+
+        for engine in ['c', 'pyarrow']:
+            start = time.time()
+            df = read_sowfa_df.load_cases(case_list, tmp_dir, sub_folder=sub_folder, engine=engine, cache=False)
+            elapsed = time.time() - start
+            print('current %-7s %8.2f s %8.0f MB/s' % (engine, elapsed, size / elapsed))
+
+        assert np.allclose(df_legacy[CHANNELS].to_numpy(), df[CHANNELS].to_numpy())
+
+        start = time.time()
+        df, report = read_sowfa_df.load_cases(case_list, tmp_dir, sub_folder=sub_folder, max_workers=max_workers,
+                                              return_report=True, cache=False)
+        elapsed = time.time() - start
+        print('%d workers       %8.2f s %8.0f MB/s (%.2f s per case)'
+              % (max_workers, elapsed, size / elapsed, report.seconds.mean()))
+
+        read_sowfa_df.warm_cache(tmp_dir)
+        for name, channels in [('cached', []), ('cached 1 ch', ['powerGenerator'])]:
+            start = time.time()
+            df = read_sowfa_df.load_cases(case_list, tmp_dir, sub_folder=sub_folder, channels=channels)
+            print('%-15s %8.2f s' % (name, time.time() - start))
+
+        end_time = 0.02 * num_rows / 5 / 10
+        for name, cache in [('window parsed', False), ('window cached', True)]:
+            start = time.time()
+            df = read_sowfa_df.load_cases(case_list, tmp_dir, sub_folder=sub_folder, channels=['powerGenerator', 'nacYaw'],
+                                          cache=cache, start_time=0., end_time=end_time)
+            print('%-15s %8.2f s %8d rows' % (name, time.time() - start, len(df)))
+
+
+if __name__ == '__main__':
+    main(*[int(float(a)) for a in sys.argv[1:4]])
@@ -0,0 +1,102 @@
+"""
+Benchmark writing turbineArrayProperties files
+
+Writes num_cases layouts of num_turbines turbines (100 of 1,000 by default)
+with the original write per line writer and with make_turbine_arrays, in
+serial and in a process pool.
+
+usage: python benchmarks/bench_turbine_array.py [num_cases] [num_turbines]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from wind_tools.layout import layoutFunctions
+
+
+def legacy_make_turbine_array(x,y,filename='turbineArrayProperties',turbine='NREL5MWRef'):
+    """The original writer, one f.write per line, kept here as the reference"""
+
+    # Open the file for writing
+    with open(filename,'w') as f:
+
+        # Write out the headerlines
+        f.write('/*--------------------------------*- C++ -*----------------------------------*\\\n')
+        f.write('| =========                 |                                                 |\n')
+        f.write('| \\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |\n')
+        f.write('|  \\    /   O peration     | Version:  1.6                                   |\n')
+        f.write('|   \\  /    A nd           | Web:      http://www.OpenFOAM.org               |\n')
+        f.write('|    \\/     M anipulation  |                                                 |\n')
+        f.write('\\*---------------------------------------------------------------------------*/\n')
+        f.write('FoamFile\n')
+        f.write('{\n')
+        f.write('    version     2.0;\n')
+        f.write('    format      ascii;\n')
+        f.write('    class       dictionary;\n')
+        f.write('    object      turbineProperties;\n')
+        f.write('}\n')
+        f.write('// * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * //\n')
+        f.write('\n')
+        f.write('globalProperties\n')
+        f.write('{\n')
+        f.write('    outputControl       "timeStep";\n')
+        f.write('    outputInterval       1;\n')
+        f.write('}\n')
+
+        for idx, (x_val, y_val) in enumerate(zip(x,y)):
+            f.write('\n')
+            f.write('turbine%d\n' % idx)
+            f.write('{\n')
+            f.write('    turbineType         "%s";\n' % turbine)
+            f.write('    baseLocation        (%.1f %.1f 0.0);\n' % (x_val,y_val))
+            f.write('    nRadial              64;\n')
+            f.write('    azimuthMaxDis        2.0;\n')
+            f.write('    nAvgSector           1;\n')
+            f.write('    pointDistType       "uniform";\n')
+            f.write('    pointInterpType     "linear";\n')
+            f.write('    bladeUpdateType     "oldPosition";\n')
+            f.write('    epsilon              20.0;\n')
+            f.write('    forceScalar          1.0;\n')
+            f.write('    inflowVelocityScalar 0.94;\n')
+            f.write('    tipRootLossCorrType "Glauert";\n')
+            f.write('    rotationDir         "cw";\n')
+            f.write('    Azimuth              0.0;\n')
+            f.write('    RotSpeed             13.0;\n')
+            f.write('    TorqueGen            20000.0;\n')
+            f.write('    Pitch                0.0;\n')
+            f.write('    NacYaw               270.0;\n')
+            f.write('    fluidDensity         1.225;\n')
+            f.write('}\n')
+
+
+def main(num_cases=100, num_turbines=1000):
+
+    layouts = [pd.DataFrame({'x': np.random.uniform(0., 2e4, num_turbines),
+                             'y': np.random.uniform(0., 2e4, num_turbines)}) for i in range(num_cases)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        case_folders = [os.path.join(tmp_dir, 'case_%03d' % i) for i in range(num_cases)]
+        for case_folder in case_folders:
+            os.makedirs(os.path.join(case_folder, 'constant'))
+
+        start = time.time()
+        for case_folder, layout in zip(case_folders, layouts):
+            legacy_make_turbine_array(layout.x, layout.y, os.path.join(case_folder, 'constant', 'legacy'))
+        print('legacy   %8.2f s' % (time.time() - start))
+
+        for max_workers in [None, os.cpu_count()]:
+            start = time.time()
+            filenames = layoutFunctions.make_turbine_arrays(case_folders, layouts, max_workers=max_workers)
+            print('current  %8.2f s (max_workers %s)' % (time.time() - start, max_workers))
+
+        with open(filenames[0]) as f, open(os.path.join(case_folders[0], 'constant', 'legacy')) as f_legacy:
+            assert f.read() == f_legacy.read()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
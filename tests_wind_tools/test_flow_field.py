@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wind_tools.flow` package."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from wind_tools.flow import flow_field
+from wind_tools.flow import cut_plane
+
+
+class TestFlowField(unittest.TestCase):
+    """Tests for `wind_tools.flow.flow_field`."""
+
+    def test_grid_coordinates_order(self):
+        """Coordinates follow the SOWFA point order, x fastest then y then z."""
+        spacing = (10., 5., 2.)
+        dimensions = (4., 3., 2.)
+        x, y, z = flow_field.get_grid_coordinates(spacing, dimensions)
+
+        expected = np.array([(x, y, z)
+                             for z in np.arange(2) * 2.
+                             for y in np.arange(3) * 5.
+                             for x in np.arange(4) * 10.])
+        np.testing.assert_array_equal(np.column_stack([x, y, z]), expected)
+
+    def test_flow_field_round_trip(self):
+        """A FlowField rebuilt from its own long-format frame is unchanged."""
+        rng = np.random.default_rng(0)
+        u, v, w = rng.uniform(0., 10., (3, 4, 5, 6))
+        flow = flow_field.FlowField(u, v, w, (10., 10., 5.), origin=(100., 200., 0.))
+        df = flow.to_dataframe().sample(frac=1., random_state=0)
+
+        flow_back = flow_field.FlowField.from_points(df.x, df.y, df.z, df.u, df.v, df.w)
+        np.testing.assert_array_equal(flow_back.u, u)
+        self.assertEqual(flow_back.origin, flow.origin)
+        self.assertEqual(flow_back.dimensions, (6, 5, 4))
+
+    def test_flow_field_nearest_plane(self):
+        """The nearest plane is found by index and matches the frame."""
+        rng = np.random.default_rng(0)
+        u, v, w = rng.uniform(0., 10., (3, 4, 5, 6))
+        flow = flow_field.FlowField(u, v, w, (10., 10., 5.), origin=(100., 200., 0.))
+        df = flow.to_dataframe()
+
+        self.assertEqual(flow.nearest_value('x', 133.), 130.)
+        y, z, u_plane, _, _ = flow.get_plane('x', 133.)
+        df_sub = df[df.x == 130.]
+        np.testing.assert_array_equal(u_plane.ravel(), df_sub.u.values)
+        np.testing.assert_array_equal(np.meshgrid(y, z)[0].ravel(), df_sub.y.values)
+
+    def test_read_flow_field_cache(self):
+        """A second read comes memory-mapped from the cache, a changed file is re-parsed."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'array.mean')
+            with open(filename, 'w') as f:
+                f.write('\n' * 4)
+                f.write('DIMENSIONS 3 2 2\nORIGIN 1 2 3\nSPACING 10 10 10\n')
+                f.write('\n' * 3)
+                f.write('\n'.join(['%d\t0\t0' % i for i in range(12)]) + '\n')
+
+            flow = flow_field.read_flow_field_SOWFA(filename, cache_dir=tmp_dir)
+            flow_cached = flow_field.read_flow_field_SOWFA(filename, cache_dir=tmp_dir)
+            self.assertIsInstance(flow_cached.u, np.memmap)
+            np.testing.assert_array_equal(flow_cached.u, flow.u)
+            self.assertEqual(flow_cached.origin, (1., 2., 3.))
+
+            with open(filename, 'a') as f:
+                f.write('\n')
+            flow_changed = flow_field.read_flow_field_SOWFA(filename, cache_dir=tmp_dir)
+            self.assertNotIsInstance(flow_changed.u, np.memmap)
+
+            # A truncated file names the point counts
+            with open(filename, 'w') as f:
+                f.write('\n' * 4)
+                f.write('DIMENSIONS 3 2 2\nORIGIN 1 2 3\nSPACING 10 10 10\n')
+                f.write('\n' * 3)
+                f.write('\n'.join(['%d\t0\t0' % i for i in range(10)]) + '\n')
+            with self.assertRaisesRegex(ValueError, 'has 10 points, expected 12'):
+                flow_field.read_flow_field_SOWFA(filename, cache=False)
+
+    def test_cut_plane_structured(self):
+        """Rectilinear planes keep the native grid, or resample close to griddata."""
+        x = np.arange(30) * 10.
+        z, y, x = np.meshgrid(np.arange(3) * 10., x, x, indexing='ij')
+        u = 8. + np.sin(x / 100.) * np.cos(y / 80.)
+        flow = flow_field.FlowField(u, u * 0., u * 0., (10., 10., 10.))
+
+        native = cut_plane.HorPlane(flow, 10., resolution=30)
+        np.testing.assert_array_equal(native.u_mesh, u[1].ravel())
+
+        # Resampling stays with the triangulated interpolation unless the spline is asked for
+        df = flow.to_dataframe()
+        default = cut_plane.HorPlane(df, 10., resolution=45)
+        spline = cut_plane.HorPlane(df, 10., resolution=45, structured=True)
+        cubic = cut_plane._CutPlane(df, x1='x', x2='y', x3_value=10., resolution=45, structured=False)
+        self.assertIsNotNone(default.triangulation)
+        np.testing.assert_array_equal(default.u_mesh, cubic.u_mesh)
+        self.assertIsNone(spline.triangulation)
+        np.testing.assert_allclose(spline.u_mesh, cubic.u_mesh, atol=1e-2)
+
+        # A single sample along x2 can only be kept at its native resolution
+        thin = flow_field.FlowField(u[:, :1], u[:, :1], u[:, :1], (10., 10., 10.))
+        self.assertEqual(cut_plane.HorPlane(thin, 10., resolution=None).u_mesh.size, 30)
+        with self.assertRaises(ValueError):
+            cut_plane.HorPlane(thin, 10., resolution=30)
+
+    def test_cut_plane_shared_triangulation(self):
+        """Scattered planes match griddata and can reuse a triangulation."""
+        from scipy.interpolate import griddata
+
+        rng = np.random.default_rng(0)
+        y = rng.uniform(-200., 200., 500)
+        z = rng.uniform(0., 200., 500)
+        u = 8. + np.sin(y / 50.)
+        plane = cut_plane.LidarCrossPlane(y, z, u, 0., 90., 126., resolution=20)
+        expected = griddata(np.column_stack([y, z]), u, (-plane.x1_flat, plane.x2_flat), method='cubic')
+        np.testing.assert_allclose(plane.u_mesh, expected)
+
+        plane_reuse = cut_plane.LidarCrossPlane(y, z, u**2, 0., 90., 126., resolution=20,
+                                                triangulation=plane.triangulation)
+        expected = griddata(np.column_stack([y, z]), u**2, (-plane.x1_flat, plane.x2_flat), method='cubic')
+        np.testing.assert_allclose(plane_reuse.u_mesh, expected)
+
+    def test_cut_planes(self):
+        """Batch cutting gives the same planes as cutting one at a time."""
+        rng = np.random.default_rng(0)
+        u = rng.uniform(6., 10., (5, 6, 8))
+        flow = flow_field.FlowField(u, u * 0., u * 0., (10., 10., 10.))
+        df = flow.to_dataframe()
+        values = [12., 48., 41.]
+
+        planes = cut_plane.cut_planes(df, 'x', values, y_center=25., z_center=20., D=30., resolution=None)
+        planes_field = cut_plane.cut_planes(flow, 'x', values, y_center=25., z_center=20., D=30., resolution=None)
+        for value, plane, plane_field in zip(values, planes, planes_field):
+            expected = cut_plane.CrossPlane(df, value, 25., 20., 30., resolution=None)
+            np.testing.assert_array_equal(plane.u_mesh, expected.u_mesh)
+            np.testing.assert_array_equal(plane_field.u_mesh, expected.u_mesh)
+
+        # Planes of a FlowField with missing values are triangulated, the triangulation is handed on
+        u[:, :, 3] = np.nan
+        planes = cut_plane.cut_planes(flow, 'z', [0., 10., 20.], resolution=8)
+        self.assertIs(planes[1].triangulation, planes[0].triangulation)
+        for value, plane in zip([0., 10., 20.], planes):
+            np.testing.assert_allclose(plane.u_mesh, cut_plane.HorPlane(flow, value, resolution=8).u_mesh)
+
+    def test_rotor_average(self):
+        """Vectorized rotor averages match the per-rotor mask and skip NaN cells."""
+        rng = np.random.default_rng(0)
+        u = rng.uniform(6., 10., (20, 30, 2))
+        flow = flow_field.FlowField(u, u * 0., u * 0., (10., 10., 10.))
+        plane = cut_plane.CrossPlane(flow, 0., 150., 100., 80., resolution=None)
+        plane.u_cubed[:25] = np.nan
+
+        y_locs = np.linspace(-250., -50., 7)
+        speeds = plane.calculate_wind_speed(y_locs, 100., 40.)
+        for y_loc, speed in zip(y_locs, speeds):
+            distance = np.sqrt((plane.x1_flat - y_loc)**2 + (plane.x2_flat - 100.)**2)
+            self.assertAlmostEqual(speed, np.cbrt(np.nanmean(plane.u_cubed[distance < 40.])))
+
+        # Changing the velocities between calls is seen by the next call
+        plane.u_mesh = plane.u_mesh * 2.
+        plane.u_cubed = plane.u_mesh ** 3
+        np.testing.assert_allclose(plane.calculate_wind_speed(y_locs, 100., 40.), 2. * speeds)
+        plane.u_cubed[:] = 1.
+        np.testing.assert_allclose(plane.calculate_wind_speed(y_locs, 100., 40.), 1.)
+
+    def test_plane_arithmetic(self):
+        """Plane arithmetic shares the grid and only allocates the results."""
+        rng = np.random.default_rng(0)
+        u = rng.uniform(6., 10., (5, 6, 8))
+        flow = flow_field.FlowField(u, u * 0., u * 0., (10., 10., 10.))
+        planes = cut_plane.cut_planes(flow, 'z', [0., 10., 20.], resolution=None)
+
+        mean_plane = cut_plane.average_planes(planes)
+        np.testing.assert_allclose(mean_plane.u_mesh, u[:3].mean(axis=0).ravel())
+        self.assertTrue(np.shares_memory(mean_plane.x1_mesh, planes[0].x1_mesh))
+
+        # The shared grid is read-only on the new plane, the plane it came from is left as it was
+        with self.assertRaises(ValueError):
+            mean_plane.x1_mesh += 100.
+        x1_mesh = planes[0].x1_mesh.copy()
+        mean_plane.x1_mesh = mean_plane.x1_mesh + 100.
+        np.testing.assert_array_equal(planes[0].x1_mesh, x1_mesh)
+        np.testing.assert_array_equal(mean_plane.x1_mesh, x1_mesh + 100.)
+
+        difference = planes[0].add(planes[1]).subtract(planes[1].scale(2.))
+        np.testing.assert_allclose(difference.u_mesh, (u[0] - u[1]).ravel())
+        np.testing.assert_allclose(planes[0].ratio(planes[0]).u_mesh, 1.)
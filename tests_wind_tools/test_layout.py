@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wind_tools.layout` package."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from wind_tools.layout import layoutFunctions
+
+
+def legacy_wake_angle(df, turbList):
+    """The original wakeAngle, kept here as the reference"""
+    x1, y1 = df.loc[turbList[0], ['x', 'y']]
+    x2, y2 = df.loc[turbList[1], ['x', 'y']]
+    wakeAngle = 270.0 - np.arctan2(y2 - y1, x2 - x1) * 180.0 / np.pi
+    if wakeAngle < 0:
+        wakeAngle = wakeAngle + 360.0
+    if wakeAngle > 360:
+        wakeAngle = wakeAngle - 360.0
+    return wakeAngle
+
+
+class TestLayoutFunctions(unittest.TestCase):
+    """Tests for `wind_tools.layout.layoutFunctions`."""
+
+    def setUp(self):
+        """A small irregular farm, with turbines due north, south, east and west of each other."""
+        self.turbineLoc = pd.DataFrame({'x': [0., 500., 500., 0., 1234.5, 800.],
+                                        'y': [0., 0., 500., -300., 321., -700.]},
+                                       index=['T%d' % i for i in range(6)])
+
+    def test_pairwise_geometry(self):
+        """Distances and angles match the pair by pair functions, offsets follow the wind direction."""
+        geometry = layoutFunctions.pairwise_geometry(self.turbineLoc)
+        for i, t1 in enumerate(self.turbineLoc.index):
+            for j, t2 in enumerate(self.turbineLoc.index):
+                x1, y1 = self.turbineLoc.loc[t1]
+                x2, y2 = self.turbineLoc.loc[t2]
+                self.assertAlmostEqual(geometry['dist'][i, j], np.hypot(x2 - x1, y2 - y1))
+                self.assertAlmostEqual(geometry['angle'][i, j], legacy_wake_angle(self.turbineLoc, [t1, t2]))
+                self.assertAlmostEqual(layoutFunctions.wakeAngle(self.turbineLoc, [t1, t2]), geometry['angle'][i, j])
+                self.assertAlmostEqual(layoutFunctions.turbineDist(self.turbineLoc, [t1, t2]), geometry['dist'][i, j])
+
+        # West wind blows along x, north wind along -y
+        np.testing.assert_allclose(geometry['downstream'][0], self.turbineLoc.x, atol=1e-9)
+        np.testing.assert_allclose(geometry['crosswind'][0], self.turbineLoc.y, atol=1e-9)
+        geometry = layoutFunctions.pairwise_geometry(self.turbineLoc, wind_direction=0.)
+        np.testing.assert_allclose(geometry['downstream'][0], -self.turbineLoc.y, atol=1e-9)
+        np.testing.assert_allclose(geometry['crosswind'][0], self.turbineLoc.x, atol=1e-9)
+
+        # The wind direction in which T0 wakes T1 puts T1 straight downstream
+        angle = layoutFunctions.wakeAngle(self.turbineLoc, ['T0', 'T4'])
+        geometry = layoutFunctions.pairwise_geometry(self.turbineLoc, wind_direction=angle)
+        self.assertAlmostEqual(geometry['crosswind'][0, 4], 0.)
+        self.assertAlmostEqual(geometry['downstream'][0, 4], geometry['dist'][0, 4])
+
+    def test_pair_table(self):
+        """Every ordered pair of distinct turbines once, sorted by distance."""
+        pairs = layoutFunctions.pair_table(self.turbineLoc, ascending=False)
+        self.assertEqual(len(pairs), 30)
+        self.assertTrue((np.diff(pairs.Dist) <= 0).all())
+        row = pairs[(pairs.T1 == 'T2') & (pairs.T2 == 'T1')].iloc[0]
+        self.assertAlmostEqual(row.Dist, 500.)
+        self.assertAlmostEqual(row.angle, 360.)
+
+    def test_neighbor_geometry(self):
+        """The sparse pairs are the dense pairs within the radius, or within the wake sector."""
+        dense = layoutFunctions.pairwise_geometry(self.turbineLoc, wind_direction=250.)
+        within = (dense['dist'] > 0.) & (dense['dist'] <= 600.)
+
+        geometry = layoutFunctions.neighbor_geometry(self.turbineLoc, 600., wind_direction=250.)
+        for key in dense:
+            np.testing.assert_array_equal(geometry[key].toarray() != 0, within & (dense[key] != 0))
+            np.testing.assert_allclose(geometry[key].toarray()[within], dense[key][within])
+
+        off_axis = np.degrees(np.abs(np.arctan2(dense['crosswind'], dense['downstream'])))
+        in_sector = (dense['dist'] > 0.) & (dense['downstream'] > 0.) & (off_axis <= 30.)
+        geometry = layoutFunctions.neighbor_geometry(self.turbineLoc, 1e4, wind_direction=250., sector_width=60.)
+        np.testing.assert_array_equal(geometry['dist'].toarray() > 0, in_sector)
+
+        pairs = layoutFunctions.pair_table(self.turbineLoc, geometry)
+        self.assertEqual(len(pairs), in_sector.sum())
+        self.assertTrue((pairs.downstream > 0).all())
+
+    def test_wake_matrices(self):
+        """Each direction matches the wake sector of neighbor_geometry, sparse or dense."""
+        directions = np.arange(0., 360., 15.)
+        wakes = layoutFunctions.wake_matrices(self.turbineLoc, directions, sector_width=40.)
+        sparse_wakes = layoutFunctions.wake_matrices(self.turbineLoc, directions, sector_width=40., max_dist=700.)
+        self.assertEqual(wakes['waked'].shape, (len(directions), 6, 6))
+
+        d, i, j = sparse_wakes['waked'].coords
+        self.assertEqual(sparse_wakes['waked'].shape, wakes['waked'].shape)
+        for k, direction in enumerate(directions):
+            geometry = layoutFunctions.pairwise_geometry(self.turbineLoc, wind_direction=direction)
+            np.testing.assert_allclose(wakes['downstream'][k], geometry['downstream'], atol=1e-9)
+            np.testing.assert_allclose(wakes['crosswind'][k], geometry['crosswind'], atol=1e-9)
+
+            sector = layoutFunctions.neighbor_geometry(self.turbineLoc, 1e4, wind_direction=direction, sector_width=40.)
+            np.testing.assert_array_equal(wakes['waked'][k], sector['dist'].toarray() > 0)
+
+            waked = np.zeros((6, 6), dtype=bool)
+            waked[i[d == k], j[d == k]] = True
+            np.testing.assert_array_equal(waked, wakes['waked'][k] & (geometry['dist'] <= 700.))
+        np.testing.assert_allclose(sparse_wakes['downstream'].data, wakes['downstream'][d, i, j])
+
+        # Sectors of 180 degrees or more, where the half width has no finite tangent
+        for sector_width in [180., 270., 360.]:
+            wakes = layoutFunctions.wake_matrices(self.turbineLoc, directions, sector_width=sector_width)
+            for k, direction in enumerate(directions):
+                sector = layoutFunctions.neighbor_geometry(self.turbineLoc, 1e4, wind_direction=direction,
+                                                           sector_width=sector_width)
+                np.testing.assert_array_equal(wakes['waked'][k], sector['dist'].toarray() > 0)
+
+    def test_set_direction(self):
+        """Rotating the farm by 90 degrees CCW takes x to y."""
+        rotated = layoutFunctions.set_direction(self.turbineLoc, 90.)
+        np.testing.assert_allclose(rotated.y, self.turbineLoc.x, atol=1e-9)
+        np.testing.assert_allclose(rotated.x, -self.turbineLoc.y, atol=1e-9)
+        self.assertEqual(list(rotated.index), list(self.turbineLoc.index))
+
+    def test_visualize_layout(self):
+        """Wake lines are drawn for the pairs going in negative x within limit_dist."""
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots()
+        layoutFunctions.visualize_layout(self.turbineLoc, 126., ax=ax, show_wake_lines=True, limit_dist=600.)
+        pairs = layoutFunctions.pair_table(self.turbineLoc)
+        x = self.turbineLoc.x
+        expected = ((x.loc[pairs.T2].to_numpy() <= x.loc[pairs.T1].to_numpy()) & (pairs.Dist <= 600.)).sum()
+        self.assertEqual(len(ax.lines), expected)
+        plt.close(fig)
+
+    def test_make_turbine_arrays(self):
+        """Turbine array files read back with get_turbine_coord, with per turbine and per case properties."""
+        from wind_tools.sowfa.read_sowfa_df import get_turbine_coord
+
+        layouts = [self.turbineLoc.assign(NacYaw=[270., 260., 250., 270., 280., 290.]),
+                   layoutFunctions.set_direction(self.turbineLoc, 30.).round(1)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            case_folders = [os.path.join(tmp_dir, 'case_%d' % i) for i in range(len(layouts))]
+            for max_workers in [None, 2]:
+                filenames = layoutFunctions.make_turbine_arrays(case_folders, layouts, properties={'epsilon': 5.},
+                                                                max_workers=max_workers)
+                for case_folder, layout in zip(case_folders, layouts):
+                    turbine_loc = get_turbine_coord(case_folder)
+                    np.testing.assert_allclose(turbine_loc.x, layout.x)
+                    np.testing.assert_allclose(turbine_loc.y, layout.y)
+
+            with open(filenames[0]) as f:
+                text = f.read()
+            self.assertEqual(text.count('    epsilon              5.0;\n'), 6)
+            self.assertIn('turbine1\n{\n    turbineType         "NREL5MWRef";\n', text)
+            self.assertIn('    NacYaw               260.0;\n', text)
+
+            with self.assertRaises(ValueError):
+                layoutFunctions.make_turbine_arrays(case_folders[:1], layouts)
+
+        with self.assertRaises(ValueError):
+            layoutFunctions.render_turbine_array([0., 1.], [0., 1.], properties={'Pitch': [0., 1., 2.]})
+
+        # Per turbine turbineType, written before the baseLocation
+        text = layoutFunctions.render_turbine_array([0., 10.], [5., 6.], properties={'turbineType': ['A', 'B']})
+        self.assertIn('turbine1\n{\n    turbineType         "B";\n    baseLocation        (10.0 6.0 0.0);\n', text)
+
+        with self.assertRaises(ValueError):
+            layoutFunctions.render_turbine_array([0., 1.], [0., 1.], properties={'baseLocation': [(0., 0.), (1., 1.)]})
+
+        # OpenFOAM switches are written in lower case, as scalars or per turbine
+        text = layoutFunctions.render_turbine_array([0., 10.], [5., 6.],
+                                                    properties={'includeNacelle': True, 'includeTower': np.array([True, False])})
+        self.assertEqual(text.count('    includeNacelle       true;\n'), 2)
+        self.assertIn('    includeTower         true;\n', text)
+        self.assertIn('    includeTower         false;\n', text)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wind_tools.slices` package."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from wind_tools.slices import readVTK
+
+
+def slice_geometry(nx, ny):
+    """Points and (count, i_0, .. i_3) quads of an nx by ny slice"""
+    x, y = np.meshgrid(np.arange(nx + 1) * 10., np.arange(ny + 1) * 10.)
+    points = np.column_stack([x.ravel(), y.ravel(), np.full(x.size, 90.)])
+    i, j = np.meshgrid(np.arange(nx), np.arange(ny))
+    corner = (j * (nx + 1) + i).ravel()
+    polygons = np.column_stack([np.full(nx * ny, 4), corner, corner + 1, corner + nx + 2, corner + nx + 1])
+    return points, polygons
+
+
+def write_vtk(filename, u, nx=4, ny=3):
+    """Write an ASCII POLYDATA slice of nx by ny quads with cell data u"""
+    points, polygons = slice_geometry(nx, ny)
+
+    with open(filename, 'w') as f:
+        f.write('# vtk DataFile Version 2.0\nsampleSurface\nASCII\nDATASET POLYDATA\n')
+        f.write('POINTS %d float\n' % len(points))
+        np.savetxt(f, points, fmt='%g')
+        f.write('POLYGONS %d %d\n' % (len(polygons), polygons.size))
+        np.savetxt(f, polygons, fmt='%d')
+        f.write('\nCELL_DATA %d\nFIELD attributes 1\n' % len(polygons))
+        f.write('U 3 %d float\n' % len(polygons))
+        np.savetxt(f, u, fmt='%.6f')
+
+
+def write_vtk_binary(filename, u, nx=4, ny=3):
+    """Write a BINARY (big-endian) POLYDATA slice of nx by ny quads with cell data u"""
+    points, polygons = slice_geometry(nx, ny)
+
+    with open(filename, 'wb') as f:
+        f.write(b'# vtk DataFile Version 2.0\nsampleSurface\nBINARY\nDATASET POLYDATA\n')
+        f.write(b'POINTS %d float\n' % len(points) + points.astype('>f4').tobytes() + b'\n')
+        f.write(b'POLYGONS %d %d\n' % (len(polygons), polygons.size) + polygons.astype('>i4').tobytes() + b'\n')
+        f.write(b'CELL_DATA %d\nFIELD attributes 2\n' % len(polygons))
+        f.write(b'U 3 %d double\n' % len(polygons) + u.astype('>f8').tobytes() + b'\n')
+        f.write(b'p 1 %d float\n' % len(polygons) + u[:, 0].astype('>f4').tobytes() + b'\n')
+
+
+def write_vtp(filename, u, nx=4, ny=3):
+    """Write an XML PolyData slice of nx by ny quads with cell data u as raw appended data"""
+    points, polygons = slice_geometry(nx, ny)
+    arrays = [('CellData', 'U', 3, u.astype('<f8')),
+              ('CellData', 'p', 1, u[:, 0].astype('<f4')),
+              ('Points', 'Points', 3, points.astype('<f4')),
+              ('Polys', 'connectivity', 1, polygons[:, 1:].astype('<i8')),
+              ('Polys', 'offsets', 1, np.cumsum(polygons[:, 0]).astype('<i8'))]
+    types = {'f8': 'Float64', 'f4': 'Float32', 'i8': 'Int64'}
+
+    header = ''
+    data = b''
+    for i, (section, name, components, values) in enumerate(arrays):
+        if i == 0 or arrays[i - 1][0] != section:
+            header += '<%s>\n' % section
+        header += '<DataArray type="%s" Name="%s" NumberOfComponents="%d" format="appended" offset="%d"/>\n' % (
+            types[values.dtype.str[1:]], name, components, len(data))
+        if i == len(arrays) - 1 or arrays[i + 1][0] != section:
+            header += '</%s>\n' % section
+        data += np.uint64(values.nbytes).tobytes() + values.tobytes()
+
+    with open(filename, 'wb') as f:
+        f.write(b'<?xml version="1.0"?>\n<VTKFile type="PolyData" version="1.0" byte_order="LittleEndian" header_type="UInt64">\n')
+        f.write(('<PolyData><Piece NumberOfPoints="%d" NumberOfPolys="%d">\n' % (len(points), len(polygons))).encode())
+        f.write(header.encode() + b'</Piece></PolyData>\n<AppendedData encoding="raw">\n_' + data)
+        f.write(b'\n</AppendedData>\n</VTKFile>\n')
+
+
+class TestReadVTK(unittest.TestCase):
+    """Tests for `wind_tools.slices.readVTK`."""
+
+    def setUp(self):
+        """Write a few time folders of the same slice."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.time_folders = ['100', '110', '120', '130']
+        self.u = np.round(np.random.uniform(0., 10., (len(self.time_folders), 12, 3)), 6)
+        for t, u in zip(self.time_folders, self.u):
+            os.makedirs(os.path.join(self.tmp_dir.name, t))
+            write_vtk(os.path.join(self.tmp_dir.name, t, 'U_slice_1.vtk'), u)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_vtk(self):
+        """Cell centers are the polygon means and the cell data is read back."""
+        dataType, cellCenters, cellData, pointsXYZ = readVTK.readVTK(
+            os.path.join(self.tmp_dir.name, '100', 'U_slice_1.vtk'))
+        self.assertEqual(dataType, 'U')
+        np.testing.assert_allclose(cellCenters[0], [5., 5., 90.])
+        np.testing.assert_allclose(cellCenters[-1], [35., 25., 90.])
+        np.testing.assert_allclose(cellData, self.u[0])
+
+    def test_read_binary_and_vtp(self):
+        """BINARY legacy and .vtp slices give the same result as the ASCII slice."""
+        for write_file, name in [(write_vtk_binary, 'U_slice_1.vtk'), (write_vtp, 'U_slice_1.vtp')]:
+            filename = os.path.join(self.tmp_dir.name, 'binary', name)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            write_file(filename, self.u[0])
+            dataType, cellCenters, cellData, pointsXYZ = readVTK.readVTK(filename)
+            np.testing.assert_allclose(cellCenters[-1], [35., 25., 90.])
+            np.testing.assert_allclose(cellData[0], self.u[0])
+            self.assertEqual(dataType[0], 'U')
+
+            np.testing.assert_allclose(cellData[1].ravel(), self.u[0, :, 0], rtol=1e-6)
+
+            dataType, cellData, offset = readVTK.readVTKCellData(filename)
+            self.assertEqual(dataType, ['U', 'p'])
+            np.testing.assert_allclose(cellData[0], self.u[0])
+
+    def test_interpolant(self):
+        """Interpolants match griddata, sample their own attribute and do inverse distance weighting."""
+        from scipy.interpolate import griddata
+        filename = os.path.join(self.tmp_dir.name, '100', 'U_slice_2.vtk')
+        write_vtk_binary(filename, self.u[0])
+        dataType, cellCenters, cellData, pointsXYZ = readVTK.readVTK(filename)
+        dataType, interpolants, pointsXYZ = readVTK.readVTK(filename, True, workers=-1)
+        self.assertIs(interpolants[0].tree, interpolants[1].tree)
+
+        xMesh, yMesh = np.meshgrid(np.linspace(0., 40., 9), np.linspace(0., 30., 7))
+        samplePoints = (xMesh.flatten(), yMesh.flatten(), np.full(xMesh.size, 90.))
+        for interpolant, cd in zip(interpolants, cellData):
+            np.testing.assert_allclose(interpolant(samplePoints), griddata(cellCenters, cd, samplePoints, method='nearest'))
+
+        # Inverse distance weighting returns the cell value on a cell center and the mean half way between two cells
+        interpolant = readVTK.SliceInterpolant(cellCenters, cellData[0], k=2)
+        np.testing.assert_allclose(interpolant(cellCenters), cellData[0])
+        np.testing.assert_allclose(interpolant(np.array([10., 5., 90.])), cellData[0][:2].mean(axis=0))
+
+    def test_average_vtks(self):
+        """Streaming mean and variance match numpy, in serial and in parallel."""
+        for maxWorkers in [None, 2]:
+            dataType, cellCenters, cellDataMean, pointsXYZ, cellDataVariance = readVTK.averageVTKs(
+                self.tmp_dir.name, self.time_folders, createInterpolant=False,
+                maxWorkers=maxWorkers, returnVariance=True)
+            self.assertEqual(cellCenters.shape, (12, 2))
+            np.testing.assert_allclose(cellDataMean, self.u.mean(axis=0))
+            np.testing.assert_allclose(cellDataVariance, self.u.var(axis=0), atol=1e-12)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `wind_tools.sowfa` package."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from wind_tools import cli
+from wind_tools.sowfa import read_sowfa_df
+
+
+def write_turbine_output(folder_name, channels, num_turbines=3, num_steps=5, start_time=20000., dt=0.5):
+    """Write turbineOutput channel files, channels is a dict of channel name -> (num_steps, num_turbines) array"""
+    os.makedirs(folder_name)
+    time = start_time + dt * np.arange(1, num_steps + 1)
+    for chan, values in channels.items():
+        with open(os.path.join(folder_name, chan), 'w') as f:
+            f.write('#Turbine    Time(s)    dt(s)    %s\n' % chan)
+            for i in range(num_steps):
+                for turbine in range(num_turbines):
+                    f.write('%d %.4f %g %.6f\n' % (turbine, time[i], dt, values[i, turbine]))
+
+
+class TestReadSowfaDf(unittest.TestCase):
+    """Tests for `wind_tools.sowfa.read_sowfa_df`."""
+
+    def setUp(self):
+        """Write the turbineOutput folders of two cases."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cases = ['case_a', 'case_b']
+        self.channels = dict()
+        for case in self.cases:
+            self.channels[case] = dict((chan, np.round(np.random.uniform(0., 1000., (5, 3)), 6))
+                                       for chan in ['powerGenerator', 'nacYaw', 'rotSpeed'])
+            write_turbine_output(os.path.join(self.tmp_dir.name, case, 'turbineOutput', '20000'), self.channels[case])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_sowfa_df(self):
+        """Channels are lined up with the turbine and time of the first file, for both engines."""
+        folder_name = os.path.join(self.tmp_dir.name, 'case_a', 'turbineOutput', '20000')
+        engines = ['c', None] + (['pyarrow'] if read_sowfa_df._has_pyarrow() else [])
+        for engine in engines:
+            df = read_sowfa_df.read_sowfa_df(folder_name, engine=engine, cache=False)
+            self.assertEqual(len(df), 15)
+            self.assertEqual(list(df.columns[:2]), ['time', 'turbine'])
+            np.testing.assert_allclose(df.time[::3], np.arange(5) * 0.5)
+            np.testing.assert_array_equal(df.turbine[:3], [0, 1, 2])
+            for chan, values in self.channels['case_a'].items():
+                np.testing.assert_allclose(df[chan], values.ravel())
+
+    def test_partial_last_line(self):
+        """The half-written last line of a running case is read as missing values by default."""
+        folder_name = os.path.join(self.tmp_dir.name, 'case_a', 'turbineOutput', '20000')
+        for chan in self.channels['case_a']:
+            with open(os.path.join(folder_name, chan), 'a') as f:
+                f.write('0 102.5 0.5')
+
+        df = read_sowfa_df.read_sowfa_df(folder_name, cache=False)
+        self.assertEqual(len(df), 16)
+        for chan, values in self.channels['case_a'].items():
+            np.testing.assert_allclose(df[chan][:15], values.ravel())
+            self.assertTrue(np.isnan(df[chan].iloc[15]))
+
+    def test_load_cases(self):
+        """Cases are stacked in order with a case column."""
+        df = read_sowfa_df.load_cases(self.cases, case_folder=self.tmp_dir.name, case_names=['a', 'b'])
+        self.assertEqual(len(df), 30)
+        self.assertEqual(list(df.case.unique()), ['a', 'b'])
+        np.testing.assert_allclose(df[df.case == 'b'].nacYaw, self.channels['case_b']['nacYaw'].ravel())
+
+    def test_load_cases_parallel(self):
+        """A pool keeps the case order and a failing case is reported rather than raised."""
+        done = list()
+        df, report = read_sowfa_df.load_cases(self.cases + ['missing'], case_folder=self.tmp_dir.name, max_workers=2,
+                                              progress=lambda num_done, num_cases, case: done.append(case),
+                                              return_report=True)
+        self.assertEqual(list(df.case.unique()), self.cases)
+        np.testing.assert_allclose(df[df.case == 'case_a'].rotSpeed, self.channels['case_a']['rotSpeed'].ravel())
+        self.assertEqual(sorted(done), sorted(self.cases + ['missing']))
+        self.assertEqual(list(report.rows), [15, 15, 0])
+        self.assertTrue(report.error.isna()[0])
+        self.assertIn('FileNotFoundError', report.error[2])
+
+    def test_cache(self):
+        """The CLI warms the cache, channels are read back from it and a changed file refreshes it."""
+        from click.testing import CliRunner
+        cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+        result = CliRunner().invoke(cli.main, ['warm-cache', self.tmp_dir.name, '--cache-dir', cache_dir])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Cached 2 of 2', result.output)
+        self.assertEqual(len([f for f in os.listdir(cache_dir) if f.endswith('.parquet')]), 2)
+
+        folder_name = os.path.join(self.tmp_dir.name, 'case_a', 'turbineOutput', '20000')
+        df = read_sowfa_df.read_sowfa_df(folder_name, channels=['nacYaw'], cache_dir=cache_dir)
+        self.assertEqual(list(df.columns), ['time', 'turbine', 'nacYaw'])
+        np.testing.assert_allclose(df.nacYaw, self.channels['case_a']['nacYaw'].ravel())
+
+        channels = dict(self.channels['case_a'], nacYaw=self.channels['case_a']['nacYaw'] + 1.)
+        os.rename(folder_name, folder_name + '_old')
+        write_turbine_output(folder_name, channels)
+        df = read_sowfa_df.read_sowfa_df(folder_name, channels=['nacYaw'], cache_dir=cache_dir)
+        np.testing.assert_allclose(df.nacYaw, channels['nacYaw'].ravel())
+
+    def test_time_window(self):
+        """Time windows and turbine subsets match filtering the full frame, parsed or from the cache."""
+        folder_name = os.path.join(self.tmp_dir.name, 'case_a', 'turbineOutput', '20000')
+        full = read_sowfa_df.read_sowfa_df(folder_name, cache=False)
+        expected = full[(full.time >= 1.) & (full.time <= 2.) & full.turbine.isin([0, 2])].reset_index(drop=True)
+        expected = expected[['time', 'turbine', 'powerGenerator', 'nacYaw']]
+
+        for engine, cache in [('c', False), (None, False), (None, True), (None, True)]:
+            df = read_sowfa_df.read_sowfa_df(folder_name, channels=['powerGenerator', 'nacYaw'], engine=engine,
+                                             cache=cache, start_time=1., end_time=2., turbines=[0, 2])
+            self.assertEqual(len(df), 6)
+            np.testing.assert_allclose(df.to_numpy(), expected.to_numpy())
+            if cache:
+                # Fill the cache so the next read is filtered from it
+                read_sowfa_df.read_sowfa_df(folder_name)
+
+        df = read_sowfa_df.read_sowfa_df(folder_name, cache=False, start_time=10.)
+        self.assertEqual(len(df), 0)
+        df = read_sowfa_df.read_sowfa_df(folder_name, cache=False, end_time=0.)
+        np.testing.assert_array_equal(df.turbine, [0, 1, 2])
+
+    def test_compact(self):
+        """Compact frames use small dtypes and a sorted index, and the analysis functions still work on them."""
+        from wind_tools.sowfa import sowfa_analysis
+        df = read_sowfa_df.load_cases(self.cases, case_folder=self.tmp_dir.name)
+        df_compact = read_sowfa_df.load_cases(self.cases, case_folder=self.tmp_dir.name, compact=True)
+        self.assertEqual(list(df_compact.index.names), ['case', 'turbine', 'time'])
+        self.assertTrue(df_compact.index.is_monotonic_increasing)
+        self.assertEqual(df_compact.powerGenerator.dtype, np.float32)
+        self.assertEqual(df_compact.index.levels[1].dtype, np.int8)
+        self.assertLess(df_compact.memory_usage(deep=True).sum(), df.memory_usage(deep=True).sum())
+
+        expected = sowfa_analysis.get_average_channel(df, 'nacYaw', 0.)
+        result = sowfa_analysis.get_average_channel(df_compact, 'nacYaw', 0.)
+        np.testing.assert_allclose(result.nacYaw, expected.nacYaw, rtol=1e-6)
+        expected = sowfa_analysis.get_total_frame(df)
+        result = sowfa_analysis.get_total_frame(df_compact)
+        np.testing.assert_allclose(result.powerGenerator, expected.powerGenerator, rtol=1e-6)
+
+    def test_tail(self):
+        """Tailing a growing folder takes only complete lines, resumes from its buffer and matches a full read."""
+        from click.testing import CliRunner
+        from wind_tools.sowfa.tail_sowfa_df import TurbineOutputTail
+        folder_name = os.path.join(self.tmp_dir.name, 'case_a', 'turbineOutput', '20000')
+        running = os.path.join(self.tmp_dir.name, 'running')
+        os.makedirs(running)
+        contents = dict()
+        for chan in ['powerGenerator', 'nacYaw']:
+            with open(os.path.join(folder_name, chan), 'rb') as f:
+                contents[chan] = f.read()
+
+        # Header and 13 rows of powerGenerator, 10 rows and part of a line of nacYaw
+        buffer_dir = os.path.join(self.tmp_dir.name, 'buffer')
+        tail = TurbineOutputTail(running, channels=['powerGenerator', 'nacYaw'], buffer_dir=buffer_dir)
+        for chan, num_lines in [('powerGenerator', 14), ('nacYaw', 11)]:
+            lines = contents[chan].splitlines(True)
+            with open(os.path.join(running, chan), 'wb') as f:
+                f.write(b''.join(lines[:num_lines]) + lines[num_lines][:5])
+        self.assertEqual(len(tail.update()), 10)
+
+        # Write the rest, a new tail on the same buffer picks up from the offsets
+        for chan in ['powerGenerator', 'nacYaw']:
+            with open(os.path.join(running, chan), 'wb') as f:
+                f.write(contents[chan])
+        tail = TurbineOutputTail(running, buffer_dir=buffer_dir)
+        self.assertEqual(len(tail.update()), 5)
+        self.assertEqual(len(tail.update()), 0)
+
+        expected = read_sowfa_df.read_sowfa_df(folder_name, channels=['powerGenerator', 'nacYaw'], cache=False)
+        np.testing.assert_allclose(tail.read_buffer().to_numpy(), expected.to_numpy())
+
+        # In memory, updated line by line, with and without a time window
+        for keep_time in [None, 1.]:
+            for chan in ['powerGenerator', 'nacYaw']:
+                with open(os.path.join(running, chan), 'wb') as f:
+                    f.write(contents[chan].splitlines(True)[0])
+            tail = TurbineOutputTail(running, channels=['powerGenerator', 'nacYaw'], keep_time=keep_time)
+            for num_lines in range(2, 17):
+                for chan in ['powerGenerator', 'nacYaw']:
+                    with open(os.path.join(running, chan), 'wb') as f:
+                        f.write(b''.join(contents[chan].splitlines(True)[:num_lines]))
+                tail.update()
+            kept = expected if keep_time is None else expected[expected.time >= expected.time.iloc[-1] - 1.]
+            np.testing.assert_allclose(tail.df.to_numpy(), kept.to_numpy())
+
+        result = CliRunner().invoke(cli.main, ['watch', running, '--count', '1'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('total', result.output)
+
+
+def write_sectional(filename, data, start_time=20000., dt=0.5):
+    """Write a sectional actuator line file of data (time, turbine, blade, node), blank line after each time step"""
+    with open(filename, 'w') as f:
+        f.write('#Turbine    Blade    Time(s)    dt(s)    lift\n')
+        for i, step in enumerate(data):
+            for turbine, blades in enumerate(step):
+                for blade, values in enumerate(blades):
+                    f.write('%d %d %.4f %g %s\n' % (turbine, blade, start_time + i * dt, dt,
+                                                   ' '.join('%.6f' % v for v in values)))
+            f.write('\n')
+
+
+class TestReadALSectional(unittest.TestCase):
+    """Tests for `wind_tools.sowfa.read_AL_sectional`."""
+
+    def test_read_AL_sectional(self):
+        """The (time, turbine, blade, node) array is read back, parsed or memory-mapped, in small blocks too."""
+        from wind_tools.sowfa import read_AL_sectional
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data = np.round(np.random.uniform(0., 100., (7, 2, 3, 5)), 6)
+            write_sectional(os.path.join(tmp_dir, 'lift'), data)
+
+            # A running case, the last time step is incomplete
+            with open(os.path.join(tmp_dir, 'lift'), 'a') as f:
+                f.write('0 0 20003.5000 0.5 1.0 2.0')
+
+            for memmap in [False, True, True]:
+                nTurbine, nBlade, time, dt, nVal, result = read_AL_sectional.read_AL_sectional(tmp_dir, 'lift', memmap=memmap)
+                self.assertEqual((nTurbine, nBlade, nVal, dt), (2, 3, 5, 0.5))
+                np.testing.assert_allclose(time, np.arange(7) * 0.5)
+                np.testing.assert_allclose(result, data)
+
+            layout = read_AL_sectional._read_layout(os.path.join(tmp_dir, 'lift'))
+            blocks = list(read_AL_sectional._iter_rows(os.path.join(tmp_dir, 'lift'), layout, blockBytes=100))
+            np.testing.assert_allclose(np.concatenate(blocks)[:, 4:].reshape(data.shape), data)
+
+    def test_AL_sectional_stats(self):
+        """Streaming statistics over small blocks match numpy, the azimuth bins follow each blade."""
+        from wind_tools.sowfa import read_AL_sectional
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data = np.random.uniform(0., 100., (12, 2, 3, 4))
+            write_sectional(os.path.join(tmp_dir, 'lift'), data)
+            data = np.loadtxt(os.path.join(tmp_dir, 'lift'), skiprows=1)[:, 4:].reshape(data.shape)
+
+            # Rotor azimuth 0, 10, .. for turbine 0 and 5, 15, .. for turbine 1, written by time
+            azimuth = np.mod(np.arange(12)[:, None] * 10. + [0., 5.], 360.)
+            with open(os.path.join(tmp_dir, 'azimuth'), 'w') as f:
+                f.write('#Turbine    Time(s)    dt(s)    azimuth(degrees)\n')
+                for i in range(12):
+                    for t in range(2):
+                        f.write('%d %.4f 0.5 %g\n' % (t, 20000. + i * 0.5, azimuth[i, t]))
+
+            blocks = list(read_AL_sectional.iter_AL_sectional(tmp_dir, 'lift', blockBytes=500))
+            self.assertGreater(len(blocks), 2)
+            np.testing.assert_allclose(np.concatenate([d for time, d in blocks]), data)
+            np.testing.assert_allclose(np.concatenate([time for time, d in blocks]), np.arange(12) * 0.5)
+
+            for memmap in [False, True]:
+                stats = read_AL_sectional.AL_sectional_stats(tmp_dir, 'lift', nBins=3, blockBytes=500, memmap=memmap)
+                self.assertEqual(stats['count'], 12)
+                np.testing.assert_allclose(stats['mean'], data.mean(axis=0))
+                np.testing.assert_allclose(stats['variance'], data.var(axis=0))
+                np.testing.assert_allclose(stats['min'], data.min(axis=0))
+                np.testing.assert_allclose(stats['max'], data.max(axis=0))
+
+                # With 3 blades and 3 bins, each bin holds exactly one blade at every step
+                bins = (np.mod(azimuth[:, :, None] + [0., 120., 240.], 360.) // 120).astype(int)
+                expected = np.zeros((2, 3, 4))
+                for t in range(2):
+                    for b in range(3):
+                        expected[t, b] = data[:, t][bins[:, t] == b].mean(axis=0)
+                np.testing.assert_allclose(stats['azimuthMean'], expected)
+                np.testing.assert_array_equal(stats['azimuthCount'], np.full((2, 3), 12))
+
+
+class TestReadFoamDict(unittest.TestCase):
+    """Tests for `wind_tools.sowfa.read_foam_dict`."""
+
+    def test_sowfa_case(self):
+        """A SOWFA style case reads back typed, with its setUp included, and is re-read once it changes."""
+        from wind_tools.layout.layoutFunctions import make_turbine_array
+        from wind_tools.sowfa import read_foam_dict
+        from wind_tools.sowfa.readControlDict import readControlDict
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            case_folder = os.path.join(tmp_dir, 'case')
+            os.makedirs(os.path.join(case_folder, 'system'))
+            os.makedirs(os.path.join(case_folder, 'constant', 'turbineProperties'))
+            with open(os.path.join(case_folder, 'setUp'), 'w') as f:
+                f.write('startTime 20000;  // start of the precursor\nendTime 21000;\n')
+            with open(os.path.join(case_folder, 'system', 'controlDict'), 'w') as f:
+                f.write('/* controlDict */\n#include "../setUp"\n\nstartFrom startTime;\nstartTime $startTime;\n'
+                        'endTime $endTime;\ndeltaT 0.02;\nwriteControl "adjustableRunTime";\nadjustTimeStep no;\n'
+                        'functions\n{\n    probes\n    {\n        fields (U p);\n'
+                        '        probeLocations 2((0 0 90) (630 0 90));\n    }\n}\n')
+            with open(os.path.join(case_folder, 'constant', 'turbineProperties', 'NREL5MWRef'), 'w') as f:
+                f.write('NumBl 3;\nTipRad 63.0;\nAirfoils\n(\n    "Cylinder1"\n    "DU40_A17"\n);\n'
+                        'BladeData\n(\n//  radius  c  twist  airfoil\n    (2.8667 3.542 13.308 0)\n'
+                        '    (5.6000 3.854 13.308 1)\n);\n')
+            make_turbine_array([0., 630.5, 1261.], [10., -20.25, 30.],
+                               os.path.join(case_folder, 'constant', 'turbineArrayProperties'))
+
+            control_file = os.path.join(case_folder, 'system', 'controlDict')
+            control_dict = read_foam_dict.read_foam_dict(control_file)
+            self.assertEqual(control_dict['startTime'], 20000)
+            self.assertEqual(control_dict['endTime'], 21000)
+            self.assertIs(control_dict['adjustTimeStep'], False)
+            self.assertEqual(control_dict['writeControl'], 'adjustableRunTime')
+            self.assertEqual(control_dict['functions']['probes']['fields'], ['U', 'p'])
+            self.assertEqual(control_dict['functions']['probes']['probeLocations'], [[0, 0, 90], [630, 0, 90]])
+            self.assertEqual(readControlDict(control_file), {'start time': 20000.})
+
+            turbine_loc = read_sowfa_df.get_turbine_coord(case_folder)
+            np.testing.assert_allclose(turbine_loc.x, [0., 630.5, 1261.])
+            np.testing.assert_allclose(turbine_loc.y, [10., -20.2, 30.])
+            turbine_properties = read_sowfa_df.get_turbine_properties(case_folder)
+            self.assertEqual(list(turbine_properties), ['NREL5MWRef'])
+            self.assertEqual(turbine_properties['NREL5MWRef']['Airfoils'], ['Cylinder1', 'DU40_A17'])
+            self.assertEqual(turbine_properties['NREL5MWRef']['BladeData'][1], [5.6, 3.854, 13.308, 1])
+
+            # Changing the included file is seen, changing a returned dict is not
+            control_dict['deltaT'] = 1.
+            with open(os.path.join(case_folder, 'setUp'), 'w') as f:
+                f.write('startTime 20500;\nendTime 21000;\n')
+            control_dict = read_foam_dict.read_foam_dict(control_file)
+            self.assertEqual(control_dict['startTime'], 20500)
+            self.assertEqual(control_dict['deltaT'], 0.02)
+
+    def test_read_foam_entries(self):
+        """Entries of a keyword at any depth, in file order, re-read when the file changes."""
+        from wind_tools.layout.layoutFunctions import render_turbine_array
+        from wind_tools.sowfa import read_foam_dict
+
+        text = render_turbine_array([0., 630.5], [10., -20.25], properties={'turbineType': ['A', 'B']})
+        text += ('\nstartFrom startTime;  // not a startTime entry\nstartTime 20000;\n/* startTime 1; */\n'
+                 'url "http://a/*b";\nlist 2(1 2);\nempty;\n')
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'dict')
+            with open(filename, 'w') as f:
+                f.write(text)
+            for memoize in [True, False]:
+                self.assertEqual(read_foam_dict.read_foam_entries(filename, 'baseLocation', memoize),
+                                 [[0., 10., 0.], [630.5, -20.2, 0.]])
+                self.assertEqual(read_foam_dict.read_foam_entries(filename, 'turbineType', memoize), ['A', 'B'])
+                self.assertEqual(read_foam_dict.read_foam_entries(filename, 'startTime', memoize), [20000])
+                self.assertEqual(read_foam_dict.read_foam_entries(filename, 'url', memoize), ['http://a/*b'])
+                self.assertEqual(read_foam_dict.read_foam_entries(filename, 'list', memoize), [[1, 2]])
+                self.assertEqual(read_foam_dict.read_foam_entries(filename, 'empty', memoize), [None])
+                self.assertEqual(read_foam_dict.read_foam_entries(filename, 'missing', memoize), [])
+
+            # The memoized values are copied
+            read_foam_dict.read_foam_entries(filename, 'baseLocation')[0].append(1.)
+            self.assertEqual(read_foam_dict.read_foam_entries(filename, 'baseLocation')[0], [0., 10., 0.])
+
+            # Duplicates, sub-dictionaries of that name and variables
+            with open(filename, 'w') as f:
+                f.write('a 1;\nturbine0\n{\n    b $a;\n}\nturbine1\n{\n    turbine0 2;\n    b (b 3);\n}\nb 4;\n')
+            self.assertEqual(read_foam_dict.read_foam_entries(filename, 'b'), [1, ['b', 3], 4])
+            self.assertEqual(read_foam_dict.read_foam_entries(filename, 'turbine0'), [{'b': 1}, 2])
+            self.assertEqual(read_foam_dict.read_foam_entries(filename, 'startTime'), [])
+
+    def test_scoped_variables(self):
+        """${...}, dotted, parent and top level variables resolve, unsupported ones raise."""
+        from wind_tools.sowfa import read_foam_dict
+
+        foam_dict = read_foam_dict.parse_foam_dict(
+            'a { b 1; c { d 2; e $..b; f $:a.b; } }\nf ${a.b};\ng $:a.c.d;\nh { $:a.c; }\ni $HOME;\n')
+        self.assertEqual(foam_dict['a']['c'], {'d': 2, 'e': 1, 'f': 1})
+        self.assertEqual(foam_dict['f'], 1)
+        self.assertEqual(foam_dict['g'], 2)
+        self.assertEqual(foam_dict['h'], {'d': 2, 'e': 1, 'f': 1})
+        self.assertEqual(foam_dict['i'], '$HOME')
+
+        for text in ['x ${a;', 'x $a.;', 'x $:a;', 'a { b 1; }\nx $a.c;', 'x $..a;', 'a 1;\n$a;', '$a;']:
+            with self.assertRaises(ValueError, msg=text):
+                read_foam_dict.parse_foam_dict(text)
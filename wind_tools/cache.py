@@ -0,0 +1,128 @@
+"""cache module
+
+On-disk caches of parsed simulation output. A cache file is keyed on the
+path, modification time and size of the source file it was made from, and
+is considered stale as soon as any of those change.
+
+By default the cache is written next to the source file. Pass cache_dir,
+or set the WIND_TOOLS_CACHE_DIR environment variable, to keep caches
+somewhere else (for example when the project storage is read-only).
+"""
+
+import os
+import json
+import hashlib
+import warnings
+
+CACHE_DIR_ENV = 'WIND_TOOLS_CACHE_DIR'
+
+
+def file_signature(filename):
+    """
+    Return the (path, mtime, size) key of a file as a dict
+    """
+
+    stat = os.stat(filename)
+
+    return {'path': os.path.abspath(filename),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size}
+
+
+def get_cache_file(filename, extension, cache_dir=None):
+    """
+    Return the name of the cache file for filename
+
+    input:
+        filename: the source file (or folder) being cached
+        extension: extension of the cache file, e.g. '.npy'
+        cache_dir: folder to hold the cache, if None use WIND_TOOLS_CACHE_DIR
+            and otherwise the folder of the source file
+
+    output:
+        cache_file: full path of the cache file
+    """
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+
+    base_name = os.path.basename(os.path.normpath(filename))
+
+    if cache_dir is None:
+        return os.path.join(os.path.dirname(os.path.abspath(filename)), '.%s.cache%s' % (base_name, extension))
+
+    # In a shared cache folder tell files of the same name apart by their path
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()[:16]
+
+    return os.path.join(cache_dir, '%s.%s.cache%s' % (base_name, path_hash, extension))
+
+
+def read_cache_meta(cache_file, signatures):
+    """
+    Return the metadata stored with a cache file, or None if the cache is missing or stale
+
+    input:
+        cache_file: full path of the cache file
+        signatures: dict of file_signature of every source file the cache depends on
+
+    output:
+        meta: dict of metadata saved with the cache, None if it can't be used
+    """
+
+    meta_file = cache_file + '.json'
+    if not (os.path.isfile(cache_file) and os.path.isfile(meta_file)):
+        return None
+
+    try:
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('signatures') != signatures:
+        return None
+
+    return meta
+
+
+def write_cache(cache_file, signatures, write_func, **meta):
+    """
+    Write a cache file and its metadata, warning rather than failing if it can't be written
+
+    input:
+        cache_file: full path of the cache file
+        signatures: dict of file_signature of every source file the cache depends on
+        write_func: function called with a temporary file name which writes the cache data
+        meta: any other json-able metadata to store with the cache
+
+    output:
+        written: True if the cache was written
+    """
+
+    meta_file = cache_file + '.json'
+    tmp_file = cache_file + '.tmp%d' % os.getpid()
+    meta['signatures'] = signatures
+
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # Drop the old metadata first so a half written cache is never trusted
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+
+        write_func(tmp_file)
+        os.replace(tmp_file, cache_file)
+
+        with open(tmp_file, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, meta_file)
+
+    except OSError as e:
+        warnings.warn('Could not write cache %s (%s), continuing without it' % (cache_file, e))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+
+    return True
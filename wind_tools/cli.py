@@ -5,12 +5,67 @@
 import click
 
 
-@click.command()
-def main(args=None):
+@click.group(invoke_without_command=True)
+@click.pass_context
+def main(ctx, args=None):
     """Console script for wind_tools."""
-    click.echo("Replace this message by putting your code into "
-               "wind_tools.cli.main")
-    click.echo("See click documentation at http://click.pocoo.org/")
+    if ctx.invoked_subcommand is None:
+        click.echo("Replace this message by putting your code into "
+                   "wind_tools.cli.main")
+        click.echo("See click documentation at http://click.pocoo.org/")
+
+
+@main.command('warm-cache')
+@click.argument('campaign_folder', type=click.Path(exists=True, file_okay=False))
+@click.option('--cache-dir', default=None, type=click.Path(file_okay=False),
+              help='Folder for the cache files, by default next to each turbineOutput folder.')
+@click.option('--workers', default=1, show_default=True, help='Number of folders to parse at once.')
+def warm_cache(campaign_folder, cache_dir, workers):
+    """Parse every turbineOutput folder of a campaign into the Parquet cache."""
+    from wind_tools.sowfa import read_sowfa_df
+
+    def progress(num_done, num_folders, folder_name):
+        click.echo('[%d/%d] %s' % (num_done, num_folders, folder_name))
+
+    report = read_sowfa_df.warm_cache(campaign_folder, cache_dir=cache_dir, max_workers=workers, progress=progress)
+
+    for row in report[report.error.notna()].itertuples():
+        click.echo('Could not cache %s (%s)' % (row.folder, row.error), err=True)
+    click.echo('Cached %d of %d turbineOutput folders in %.1f s'
+               % (report.error.isna().sum(), len(report), report.seconds.sum()))
+
+
+@main.command()
+@click.argument('case', type=click.Path(exists=True, file_okay=False))
+@click.option('--channel', default='powerGenerator', show_default=True, help='Channel to summarize.')
+@click.option('--window', default=600., show_default=True, help='Length in seconds of the rolling window.')
+@click.option('--interval', default=30., show_default=True, help='Seconds between updates.')
+@click.option('--count', default=0, help='Stop after this many updates, by default keep watching.')
+def watch(case, channel, window, interval, count):
+    """Follow the turbineOutput of a running CASE and print rolling stats."""
+    import time
+    from wind_tools.sowfa.tail_sowfa_df import TurbineOutputTail, find_case_output_folder
+
+    folder_name = find_case_output_folder(case)
+    tail = TurbineOutputTail(folder_name, channels=[channel], keep_time=window)
+
+    num_updates = 0
+    while True:
+        tail.update()
+        df = tail.df
+        if len(df) == 0:
+            click.echo('Waiting for %s in %s' % (channel, folder_name))
+        else:
+            stats = df.groupby('turbine')[channel].agg(['mean', 'std', 'min', 'max', 'last'])
+            total = df.groupby('time')[channel].sum()
+            stats.loc['total'] = [total.mean(), total.std(), total.min(), total.max(), total.iloc[-1]]
+            click.echo('%s, %.1f to %.1f s' % (channel, df.time.iloc[0], df.time.iloc[-1]))
+            click.echo(stats.to_string(float_format='%.4g'))
+
+        num_updates += 1
+        if count and num_updates >= count:
+            break
+        time.sleep(interval)
 
 
 if __name__ == "__main__":
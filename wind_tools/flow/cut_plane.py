@@ -14,28 +14,44 @@ specific language governing permissions and limitations under the License.
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.interpolate import griddata
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import Delaunay
 import seaborn as sns
 import copy
 import matplotlib
+from wind_tools.flow.flow_field import FlowField
+
+class _TriangulationMismatch(ValueError):
+    """ A triangulation handed to a plane was made for other sample points """
+
+_GRID_NAMES = ['x1_lin', 'x2_lin', 'x1_mesh', 'x2_mesh', 'x1_flat', 'x2_flat']
 
 class _CutPlane():
 
     def __init__(self, df_flow, x1='x', x2='y', x3_value=None,resolution=100,x1_center=0.0,x2_center=0.0, D=None, invert_x1=False,
-                        crop_x1 = None, crop_x2=None):
+                        crop_x1 = None, crop_x2=None, structured=None, triangulation=None):
         """Given a case folder, find the flow file
 
 
         input: 
-            df_flow: a flow dataframe from flow_field, can be SOWFA or FLORIS
+            df_flow: a flow dataframe from flow_field, can be SOWFA or FLORIS,
+                or a FlowField, in which case the plane is sliced directly from the grid
             x1: which axis to make x1
             x2: which axis to make x2
             x3_value: the value at which to cut-through the flow
-            resolution: resolution after interpolatoin
+            resolution: resolution after interpolatoin, None to keep the native grid of a rectilinear plane
             x1_, x2_center: new center points of the plane (for example to make turbine 0)
             D: Diamater of turbine (can be None to indicate plotting in meters)
             invert_x1: Flag if first dimension should be inverted, typical for cut-throughs but not horizontal
             crop_x1, _x2: If specified, a two element array by which to crop the incoming data (note that this is in non-inverted frame)
+            structured: For a plane sampled on a rectilinear grid (always the case for a FlowField, and for SOWFA
+                array output). By default (None) the values are taken as they are when the requested grid is
+                made of native grid points, and any other grid is interpolated by triangulation as before.
+                If True, other grids are resampled with a separable cubic spline instead, which is much faster
+                but gives slightly different values than the triangulated (griddata cubic) interpolation.
+                If False, always triangulate
+            triangulation: Delaunay triangulation of the (x1, x2) sample points of a scattered plane, for example the
+                .triangulation of an earlier plane with the same sample geometry, to skip re-triangulating
 
         output:
             flow_file: full path name of flow file"""
@@ -45,26 +61,59 @@ class _CutPlane():
         self.x2_name = x2
         self.x3_name = [x3 for x3 in ['x','y','z'] if x3 not in [x1,x2]][0]
 
-        # Find the nearest value in 3rd dimension
-        search_values = np.array(sorted(df_flow[self.x3_name].unique()))
-        nearest_idx = (np.abs(search_values-x3_value)).argmin()
-        nearest_value = search_values[nearest_idx]
-        print('Nearest value to in %s of %.2f is %.2f' % (self.x3_name, x3_value,nearest_value))
-        
-        # Get a sub-frame of only this 3rd dimension value
-        df_sub = df_flow[df_flow[self.x3_name]==nearest_value]
+        if isinstance(df_flow, FlowField):
+
+            # On a structured field the nearest plane is an index lookup and an array slice
+            nearest_value = df_flow.nearest_value(self.x3_name, x3_value)
+            print('Nearest value to in %s of %.2f is %.2f' % (self.x3_name, x3_value,nearest_value))
+            x1_lin, x2_lin, u_in, v_in, w_in = df_flow.get_plane(self.x3_name, x3_value)
+
+            # Keep x1 along the columns if the axes were requested in reverse order
+            if [x1, x2] != [a for a in ['x','y','z'] if a != self.x3_name]:
+                x1_lin, x2_lin = x2_lin, x1_lin
+                u_in, v_in, w_in = u_in.T, v_in.T, w_in.T
+            x1_in, x2_in = np.meshgrid(x1_lin, x2_lin)
+            grid = (x1_lin, x2_lin, [u_in, v_in, w_in])
+
+            # Store the relevent values
+            self.x1_in = x1_in.ravel()
+            self.x2_in = x2_in.ravel()
+            self.u_in = u_in.ravel()
+            self.v_in = v_in.ravel()
+            self.w_in = w_in.ravel()
+
+        else:
+
+            # Find the nearest value in 3rd dimension
+            search_values = np.array(sorted(df_flow[self.x3_name].unique()))
+            nearest_idx = (np.abs(search_values-x3_value)).argmin()
+            nearest_value = search_values[nearest_idx]
+            print('Nearest value to in %s of %.2f is %.2f' % (self.x3_name, x3_value,nearest_value))
+            
+            # Get a sub-frame of only this 3rd dimension value
+            df_sub = df_flow[df_flow[self.x3_name]==nearest_value]
+
+            # Store the relevent values
+            self.x1_in = df_sub[x1]
+            self.x2_in = df_sub[x2]
+            self.u_in = df_sub['u']
+            self.v_in = df_sub['v']
+            self.w_in = df_sub['w']
+
+            # Check if the frame is sampled on a rectilinear grid in this plane
+            grid = _rectilinear_grid(self.x1_in, self.x2_in, [self.u_in, self.v_in, self.w_in]) if structured is not False else None
 
         # Make sure cropping is valid
         if crop_x1:
-            if crop_x1[0] < min(df_sub[x1]):
+            if crop_x1[0] < np.min(self.x1_in):
                 raise Exception("Invalid x_1 minimum on cropping")
-            if crop_x1[1] > max(df_sub[x1]):
+            if crop_x1[1] > np.max(self.x1_in):
                 raise Exception("Invalid x_1 maximum on cropping")
 
         if crop_x2:
-            if crop_x2[0] < min(df_sub[x2]):
+            if crop_x2[0] < np.min(self.x2_in):
                 raise Exception("Invalid x_2 minimum on cropping")
-            if crop_x2[1] > max(df_sub[x2]):
+            if crop_x2[1] > np.max(self.x2_in):
                 raise Exception("Invalid x_2 maximum on cropping")
 
         # If cropping x1 do it now
@@ -73,35 +122,55 @@ class _CutPlane():
         # if crop_x2:
         #     df_sub = df_sub[(df_sub[x2] >= crop_x2[0]) & (df_sub[x2] <= crop_x2[1])]
 
-        # Store the relevent values
-        self.x1_in = df_sub[x1]
-        self.x2_in = df_sub[x2]
-        self.u_in = df_sub['u']
-        self.v_in = df_sub['v']
-        self.w_in = df_sub['w']
-
         # Save the desired resolution
         self.res = resolution
 
+        # Don't use a grid with missing values, leave those to the triangulated interpolation
+        if (structured is False) or (grid is not None and any([np.isnan(f).any() for f in grid[2]])):
+            grid = None
+        if resolution is None and grid is None:
+            raise ValueError("Can only keep the native resolution of a rectilinear plane")
+
         # Grid the data, if cropping available use that
-        if crop_x1:
-            # self.x1_lin = np.linspace(min(self.x1_in), max(self.x1_in), resolution)
-            self.x1_lin = np.linspace(crop_x1[0], crop_x1[1], resolution)
+        if resolution is None:
+            self.x1_lin = _crop_axis(grid[0], crop_x1)
+            self.x2_lin = _crop_axis(grid[1], crop_x2)
         else:
-            self.x1_lin = np.linspace(min(self.x1_in), max(self.x1_in), resolution)
-        if crop_x2:
-            # self.x2_lin = np.linspace(min(self.x2_in), max(self.x2_in), resolution)
-            self.x2_lin = np.linspace(crop_x2[0], crop_x2[1], resolution)
-        else:
-            self.x2_lin = np.linspace(min(self.x2_in), max(self.x2_in), resolution)
+            if crop_x1:
+                # self.x1_lin = np.linspace(min(self.x1_in), max(self.x1_in), resolution)
+                self.x1_lin = np.linspace(crop_x1[0], crop_x1[1], resolution)
+            else:
+                self.x1_lin = np.linspace(np.min(self.x1_in), np.max(self.x1_in), resolution)
+            if crop_x2:
+                # self.x2_lin = np.linspace(min(self.x2_in), max(self.x2_in), resolution)
+                self.x2_lin = np.linspace(crop_x2[0], crop_x2[1], resolution)
+            else:
+                self.x2_lin = np.linspace(np.min(self.x2_in), np.max(self.x2_in), resolution)
+
+        # Unless asked for the spline, only use the grid when it gives the values as they are (a plane with a
+        # single sample along an axis can't be triangulated either, and raises a clear error there)
+        if structured is None and grid is not None and min(len(grid[0]), len(grid[1])) > 1:
+            if _native_index(grid[0], self.x1_lin) is None or _native_index(grid[1], self.x2_lin) is None:
+                grid = None
         
         # Mesh and interpolate u, v and w
         # print(self.x1_lin)
         # print(sorted(self.x1_in))
         self.x1_mesh, self.x2_mesh = np.meshgrid(self.x1_lin, self.x2_lin)
-        self.u_mesh = griddata(np.column_stack([self.x1_in, self.x2_in]), self.u_in,(self.x1_mesh.flatten(), self.x2_mesh.flatten()), method='cubic')
-        self.v_mesh = griddata(np.column_stack([self.x1_in, self.x2_in]), self.v_in,(self.x1_mesh.flatten(), self.x2_mesh.flatten()), method='cubic')
-        self.w_mesh = griddata(np.column_stack([self.x1_in, self.x2_in]), self.w_in,(self.x1_mesh.flatten(), self.x2_mesh.flatten()), method='cubic')
+        self.triangulation = None
+        if grid is not None:
+            self.u_mesh, self.v_mesh, self.w_mesh = _interpolate_rectilinear(grid, self.x1_lin, self.x2_lin)
+        else:
+            # Triangulate once (or reuse) and interpolate u, v and w together (same as griddata cubic)
+            points = np.column_stack([self.x1_in, self.x2_in])
+            if triangulation is None:
+                triangulation = Delaunay(points)
+            elif not np.array_equal(triangulation.points, points):
+                raise _TriangulationMismatch("Triangulation doesn't match the sample points of this plane")
+            self.triangulation = triangulation
+            values = np.column_stack([self.u_in, self.v_in, self.w_in])
+            uvw_mesh = CloughTocher2DInterpolator(triangulation, values)(self.x1_mesh.flatten(), self.x2_mesh.flatten())
+            self.u_mesh, self.v_mesh, self.w_mesh = uvw_mesh.T.copy()
         
         # Save flat vectors
         self.x1_flat = self.x1_mesh.flatten()
@@ -134,30 +203,95 @@ class _CutPlane():
             self.plot_in_D = True
             self.D = D
 
+    def _get_row_sums(self):
+        """ Cumulative sums along x1 of u-cubed and of the count of non-NaN cells, per row of the mesh
+
+        Returns ((sums, counts), x1) with the columns ordered so that x1 is increasing. The sums are cheap
+        next to the per-cell masks they replace, so they are made on every call and always follow u_cubed
+        """
+        u_cubed = np.reshape(self.u_cubed, (len(self.x2_lin), len(self.x1_lin)))
+        x1_lin = self.x1_lin
+        if x1_lin[0] > x1_lin[-1]:
+            u_cubed = u_cubed[:, ::-1]
+            x1_lin = x1_lin[::-1]
+        valid = ~np.isnan(u_cubed)
+        zeros = np.zeros((len(self.x2_lin), 1))
+        sums = np.hstack([zeros, np.cumsum(np.where(valid, u_cubed, 0.), axis=1)])
+        counts = np.hstack([zeros, np.cumsum(valid, axis=1)])
+        return ((sums, counts), x1_lin)
+
+    def _check_same_mesh(self, other, operation):
+        """ Raise if other isn't meshed the same as self """
+        for name in ['x1_flat', 'x2_flat']:
+            mine, theirs = getattr(self, name), getattr(other, name)
+            if (mine is not theirs) and (not np.array_equal(mine, theirs)):
+                raise Exception("Can't %s because not meshed the same" % operation)
+
+    def _new_like(self, u_mesh, v_mesh, w_mesh, u_cubed):
+        """ Make a plane that shares the grid and settings of self, holding new u, v, w and u-cubed
+
+        No mesh arrays are duplicated: the new plane holds read-only views of the grid arrays of self
+        (x1/x2 lin, mesh and flat), which follow in-place changes to the grid of self. Writing to them
+        in place raises, assign a new array instead, for example plane.x1_mesh = plane.x1_mesh + 100.
+        """
+        ctResult = copy.copy(self)
+        for name in _GRID_NAMES:
+            setattr(ctResult, name, _read_only(getattr(self, name)))
+        ctResult.u_mesh = u_mesh
+        ctResult.v_mesh = v_mesh
+        ctResult.w_mesh = w_mesh
+        ctResult.u_cubed = u_cubed
+        return ctResult
+
     def subtract(self,ctSub):
         """ Subtract another cut through from self (assume matching resolution) and return the difference
 
         """
 
         # First confirm eligible for subtraction
-        if (not np.array_equal(self.x1_flat,ctSub.x1_flat)) or (not np.array_equal(self.x2_flat,ctSub.x2_flat)):
-            raise Exception("Can't subtract because not meshed the same")
+        self._check_same_mesh(ctSub, 'subtract')
 
-        ctResult = copy.deepcopy(ctSub)# copy the class
-
-        
         # Original method
         # ctResult.u = self.u - ctSub.u
         # ctResult.uMesh = griddata(np.column_stack([ctResult.y, ctResult.z]),ctResult.u,(ctResult.yMesh.flatten(), ctResult.zMesh.flatten()), method='cubic')
 
-        # New method
-        ctResult.u_mesh = self.u_mesh - ctSub.u_mesh
-        ctResult.v_mesh = self.v_mesh - ctSub.v_mesh
-        ctResult.w_mesh = self.w_mesh - ctSub.w_mesh
-        ctResult.u_cubed = self.u_cubed - ctSub.u_cubed
+        # New method, sharing the grid of ctSub
+        return ctSub._new_like(self.u_mesh - ctSub.u_mesh,
+                               self.v_mesh - ctSub.v_mesh,
+                               self.w_mesh - ctSub.w_mesh,
+                               self.u_cubed - ctSub.u_cubed)
 
+    def add(self,ctAdd):
+        """ Add another cut through to self (assume matching resolution) and return the sum
 
-        return ctResult
+        """
+        self._check_same_mesh(ctAdd, 'add')
+
+        return self._new_like(self.u_mesh + ctAdd.u_mesh,
+                              self.v_mesh + ctAdd.v_mesh,
+                              self.w_mesh + ctAdd.w_mesh,
+                              self.u_cubed + ctAdd.u_cubed)
+
+    def scale(self,factor):
+        """ Return the cut through with velocities multiplied by factor
+
+        """
+        return self._new_like(self.u_mesh * factor,
+                              self.v_mesh * factor,
+                              self.w_mesh * factor,
+                              self.u_cubed * factor**3)
+
+    def ratio(self,ctDen):
+        """ Divide self by another cut through (assume matching resolution) and return the ratio, e.g. for a velocity deficit ratio
+
+        """
+        self._check_same_mesh(ctDen, 'divide')
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._new_like(self.u_mesh / ctDen.u_mesh,
+                                  self.v_mesh / ctDen.v_mesh,
+                                  self.w_mesh / ctDen.w_mesh,
+                                  self.u_cubed / ctDen.u_cubed)
 
 
     def visualize(self,ax=None,minSpeed=None,maxSpeed=None):
@@ -176,7 +310,7 @@ class _CutPlane():
 
        
         # Reshape UMesh internally
-        u_mesh = self.u_mesh.reshape(self.res,self.res)
+        u_mesh = self.u_mesh.reshape(len(self.x2_lin),len(self.x1_lin))
         Zm = np.ma.masked_where(np.isnan(u_mesh),u_mesh)
         
         # Plot the cut-through
@@ -200,7 +334,7 @@ class _CutPlane():
             fig, ax = plt.subplots()
         
         # Reshape UMesh internally
-        u_mesh = self.u_mesh.reshape(self.res,self.res)
+        u_mesh = self.u_mesh.reshape(len(self.x2_lin),len(self.x1_lin))
         Zm = np.ma.masked_where(np.isnan(u_mesh),u_mesh)
         matplotlib.rcParams['contour.negative_linestyle'] = 'solid'
         
@@ -226,30 +360,60 @@ class _CutPlane():
 # Define horizontal subclass
 class HorPlane(_CutPlane): 
 
-    def __init__(self, df_flow, z_value, resolution=100, x1_center=0.0,x2_center=0.0, D=None):
+    def __init__(self, df_flow, z_value, resolution=100, x1_center=0.0,x2_center=0.0, D=None, triangulation=None, structured=None):
 
         # Set up call super
-        super().__init__(df_flow, x1='x', x2='y', x3_value=z_value,resolution=resolution,x1_center=x1_center,x2_center=x2_center, D=D, invert_x1=False)
+        super().__init__(df_flow, x1='x', x2='y', x3_value=z_value,resolution=resolution,x1_center=x1_center,x2_center=x2_center, D=D, invert_x1=False, structured=structured, triangulation=triangulation)
 
 # Define cross plane subclass
 class CrossPlane(_CutPlane): 
 
-    def __init__(self, df_flow, x_value, y_center, z_center, D, resolution=100, crop_y=None,crop_z=None,invert_x1=True):
+    def __init__(self, df_flow, x_value, y_center, z_center, D, resolution=100, crop_y=None,crop_z=None,invert_x1=True, triangulation=None, structured=None):
 
         # Set up call super
-        super().__init__(df_flow, x1='y', x2='z', x3_value=x_value,resolution=resolution,x1_center=y_center,x2_center=z_center, D=D, invert_x1=invert_x1, crop_x1 = crop_y, crop_x2=crop_z)
+        super().__init__(df_flow, x1='y', x2='z', x3_value=x_value,resolution=resolution,x1_center=y_center,x2_center=z_center, D=D, invert_x1=invert_x1, crop_x1 = crop_y, crop_x2=crop_z, structured=structured, triangulation=triangulation)
 
     def calculate_wind_speed(self,x1_loc,x2_loc,R):
-            
-        # Make a distance column
-        distance = np.sqrt((self.x1_flat - x1_loc)**2 +  (self.x2_flat - x2_loc)**2)
-        
+        """ Rotor averaged wind speed, the cube root of the mean u-cubed over cells within R of (x1_loc, x2_loc)
+
+        Args:
+            x1_loc, x2_loc, R: rotor center and radius, scalars or arrays (broadcast together) to
+                evaluate many rotors in one call
+        Returns:
+            the rotor averaged speed, an array if any input is an array. NaN cells (from
+            extrapolation outside the data) are left out of the average
+        """
+        x1_loc, x2_loc, R = np.broadcast_arrays(np.asarray(x1_loc, dtype=float), x2_loc, R)
+        x1_rotor = x1_loc.ravel()[:, np.newaxis]
+        x2_rotor = x2_loc.ravel()[:, np.newaxis]
+        R_rotor = R.ravel()[:, np.newaxis]
+
+        # Running sums along x1 of u-cubed (and of valid cells) for each row of the mesh
+        u_cubed, x1_lin = self._get_row_sums()
+
+        # In each row a disc covers a contiguous run of cells, |x1 - x1_loc| < half_width
+        with np.errstate(invalid='ignore'):
+            half_width = np.sqrt(R_rotor**2 - (self.x2_lin[np.newaxis, :] - x2_rotor)**2)
+        in_disc = half_width > 0
+        half_width = np.where(in_disc, half_width, 0.)
+        first = np.searchsorted(x1_lin, (x1_rotor - half_width).ravel(), side='right').reshape(half_width.shape)
+        last = np.searchsorted(x1_lin, (x1_rotor + half_width).ravel(), side='left').reshape(half_width.shape)
+        last = np.where(in_disc, np.maximum(last, first), first)
+
+        rows = np.arange(len(self.x2_lin))[np.newaxis, :]
+        total = (u_cubed[0][rows, last] - u_cubed[0][rows, first]).sum(axis=1)
+        num_valid = (u_cubed[1][rows, last] - u_cubed[1][rows, first]).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            speed = np.cbrt(total / num_valid)
+
         # Return the mean wind speed
-        return np.cbrt(np.mean(self.u_cubed[distance<R]))
+        if x1_loc.ndim == 0:
+            return speed[0]
+        return speed.reshape(x1_loc.shape)
 
     def get_profile(self,resolution=10):
-        x1_locs = np.linspace(min(self.x1_flat), max(self.x1_flat), resolution)
-        v_array = np.array([self.calculate_wind_speed(x1_loc,self.x2_center,self.D/2.) for x1_loc in x1_locs])
+        x1_locs = np.linspace(np.min(self.x1_flat), np.max(self.x1_flat), resolution)
+        v_array = self.calculate_wind_speed(x1_locs,self.x2_center,self.D/2.)
         return ((x1_locs - self.x1_center)/self.D,v_array)
 
 
@@ -284,8 +448,8 @@ class CrossPlane(_CutPlane):
 
 
         # # Reshape UMesh internally
-        v_mesh = self.v_mesh.reshape(self.res,self.res)
-        w_mesh = self.w_mesh.reshape(self.res,self.res)
+        v_mesh = self.v_mesh.reshape(len(self.x2_lin),len(self.x1_lin))
+        w_mesh = self.w_mesh.reshape(len(self.x2_lin),len(self.x1_lin))
         # Zm = np.ma.masked_where(np.isnan(uMesh),uMesh)
 
         # plot the stream plot
@@ -308,7 +472,7 @@ class CrossPlane(_CutPlane):
 # Primary difference is df_flow is a bit faked to use lidar data
 class LidarCrossPlane(CrossPlane): 
 
-    def __init__(self, y, z, u, y_center, z_center, D, resolution=100, crop_y=None,crop_z=None):
+    def __init__(self, y, z, u, y_center, z_center, D, resolution=100, crop_y=None,crop_z=None, triangulation=None):
 
         
         x = np.zeros_like(y)
@@ -322,8 +486,204 @@ class LidarCrossPlane(CrossPlane):
                             'v':v,
                             'w':w,})
 
-        super().__init__(df_flow, 0., y_center, z_center, D, resolution=resolution, crop_y=crop_y,crop_z=crop_z)
-
+        super().__init__(df_flow, 0., y_center, z_center, D, resolution=resolution, crop_y=crop_y,crop_z=crop_z, triangulation=triangulation)
+
+
+def cut_planes(df_flow, axis='x', values=None, max_workers=None, **kwargs):
+    """ Cut many planes normal to one axis out of a single flow
+
+    The flow is only scanned once: a FlowField is sliced by index, a frame is
+    sorted once on the cut axis and split into its planes. Each requested
+    plane is then built from its own small piece of the flow, optionally
+    in parallel.
+
+    input: 
+        df_flow: a flow dataframe from flow_field or a FlowField
+        axis: the axis normal to the planes, 'x' makes CrossPlanes, 'z' HorPlanes
+            and 'y' vertical planes along the flow (x1='x', x2='z')
+        values: the values along axis at which to cut
+        max_workers: if given, build the planes in a process pool of this many workers
+        kwargs: any other arguments of the plane, e.g. y_center, z_center, D and resolution for CrossPlane
+
+    output:
+        planes: list of planes in the order of values"""
+
+    if axis == 'x':
+        plane_class, value_name = CrossPlane, 'x_value'
+    elif axis == 'z':
+        plane_class, value_name = HorPlane, 'z_value'
+    elif axis == 'y':
+        plane_class, value_name = _CutPlane, 'x3_value'
+        kwargs = dict(kwargs, x1='x', x2='z')
+    else:
+        raise ValueError("axis must be 'x', 'y' or 'z'")
+
+    # Split the flow into the pieces holding each requested plane
+    values = np.atleast_1d(values).astype(float)
+    pieces = _split_planes(df_flow, axis, values)
+    args = [(plane_class, piece, dict(kwargs, **{value_name: v})) for piece, v in zip(pieces, values)]
+
+    if max_workers:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_make_plane, args))
+
+    # In serial the triangulation of a scattered plane is handed on to the
+    # following plane, which checks it against its own sample points (x1_in,
+    # x2_in) and is triangulated afresh if they differ
+    planes = list()
+    for plane_class, piece, plane_kwargs in args:
+        if planes and planes[-1].triangulation is not None and ('triangulation' not in kwargs):
+            try:
+                planes.append(_make_plane((plane_class, piece, dict(plane_kwargs, triangulation=planes[-1].triangulation))))
+                continue
+            except _TriangulationMismatch:
+                pass
+        planes.append(_make_plane((plane_class, piece, plane_kwargs)))
+
+    return planes
+
+def average_planes(planes):
+    """ Average a list of cut throughs meshed the same
+
+    The sums are accumulated in place, so only the result fields are allocated
+
+    input: 
+        planes: list of planes, for example from cut_planes or one plane per time step
+
+    output:
+        plane: the mean plane, sharing the grid of the first plane as read-only arrays"""
+
+    first = planes[0]
+    u_mesh = np.array(first.u_mesh, dtype=float)
+    v_mesh = np.array(first.v_mesh, dtype=float)
+    w_mesh = np.array(first.w_mesh, dtype=float)
+    u_cubed = np.array(first.u_cubed, dtype=float)
+    for plane in planes[1:]:
+        first._check_same_mesh(plane, 'average')
+        u_mesh += plane.u_mesh
+        v_mesh += plane.v_mesh
+        w_mesh += plane.w_mesh
+        u_cubed += plane.u_cubed
+
+    num_planes = float(len(planes))
+    for mean_field in [u_mesh, v_mesh, w_mesh, u_cubed]:
+        mean_field /= num_planes
+
+    return first._new_like(u_mesh, v_mesh, w_mesh, u_cubed)
+
+
+def _make_plane(args):
+    plane_class, piece, kwargs = args
+    return plane_class(piece, **kwargs)
+
+def _split_planes(df_flow, axis, values):
+    """ Return, for each value, the part of the flow on the plane nearest to it """
+
+    if isinstance(df_flow, FlowField):
+
+        # One plane thick FlowFields, which are cheap to hand to other processes
+        a = ['x', 'y', 'z'].index(axis)
+        pieces = list()
+        for v in values:
+            idx = df_flow.nearest_index(axis, v)
+            index = [slice(None)] * 3
+            index[2 - a] = slice(idx, idx + 1)
+            index = tuple(index)
+            origin = list(df_flow.origin)
+            origin[a] = df_flow.nearest_value(axis, v)
+            pieces.append(FlowField(df_flow.u[index], df_flow.v[index], df_flow.w[index], df_flow.spacing, origin=origin))
+        return pieces
+
+    # Sort once on the cut axis and find where each plane starts
+    x3 = df_flow[axis].values
+    order = np.argsort(x3, kind='stable')
+    plane_values, starts = np.unique(x3[order], return_index=True)
+    ends = np.append(starts[1:], len(x3))
+
+    nearest = np.abs(plane_values[np.newaxis, :] - values[:, np.newaxis]).argmin(axis=1)
+    sub_frames = dict()
+    for idx in np.unique(nearest):
+        sub_frames[idx] = df_flow.iloc[np.sort(order[starts[idx]:ends[idx]])]
+
+    return [sub_frames[idx] for idx in nearest]
+
+
+def _read_only(array):
+    """ A read-only view of array, or array itself if it is read-only already """
+    array = np.asarray(array)
+    if not array.flags.writeable:
+        return array
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+def _rectilinear_grid(x1, x2, fields):
+    """ Arrange flat plane samples on their rectilinear grid if they form one
+
+    Returns (x1_axis, x2_axis, [field grids of shape (len(x2_axis), len(x1_axis))])
+    or None if the samples are scattered
+    """
+    x1_axis, idx_1 = np.unique(np.asarray(x1), return_inverse=True)
+    x2_axis, idx_2 = np.unique(np.asarray(x2), return_inverse=True)
+    num_1 = len(x1_axis)
+    num_2 = len(x2_axis)
+
+    # Every grid point must appear exactly once
+    if (num_1 < 2) or (num_2 < 2) or (num_1 * num_2 != len(idx_1)):
+        return None
+    flat_idx = idx_2.ravel() * num_1 + idx_1.ravel()
+    if not np.all(np.bincount(flat_idx, minlength=num_1 * num_2) == 1):
+        return None
+
+    grids = list()
+    for f in fields:
+        grid = np.empty(num_1 * num_2)
+        grid[flat_idx] = np.asarray(f)
+        grids.append(grid.reshape(num_2, num_1))
+
+    return x1_axis, x2_axis, grids
+
+def _crop_axis(axis, crop):
+    """ Limit a native grid axis to the crop range """
+    if not crop:
+        return axis
+    return axis[(axis >= crop[0]) & (axis <= crop[1])]
+
+def _native_index(axis, lin):
+    """ Indices of the native axis points that make up lin, or None if lin isn't made of native points """
+    if len(lin) > len(axis):
+        return None
+    idx = np.clip(np.searchsorted(axis, lin), 0, len(axis) - 1)
+    idx_below = np.clip(idx - 1, 0, len(axis) - 1)
+    idx = np.where(np.abs(axis[idx_below] - lin) < np.abs(axis[idx] - lin), idx_below, idx)
+    if not np.allclose(axis[idx], lin, rtol=0., atol=1e-9 * max(np.ptp(axis), 1.)):
+        return None
+    return idx
+
+def _interpolate_rectilinear(grid, x1_lin, x2_lin):
+    """ Resample rectilinear plane data onto the (x2_lin, x1_lin) mesh, returned as flat arrays
+
+    When the mesh is made of native grid points the data is returned without resampling,
+    otherwise a separable cubic spline is evaluated on the mesh
+    """
+    from scipy.interpolate import RectBivariateSpline
+
+    x1_axis, x2_axis, fields = grid
+    idx_1 = _native_index(x1_axis, x1_lin)
+    idx_2 = _native_index(x2_axis, x2_lin)
+    if (idx_1 is not None) and (idx_2 is not None):
+        return [np.asarray(f, dtype=float)[np.ix_(idx_2, idx_1)].ravel() for f in fields]
+
+    # A spline needs at least two samples along each axis
+    for name, axis in [('x1', x1_axis), ('x2', x2_axis)]:
+        if len(axis) < 2:
+            raise ValueError("Can't interpolate a plane with a single sample along %s, "
+                             "use resolution=None to keep the native grid" % name)
+
+    k1 = min(3, len(x1_axis) - 1)
+    k2 = min(3, len(x2_axis) - 1)
+    return [RectBivariateSpline(x2_axis, x1_axis, f, kx=k2, ky=k1)(x2_lin, x1_lin).ravel() for f in fields]
 
 def plot_turbine(ax, x, y, yaw, D):
 
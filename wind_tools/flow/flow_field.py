@@ -15,6 +15,147 @@ import os
 import numpy as np
 import pandas as pd
 
+from wind_tools.cache import file_signature, get_cache_file, read_cache_meta, write_cache
+
+_AXES = ['x', 'y', 'z']
+
+
+class FlowField():
+
+    def __init__(self, u, v, w, spacing, origin=(0., 0., 0.)):
+        """Flow on a structured grid, stored as 3-D arrays
+
+
+        input:
+            u, v, w: velocity components, arrays of shape (nz, ny, nx)
+            spacing: grid spacing in x, y and z
+            origin: coordinates of the first grid point"""
+
+        self.u = u
+        self.v = v
+        self.w = w
+        self.spacing = tuple([float(s) for s in spacing])
+        self.origin = tuple([float(o) for o in origin])
+
+        if not (u.shape == v.shape == w.shape) or (u.ndim != 3):
+            raise ValueError('u, v and w must be 3-D arrays of matching shape')
+
+    @classmethod
+    def from_points(cls, x, y, z, u, v, w):
+        """Build a FlowField from flat point data that covers a full structured grid
+
+        input:
+            x, y, z: point coordinates, in any order
+            u, v, w: velocities at those points
+
+        output:
+            flow: FlowField with the points placed on the grid"""
+
+        axes = list()
+        indices = list()
+        spacing = list()
+        for name, values in zip(['x', 'y', 'z'], [x, y, z]):
+            axis, index = np.unique(np.asarray(values), return_inverse=True)
+            if len(axis) > 1:
+                step = np.diff(axis)
+                if not np.allclose(step, step.mean()):
+                    raise ValueError('Points are not evenly spaced in %s' % name)
+                spacing.append(step.mean())
+            else:
+                spacing.append(0.)
+            axes.append(axis)
+            indices.append(index.ravel())
+
+        shape = (len(axes[2]), len(axes[1]), len(axes[0]))
+        if np.prod(shape) != len(indices[0]):
+            raise ValueError('Points do not form a complete structured grid')
+
+        fields = list()
+        for values in [u, v, w]:
+            field = np.full(shape, np.nan)
+            field[indices[2], indices[1], indices[0]] = np.asarray(values).ravel()
+            fields.append(field)
+
+        return cls(fields[0], fields[1], fields[2], spacing, origin=[a[0] for a in axes])
+
+    @property
+    def dimensions(self):
+        """Number of points in x, y and z"""
+        nz, ny, nx = self.u.shape
+        return (nx, ny, nz)
+
+    @property
+    def x(self):
+        return self.get_axis('x')
+
+    @property
+    def y(self):
+        return self.get_axis('y')
+
+    @property
+    def z(self):
+        return self.get_axis('z')
+
+    def get_axis(self, axis):
+        """Return the 1-D coordinates along axis ('x', 'y' or 'z')"""
+        a = _AXES.index(axis)
+        return self.origin[a] + self.spacing[a] * np.arange(self.dimensions[a])
+
+    def nearest_index(self, axis, value):
+        """Index of the grid plane along axis nearest to value, computed directly from the spacing"""
+        a = _AXES.index(axis)
+        if self.spacing[a] == 0.:
+            return 0
+        idx = int(np.round((value - self.origin[a]) / self.spacing[a]))
+        return min(max(idx, 0), self.dimensions[a] - 1)
+
+    def nearest_value(self, axis, value):
+        """Coordinate of the grid plane along axis nearest to value"""
+        a = _AXES.index(axis)
+        return self.origin[a] + self.spacing[a] * self.nearest_index(axis, value)
+
+    def get_plane(self, axis, value):
+        """Slice out the grid plane normal to axis nearest to value
+
+        input:
+            axis: normal of the plane, 'x', 'y' or 'z'
+            value: coordinate along axis at which to cut
+
+        output:
+            x1, x2: 1-D coordinates of the in-plane axes, in x, y, z order
+            u, v, w: 2-D views of shape (len(x2), len(x1))"""
+
+        idx = self.nearest_index(axis, value)
+        if axis == 'x':
+            index = (slice(None), slice(None), idx)
+        elif axis == 'y':
+            index = (slice(None), idx, slice(None))
+        else:
+            index = (idx, slice(None), slice(None))
+        x1_name, x2_name = [a for a in _AXES if a != axis]
+
+        return (self.get_axis(x1_name), self.get_axis(x2_name),
+                self.u[index], self.v[index], self.w[index])
+
+    def to_dataframe(self, relative=False):
+        """Return the long-format frame with columns x, y, z, u, v, w
+
+        input:
+            relative: if True coordinates start from 0 rather than the origin
+
+        output:
+            df: pandas table of every grid point, x varying fastest"""
+
+        origin = (0., 0., 0.) if relative else self.origin
+        x, y, z = get_grid_coordinates(self.spacing, self.dimensions, origin)
+
+        return pd.DataFrame({'x':x,
+                            'y':y,
+                            'z':z,
+                            'u':self.u.ravel(),
+                            'v':self.v.ravel(),
+                            'w':self.w.ravel(),})
+
 
 def get_flow_file(case_folder):
     """Given a case folder, find the flow file
@@ -33,11 +174,12 @@ def get_flow_file(case_folder):
     return flow_file
 
 
-def read_flow_frame_SOWFA(filename):
+def read_flow_frame_SOWFA(filename, cache=True, cache_dir=None):
     """Read flow array output from SOWFA
 
 
     input: filename: name of flow array to open
+        cache, cache_dir: binary cache options, see read_flow_field_SOWFA
 
     output:
 		df: a pandas table with the columns, x,y,z,u,v,w of all relavent flow info
@@ -45,8 +187,59 @@ def read_flow_frame_SOWFA(filename):
 
     Paul Fleming, 2018 """
 
+    flow = read_flow_field_SOWFA(filename, cache=cache, cache_dir=cache_dir)
+
+    # Coordinates in the frame are relative to the origin, as they always have been
+    df = flow.to_dataframe(relative=True)
     
+    return df, flow.spacing, flow.dimensions, flow.origin
+
+def read_flow_field_SOWFA(filename, cache=True, cache_dir=None):
+    """Read flow array output from SOWFA into a structured FlowField
+
+    The first read of a file saves the parsed velocities as a binary .npy
+    cache, later reads memory-map that cache instead of parsing the text.
+    The cache is rebuilt whenever the path, mtime or size of the file changes.
+
+
+    input: filename: name of flow array to open
+        cache: if True read from / write to the binary cache, False to always parse
+        cache_dir: folder for the cache, by default next to the file
+            (see wind_tools.cache)
+
+    output:
+        flow: a FlowField holding u, v, w on the (nz, ny, nx) grid of the file,
+            coordinates include the origin given in the file"""
+
+    if cache:
+        cache_file = get_cache_file(filename, '.npy', cache_dir)
+        signatures = {'flow': file_signature(filename)}
+        meta = read_cache_meta(cache_file, signatures)
+        if meta is not None:
+            data = np.load(cache_file, mmap_mode='r')
+            return FlowField(data[0], data[1], data[2], meta['spacing'], origin=meta['origin'])
+
     # Read the dimension info from the file
+    spacing, dimensions, origin = _read_SOWFA_header(filename)
+    nx, ny, nz = [int(round(d)) for d in dimensions]
+
+    df = pd.read_csv(filename,skiprows=10,sep='\t',header=None,names=['u','v','w'])
+    if len(df) != nx * ny * nz:
+        raise ValueError('%s has %d points, expected %d for its %d x %d x %d grid'
+                         % (filename, len(df), nx * ny * nz, nx, ny, nz))
+    data = df.values.T.reshape(3, nz, ny, nx)
+
+    if cache:
+        def write_func(tmp_file):
+            with open(tmp_file, 'wb') as f:
+                np.save(f, data)
+        write_cache(cache_file, signatures, write_func, spacing=spacing, origin=origin)
+
+    return FlowField(data[0], data[1], data[2], spacing, origin=origin)
+
+def _read_SOWFA_header(filename):
+    """Read the SPACING, DIMENSIONS and ORIGIN lines of a SOWFA flow array header"""
+
     with open(filename,'r') as f:
         for i in range(10):
             read_data = f.readline()
@@ -57,19 +250,34 @@ def read_flow_frame_SOWFA(filename):
             if 'ORIGIN' in read_data:
                 origin = tuple([float(d) for d in read_data.rstrip().split(' ')[1:]])
 
-    # Set up x, y, z as lists
-    xRange = np.arange(0,dimensions[0]*spacing[0],spacing[0])
-    yRange = np.arange(0,dimensions[1]*spacing[1],spacing[1])
-    zRange = np.arange(0,dimensions[2]*spacing[2],spacing[2])
+    return spacing, dimensions, origin
 
-    pts = np.array([ (x,y,z) for z in zRange for y in yRange for x in xRange ])
+def get_grid_coordinates(spacing, dimensions, origin=(0., 0., 0.)):
+    """Materialize the x, y, z coordinates of a structured grid
 
-    df = pd.read_csv(filename,skiprows=10,sep='\t',header=None,names=['u','v','w'])
-    df['x'] = pts[:,0]
-    df['y'] = pts[:,1]
-    df['z'] = pts[:,2]
-    
-    return df, spacing, dimensions, origin
+
+    input: 
+        spacing: grid spacing in x, y and z
+        dimensions: number of points in x, y and z
+        origin: coordinates of the first grid point, defaults to 0
+
+    output:
+        x, y, z: flat coordinate arrays with x varying fastest, then y, then z
+            (the point ordering of SOWFA array output)"""
+
+    nx, ny, nz = [int(round(d)) for d in dimensions]
+
+    # Build each axis by index arithmetic rather than accumulating
+    # floats, so the point count always matches the dimensions
+    x_range = origin[0] + spacing[0] * np.arange(nx)
+    y_range = origin[1] + spacing[1] * np.arange(ny)
+    z_range = origin[2] + spacing[2] * np.arange(nz)
+
+    x = np.tile(x_range, ny * nz)
+    y = np.tile(np.repeat(y_range, nx), nz)
+    z = np.repeat(z_range, nx * ny)
+
+    return x, y, z
 
 def get_flow_frame_FLORIS(floris):
     """Read flow array output from SOWFA
@@ -97,4 +305,22 @@ def get_flow_frame_FLORIS(floris):
                         'v':v,
                         'w':w,})
 
-    return df
\ No newline at end of file
+    return df
+
+def get_flow_field_FLORIS(floris):
+    """Extract the flow of a FLORIS model as a FlowField
+
+
+    input: floris: a floris model which has already been run to extract flow from
+
+    output:
+        flow: a FlowField of the FLORIS flow domain"""
+
+    flow_field = floris.farm.flow_field
+
+    return FlowField.from_points(flow_field.x.flatten(),
+                                 flow_field.y.flatten(),
+                                 flow_field.z.flatten(),
+                                 flow_field.u_field.flatten(),
+                                 flow_field.v.flatten(),
+                                 flow_field.w.flatten())
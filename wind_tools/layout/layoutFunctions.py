@@ -1,14 +1,143 @@
 # Defines a bunch of tools for plotting and manipulating layouts for quick visualizations
 
+import os
 import numpy as np
 import math
 import matplotlib.pyplot as plt
 import pandas as pd
-from scipy.spatial.distance import squareform, pdist
+from scipy import sparse
+from scipy.spatial import cKDTree
 
 # All functions assume a dataframe with index turbine, and columns x and y
 
 
+def pairwise_geometry(turbineLoc, wind_direction=270.):
+    """
+    Distance, wake angle and wind aligned offsets between all pairs of turbines
+
+    input:
+        turbineLoc: dataframe with index turbine, and columns x and y
+        wind_direction: compass direction (degrees) the wind comes from, for the downstream and crosswind offsets
+
+    output:
+        geometry: dict of (turbine, turbine) arrays, in the order of turbineLoc, element [i, j] is from turbine i to j
+            dist: distance
+            angle: compass wind direction in which turbine i wakes turbine j, as wakeAngle
+            downstream: distance of turbine j downstream of turbine i
+            crosswind: distance of turbine j to the left of turbine i, looking downstream
+    """
+
+    x = turbineLoc.x.to_numpy(dtype=float)
+    y = turbineLoc.y.to_numpy(dtype=float)
+    dx = x[None, :] - x[:, None]
+    dy = y[None, :] - y[:, None]
+
+    return _offset_geometry(dx, dy, wind_direction)
+
+
+def neighbor_geometry(turbineLoc, radius, wind_direction=270., sector_width=None):
+    """
+    Geometry of the pairs of turbines within radius of each other, as sparse arrays
+
+    The pairs are found with a KD-tree, so time and memory scale with the number
+    of pairs found rather than with the square of the number of turbines.
+
+    input:
+        turbineLoc: dataframe with index turbine, and columns x and y
+        radius: largest distance between the turbines of a pair
+        wind_direction: as for pairwise_geometry
+        sector_width: if given, only keep the pairs where turbine j is downstream of turbine i, within
+            +/- sector_width / 2 degrees of the wind direction
+
+    output:
+        geometry: dict of (turbine, turbine) scipy.sparse COO arrays with the same entries as
+            pairwise_geometry, holding only the pairs found (zero distance pairs are left out)
+    """
+
+    xy = np.column_stack([turbineLoc.x.to_numpy(dtype=float), turbineLoc.y.to_numpy(dtype=float)])
+    pairs = cKDTree(xy).query_pairs(radius, output_type='ndarray')
+
+    # Both directions of each pair
+    i1 = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    i2 = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    dx = xy[i2, 0] - xy[i1, 0]
+    dy = xy[i2, 1] - xy[i1, 1]
+
+    geometry = _offset_geometry(dx, dy, wind_direction)
+
+    keep = geometry['dist'] > 0.0
+    if sector_width is not None:
+        keep &= _in_sector(geometry['downstream'], geometry['crosswind'], sector_width)
+
+    # Sorted by row then column, as a dense array would be
+    order = np.lexsort((i2[keep], i1[keep]))
+    i1 = i1[keep][order]
+    i2 = i2[keep][order]
+    shape = (len(xy), len(xy))
+
+    return dict((k, sparse.coo_array((v[keep][order], (i1, i2)), shape=shape)) for k, v in geometry.items())
+
+
+def _in_sector(downstream, crosswind, sector_width):
+    """True where an offset is downstream, within +/- sector_width / 2 degrees of the wind direction"""
+
+    off_axis = np.abs(np.arctan2(crosswind, downstream)) * 180.0 / np.pi
+    return (downstream > 0.0) & (off_axis <= sector_width / 2.)
+
+
+def _offset_geometry(dx, dy, wind_direction):
+    """Distance, wake angle, downstream and crosswind offset of the offsets (dx, dy) between turbines"""
+
+    # Angle in normal cartesian coordinates converted to a compass angle
+    angle = 270.0 - np.arctan2(dy, dx) * 180.0 / np.pi
+    angle[angle < 0] += 360.0
+    angle[angle > 360] -= 360.0
+
+    # Unit vector the wind blows along
+    theta = np.deg2rad(wind_direction)
+    flow_x = -np.sin(theta)
+    flow_y = -np.cos(theta)
+
+    return {'dist': np.hypot(dx, dy),
+            'angle': angle,
+            'downstream': dx * flow_x + dy * flow_y,
+            'crosswind': dy * flow_x - dx * flow_y}
+
+
+def pair_table(turbineLoc, geometry=None, wind_direction=270., ascending=True):
+    """
+    Table of all pairs of distinct turbines, sorted by distance
+
+    input:
+        turbineLoc: dataframe with index turbine, and columns x and y
+        geometry: pairwise_geometry(turbineLoc) or neighbor_geometry(turbineLoc, ...), by default
+            pairwise_geometry(turbineLoc, wind_direction)
+        wind_direction: as for pairwise_geometry
+        ascending: sort by increasing distance, otherwise decreasing
+
+    output:
+        pairs: dataframe with columns T1, T2, Dist, angle, downstream and crosswind, one row per pair
+            of turbines at a non-zero distance (of the pairs in geometry, if it is sparse)
+    """
+
+    if geometry is None:
+        geometry = pairwise_geometry(turbineLoc, wind_direction)
+
+    turbines = turbineLoc.index.to_numpy()
+    if sparse.issparse(geometry['dist']):
+        i1, i2 = geometry['dist'].row, geometry['dist'].col
+        values = dict((k, v.data) for k, v in geometry.items())
+    else:
+        i1, i2 = np.nonzero(geometry['dist'] > 0.0)
+        values = dict((k, v[i1, i2]) for k, v in geometry.items())
+
+    pairs = pd.DataFrame({'T1': turbines[i1], 'T2': turbines[i2],
+                          'Dist': values['dist'], 'angle': values['angle'],
+                          'downstream': values['downstream'], 'crosswind': values['crosswind']})
+
+    return pairs.sort_values('Dist', ascending=ascending, kind='stable').reset_index(drop=True)
+
+
 def visualize_layout(turbineLoc,D,ax=None,show_wake_lines=False,limit_dist=None):
 # Make a plot which shows the turbine locations, and important wakes
 
@@ -18,66 +147,39 @@ def visualize_layout(turbineLoc,D,ax=None,show_wake_lines=False,limit_dist=None)
     if not ax:
         fig, ax = plt.subplots(figsize=(7,7))
 
-    # Plot turbine points
-    # ax.scatter(turbineLoc.x,turbineLoc.y,alpha=0)
-
-
-        
-    # Make ordered list of pairs sorted by distance if the distance and angle matrices are provided
+    # Make ordered list of pairs sorted by distance
     if show_wake_lines:
 
-        # Make a dataframe of distances
-        dist = pd.DataFrame(squareform(pdist(turbineLoc)),index=turbineLoc.index,columns=turbineLoc.index)
-
-        # Make a DF of turbine angles
-        angle = pd.DataFrame() 
-        turbines = turbineLoc.index
-        for t1 in turbines:
-            for t2 in turbines:
-                #d[t1,t2] = wakeAngle(turbineLoc,[t1,t2])
-                angle.loc[t1,t2] = wakeAngle(turbineLoc,[t1,t2])
-        angle.index.name = 'Turbine'
+        # Only look for the pairs within limit_dist, if given
+        if limit_dist:
+            geometry = neighbor_geometry(turbineLoc, limit_dist)
+        else:
+            geometry = pairwise_geometry(turbineLoc)
+        ordList = pair_table(turbineLoc, geometry, ascending=False)
 
-        # Now limit the matrix to only show waking from (row) to (column)
-        for t1 in turbines:
-            for t2 in turbines: 
-                if ( (dist.loc[t1,t2]==0.0)):
-                    dist.loc[t1,t2] = np.nan
-                    angle.loc[t1,t2] = np.nan
+        # Only plot positive x way
+        x1 = turbineLoc.x.loc[ordList.T1].to_numpy()
+        x2 = turbineLoc.x.loc[ordList.T2].to_numpy()
+        ordList = ordList[x2 <= x1]
 
-
-        ordList = pd.DataFrame()
-        for t1 in turbines:
-            for t2 in turbines:
-                temp = pd.DataFrame({'T1':[t1],'T2':[t2],'Dist':[dist.loc[t1,t2]],'angle':angle.loc[t1,t2]})
-                ordList =  pd.concat([ordList,temp])
-
-        ordList.dropna(how='any',inplace=True)
-        ordList.sort_values('Dist',inplace=True,ascending=False)    
+        # Angle of the way back, from the second turbine to the first
+        idx = turbineLoc.index
+        angle = geometry['angle'].tocsr() if sparse.issparse(geometry['angle']) else geometry['angle']
+        angle_back = np.asarray(angle[idx.get_indexer(ordList.T2), idx.get_indexer(ordList.T1)]).ravel()
 
         # Plot wake lines and details
-        for t1, t2 in zip(ordList.T1, ordList.T2):
-            x = [turbineLoc.loc[t1,'x'], turbineLoc.loc[t2,'x']]
-            y = [turbineLoc.loc[t1,'y'], turbineLoc.loc[t2,'y']]
-            
-            if limit_dist:
-                if dist.loc[t1,t2] > limit_dist:
-                    continue
-            
-            # Only plot positive x way
-            if x[1] > x[0]:
-                continue
+        for row, back in zip(ordList.itertuples(), angle_back):
+            x = [turbineLoc.loc[row.T1,'x'], turbineLoc.loc[row.T2,'x']]
+            y = [turbineLoc.loc[row.T1,'y'], turbineLoc.loc[row.T2,'y']]
 
             l, = ax.plot(x,y)
-            linetext = '%.2f m --- %.2f D --- %.2f Deg --- %.2f Deg' % (dist.loc[t1,t2],dist.loc[t1,t2]/D,angle.loc[t1,t2],angle.loc[t2,t1])
+            linetext = '%.2f m --- %.2f D --- %.2f Deg --- %.2f Deg' % (row.Dist,row.Dist/D,row.angle,back)
             label_line(l, linetext, ax, near_i=1, near_x=None, near_y=None,rotation_offset=180)
         
     # Plot turbines
-    for t1 in turbines:
-        # print(t1)
-        #ax.annotate(t1,(turbineLoc03.loc[t1].x,turbineLoc03.loc[t1].y),xycoords='data')
-        ax.plot([turbineLoc.loc[t1].x,turbineLoc.loc[t1].x],[turbineLoc.loc[t1].y-0.5*D/2.,turbineLoc.loc[t1].y +0.5*D/2.],color='k')
-        ax.text(turbineLoc.loc[t1].x+D/2,turbineLoc.loc[t1].y,t1,bbox=dict(boxstyle="round",ec='red',fc='white'))
+    ax.vlines(turbineLoc.x, turbineLoc.y - 0.5*D/2., turbineLoc.y + 0.5*D/2., color='k')
+    for t1, x, y in zip(turbines, turbineLoc.x, turbineLoc.y):
+        ax.text(x+D/2,y,t1,bbox=dict(boxstyle="round",ec='red',fc='white'))
 
     ax.set_aspect('equal')
 
@@ -86,44 +188,84 @@ def set_direction(turbineLoc, rotation_angle):
     # return a rotated wind farm, rotated CCW by the given angle provided in degrees
 
     theta = np.deg2rad(rotation_angle)
-    R = np.matrix([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    R = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+
+    xy_rot = R @ np.array([turbineLoc.x, turbineLoc.y], dtype=float)
+
+    return turbineLoc.assign(x=xy_rot[0], y=xy_rot[1])
+
+
+def wake_matrices(turbineLoc, wind_directions, sector_width=30., max_dist=None):
+    """
+    Which turbines wake which, for many wind directions at once
+
+    Turbine j is waked by turbine i if it is downstream of i within +/- sector_width / 2
+    degrees of the wind direction (as in neighbor_geometry). The offsets between the
+    turbines are rotated into the frame of every wind direction with one einsum.
+
+    input:
+        turbineLoc: dataframe with index turbine, and columns x and y
+        wind_directions: compass directions (degrees) the wind comes from
+        sector_width: full width in degrees of the wake sector
+        max_dist: if given, only pairs within max_dist of each other (found with a KD-tree) can be
+            waked, and the result is sparse
+
+    output:
+        wakes: without max_dist, a dict of (direction, turbine, turbine) arrays, element [d, i, j] is
+            for turbine j seen from turbine i with the wind from wind_directions[d]
+                waked: True if turbine i wakes turbine j
+                downstream: distance of turbine j downstream of turbine i
+                crosswind: distance of turbine j to the left of turbine i, looking downstream
+            with max_dist, a dict of (direction, turbine, turbine) scipy.sparse COO arrays holding
+            only the waked pairs, with entries waked, downstream, crosswind and dist
+    """
+
+    xy = np.column_stack([turbineLoc.x.to_numpy(dtype=float), turbineLoc.y.to_numpy(dtype=float)])
+    theta = np.deg2rad(np.atleast_1d(np.asarray(wind_directions, dtype=float)))
+
+    # Rotation of every direction taking (dx, dy) to (downstream, crosswind)
+    flow_x = -np.sin(theta)
+    flow_y = -np.cos(theta)
+    R = np.stack([np.stack([flow_x, flow_y], axis=-1), np.stack([-flow_y, flow_x], axis=-1)], axis=1)
 
-    xy = np.array([turbineLoc.x,turbineLoc.y])
+    if max_dist is None:
+        offsets = np.stack([xy[None, :, 0] - xy[:, None, 0], xy[None, :, 1] - xy[:, None, 1]])
+        rotated = np.einsum('dab,bij->daij', R, offsets, optimize=True)
+        downstream = rotated[:, 0]
+        crosswind = rotated[:, 1]
+        waked = _in_sector(downstream, crosswind, sector_width)
 
-    xy_rot = R * xy
-    # return xy_rot
-    #print(xy_rot)
-    #print(xy_rot[0][0][0])
-    df_return = turbineLoc.copy(deep=True)
-    df_return['x'] = np.squeeze(np.asarray(xy_rot[0,:]))
-    df_return['y'] = np.squeeze(np.asarray(xy_rot[1,:]))
-    return df_return
+        return {'waked': waked, 'downstream': downstream, 'crosswind': crosswind}
+
+    # Only the pairs within max_dist, in both directions
+    pairs = cKDTree(xy).query_pairs(max_dist, output_type='ndarray')
+    i1 = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    i2 = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    offsets = xy[i2] - xy[i1]
+
+    rotated = np.einsum('dab,pb->dap', R, offsets, optimize=True)
+    downstream = rotated[:, 0]
+    crosswind = rotated[:, 1]
+    d, p = np.nonzero(_in_sector(downstream, crosswind, sector_width))
+
+    coords = (d, i1[p], i2[p])
+    shape = (len(theta), len(xy), len(xy))
+    values = {'waked': np.ones(len(d), dtype=bool),
+              'downstream': downstream[d, p],
+              'crosswind': crosswind[d, p],
+              'dist': np.hypot(offsets[p, 0], offsets[p, 1])}
+
+    return dict((k, sparse.coo_array((v, coords), shape=shape)) for k, v in values.items())
 
 # Derive distance function
 def turbineDist(df, turbList):
-    x1 = df.loc[turbList[0],'x']
-    x2 = df.loc[turbList[1],'x']
-    y1 = df.loc[turbList[0],'y']
-    y2 = df.loc[turbList[1],'y']
-    dist = np.sqrt( (x2 - x1)**2 + (y2 - y1)**2 )
-    return dist
+    geometry = pairwise_geometry(df.loc[list(turbList[:2])])
+    return geometry['dist'][0, 1]
 
 # Set up an angle function get angles between turbines in wake direction
 def wakeAngle(df, turbList):
-    x1 = df.loc[turbList[0],'x']
-    x2 = df.loc[turbList[1],'x']
-    y1 = df.loc[turbList[0],'y']
-    y2 = df.loc[turbList[1],'y']
-    wakeAngle = np.arctan2(y2-y1,x2-x1) * 180.0/np.pi # Angle in normal cartesian coordinates
-    
-    # Convert angle to compass angle
-    wakeAngle = 270.0 - wakeAngle
-    if wakeAngle < 0:
-        wakeAngle = wakeAngle + 360.0
-    if wakeAngle > 360:
-        wakeAngle = wakeAngle - 360.0
-    
-    return wakeAngle
+    geometry = pairwise_geometry(df.loc[list(turbList[:2])])
+    return geometry['angle'][0, 1]
 
 def label_line(line, label_text, ax, near_i=None, near_x=None, near_y=None, rotation_offset=0, offset=(0,0)):
     """call 
@@ -169,67 +311,163 @@ def label_line(line, label_text, ax, near_i=None, near_x=None, near_y=None, rota
     else:
         raise ValueError("Need one of near_i, near_x, near_y")
 
-def make_turbine_array(x,y,filename='turbineArrayProperties',turbine='NREL5MWRef'):
+# Turbine properties written for every turbine of a turbineArrayProperties file, in order, with their defaults
+TURBINE_PROPERTIES = [('turbineType', 'NREL5MWRef'),
+                      ('baseLocation', None),
+                      ('nRadial', 64),
+                      ('azimuthMaxDis', 2.0),
+                      ('nAvgSector', 1),
+                      ('pointDistType', 'uniform'),
+                      ('pointInterpType', 'linear'),
+                      ('bladeUpdateType', 'oldPosition'),
+                      ('epsilon', 20.0),
+                      ('forceScalar', 1.0),
+                      ('inflowVelocityScalar', 0.94),
+                      ('tipRootLossCorrType', 'Glauert'),
+                      ('rotationDir', 'cw'),
+                      ('Azimuth', 0.0),
+                      ('RotSpeed', 13.0),
+                      ('TorqueGen', 20000.0),
+                      ('Pitch', 0.0),
+                      ('NacYaw', 270.0),
+                      ('fluidDensity', 1.225)]
+
+_TURBINE_ARRAY_HEADER = (
+    '/*--------------------------------*- C++ -*----------------------------------*\\\n'
+    '| =========                 |                                                 |\n'
+    '| \\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |\n'
+    '|  \\    /   O peration     | Version:  1.6                                   |\n'
+    '|   \\  /    A nd           | Web:      http://www.OpenFOAM.org               |\n'
+    '|    \\/     M anipulation  |                                                 |\n'
+    '\\*---------------------------------------------------------------------------*/\n'
+    'FoamFile\n'
+    '{\n'
+    '    version     2.0;\n'
+    '    format      ascii;\n'
+    '    class       dictionary;\n'
+    '    object      turbineProperties;\n'
+    '}\n'
+    '// * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * //\n'
+    '\n'
+    'globalProperties\n'
+    '{\n'
+    '    outputControl       "timeStep";\n'
+    '    outputInterval       1;\n'
+    '}\n')
+
+
+def render_turbine_array(x,y,turbine='NREL5MWRef',properties=None):
+    """
+    Text of a turbine array file given x and y locations
+
+    x,y: arrays of turbine location
+    turbine: name of turbine to use within file
+    properties: turbine properties to set instead of the defaults of TURBINE_PROPERTIES, as a dict of
+        scalars (for all turbines) or arrays (one value per turbine), or a dataframe with one row per
+        turbine. Properties not in TURBINE_PROPERTIES are added at the end of each turbine. The
+        baseLocation comes from x and y and can't be set here
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    num_turbines = len(x)
+
+    if properties is None:
+        properties = dict()
+    elif isinstance(properties, pd.DataFrame):
+        properties = dict((c, properties[c].to_numpy()) for c in properties.columns if c not in ['x', 'y'])
+    if 'baseLocation' in properties:
+        raise ValueError('The baseLocation of the turbines is set by x and y, not properties')
+
+    values = dict(TURBINE_PROPERTIES, turbineType=turbine)
+    values.update(properties)
+
+    # Template of one turbine, properties that are the same for all turbines are filled in once;
+    # the columns of per turbine values are in the order of the template
+    template = '\nturbine%d\n{\n'
+    columns = [range(num_turbines)]
+    for name, value in values.items():
+        if name == 'baseLocation':
+            template += '    %-20s(%%.1f %%.1f 0.0);\n' % name
+            columns += [x.tolist(), y.tolist()]
+        elif np.ndim(value) == 0:
+            template += ('    %-20s%s;\n' % (name, _format_property(value))).replace('%', '%%')
+        else:
+            if len(value) != num_turbines:
+                raise ValueError('%s has %d values for %d turbines' % (name, len(value), num_turbines))
+            template += '    %-20s%%s;\n' % name
+            columns.append([_format_property(v) for v in value])
+    template += '}\n'
+
+    return _TURBINE_ARRAY_HEADER + ''.join([template % row for row in zip(*columns)])
+
+
+def _format_property(value):
+    """A turbine property as written in turbineArrayProperties, strings are quoted and numbers set off by a space"""
+
+    if isinstance(value, str):
+        return '"%s"' % value
+    if isinstance(value, (bool, np.bool_)):
+        return ' true' if value else ' false'
+
+    return ' %s' % value
+
+
+def make_turbine_array(x,y,filename='turbineArrayProperties',turbine='NREL5MWRef',properties=None):
     """
     Function to output a turbine array file given x and y locations
 
     x,y: arrays of turbine location
     filename: name of output file
     turbine: name of turbine to use within file
+    properties: turbine properties to change, as for render_turbine_array
     """
 
-    # Open the file for writing
+    text = render_turbine_array(x, y, turbine, properties)
+
+    # One buffered write of the whole file
     with open(filename,'w') as f:
+        f.write(text)
+
+
+def make_turbine_arrays(case_folders,layouts,turbine='NREL5MWRef',properties=None,max_workers=None):
+    """
+    Write the constant/turbineArrayProperties file of many cases
+
+    case_folders: case folders to write to, constant is made if needed
+    layouts: one dataframe per case with columns x and y, and optionally turbine properties (as for
+        render_turbine_array) with a value per turbine
+    turbine: name of turbine to use within the files
+    properties: turbine properties to change in all cases, as for render_turbine_array; columns of a
+        layout take precedence
+    max_workers: if given, write the files in a process pool of this many workers
+
+    returns the names of the files written
+    """
+
+    if len(case_folders) != len(layouts):
+        raise ValueError('%d case folders for %d layouts' % (len(case_folders), len(layouts)))
+
+    args = list()
+    for case_folder, layout in zip(case_folders, layouts):
+        case_properties = dict() if properties is None else dict(properties)
+        case_properties.update((c, layout[c].to_numpy()) for c in layout.columns if c not in ['x', 'y'])
+        filename = os.path.join(case_folder, 'constant', 'turbineArrayProperties')
+        args.append((layout.x.to_numpy(), layout.y.to_numpy(), filename, turbine, case_properties))
 
-        # Write out the headerlines
-        f.write('/*--------------------------------*- C++ -*----------------------------------*\\\n')
-        f.write('| =========                 |                                                 |\n')
-        f.write('| \\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |\n')
-        f.write('|  \\    /   O peration     | Version:  1.6                                   |\n')
-        f.write('|   \\  /    A nd           | Web:      http://www.OpenFOAM.org               |\n')
-        f.write('|    \\/     M anipulation  |                                                 |\n')
-        f.write('\\*---------------------------------------------------------------------------*/\n')
-        f.write('FoamFile\n')
-        f.write('{\n')
-        f.write('    version     2.0;\n')
-        f.write('    format      ascii;\n')
-        f.write('    class       dictionary;\n')
-        f.write('    object      turbineProperties;\n')
-        f.write('}\n')
-        f.write('// * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * //\n')
-        f.write('\n')
-        f.write('globalProperties\n')
-        f.write('{\n')
-        f.write('    outputControl       "timeStep";\n')
-        f.write('    outputInterval       1;\n')
-        f.write('}\n')
-
-        for idx, (x_val, y_val) in enumerate(zip(x,y)):
-            f.write('\n')
-            f.write('turbine%d\n' % idx)
-            f.write('{\n')
-            f.write('    turbineType         "%s";\n' % turbine)
-            f.write('    baseLocation        (%.1f %.1f 0.0);\n' % (x_val,y_val))
-            f.write('    nRadial              64;\n')
-            f.write('    azimuthMaxDis        2.0;\n')
-            f.write('    nAvgSector           1;\n')
-            f.write('    pointDistType       "uniform";\n')
-            f.write('    pointInterpType     "linear";\n')
-            f.write('    bladeUpdateType     "oldPosition";\n')
-            f.write('    epsilon              20.0;\n')
-            f.write('    forceScalar          1.0;\n')
-            f.write('    inflowVelocityScalar 0.94;\n')
-            f.write('    tipRootLossCorrType "Glauert";\n')
-            f.write('    rotationDir         "cw";\n')
-            f.write('    Azimuth              0.0;\n')
-            f.write('    RotSpeed             13.0;\n')
-            f.write('    TorqueGen            20000.0;\n')
-            f.write('    Pitch                0.0;\n')
-            f.write('    NacYaw               270.0;\n')
-            f.write('    fluidDensity         1.225;\n')
-            f.write('}\n')
+    if max_workers:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_make_case_turbine_array, args))
 
+    return [_make_case_turbine_array(a) for a in args]
 
 
+def _make_case_turbine_array(args):
+    """make_turbine_array for one case of make_turbine_arrays, making the constant folder if needed"""
 
+    x, y, filename, turbine, properties = args
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    make_turbine_array(x, y, filename, turbine, properties)
 
+    return filename
@@ -1,23 +1,26 @@
 # Paul Fleming (based on code from Pieter Gebraad)
 # Make the mean slices for the Envision case
 
-from readVTK import *
-import cPickle as pickle
+from wind_tools.slices.readVTK import averageVTKs
+import pickle
 import os
 import glob
 import multiprocessing as mp
 
 
-def doAverage(inFold, Folds, outF):
-    dataType, cellCenters, cellData = averageVTKs(inFold, Folds, fileSlice+'.vtk', createInterpolant=False)
-    d = {'dataType': dataType, 'cellCenters': cellCenters, 'cellData': cellData}
-    pickle.dump(d, file(outF, 'w'))
+def doAverage(inFold, Folds, fileSlice, outF, maxWorkers=None):
+    dataType, cellCenters, cellData, pointsXYZ, cellDataVariance = averageVTKs(inFold, Folds, fileSlice+'.vtk', createInterpolant=False,
+                                                                              maxWorkers=maxWorkers, returnVariance=True)
+    d = {'dataType': dataType, 'cellCenters': cellCenters, 'cellData': cellData, 'cellDataVariance': cellDataVariance}
+    with open(outF, 'wb') as f:
+        pickle.dump(d, f)
 
 
 ## PARAMETERS ##
 startTime = 600 #Seconds into simulation to start the average
 stopTime = 1000
 delta = 10 # Take every x seconds
+maxWorkers = mp.cpu_count() # Size of the pool reading the time folders of each slice
 
 rootDir = os.path.join('somedir')
 sliceFolder = 'sliceDataInstant'
@@ -29,14 +32,9 @@ outputFolder = 'slicePost'
 casesTemp =  os.listdir(rootDir)
 cases = [c for c in casesTemp if (os.path.isdir(os.path.join(rootDir,c,sliceFolder)) or os.path.isdir(os.path.join(rootDir,c,'postProcessing',sliceFolder)))]  
 
-## Set up for parralele
-pool = mp.Pool()
-jobs = []
-
-
 ## LOOP THROUGH THE CASES
 for c in cases:
-    print 'Processing case: %s' % c
+    print('Processing case: %s' % c)
 
     # Define folders (be careful, AL is slightly more nested)
     if os.path.isdir(os.path.join(rootDir,c,sliceFolder)):
@@ -55,7 +53,7 @@ for c in cases:
     timeEnd = timeFolders[-1]
 
     if time1 + startTime >= timeEnd - delta*2:
-        print 'Not enough time files'
+        print('Not enough time files')
         continue    
 
 
@@ -64,7 +62,7 @@ for c in cases:
 
     #timeFoldersLim = [t for t in timeFolders if t > (time1 + startTime)]
     folderListFinal = [str(t) for t in timeFoldersLim]
-    print '...%d folders (originally %d), %d, %d, %d, %d' % (len(timeFoldersLim),len(timeFolders),timeFolders[0],timeFoldersLim[0],timeFolders[-1],timeFoldersLim[-1])
+    print('...%d folders (originally %d), %d, %d, %d, %d' % (len(timeFoldersLim),len(timeFolders),timeFolders[0],timeFoldersLim[0],timeFolders[-1],timeFoldersLim[-1]))
 
     # Get details of fileslices
     fileSlices = os.listdir(os.path.join(inFolder,folderListFinal[0]))
@@ -72,17 +70,15 @@ for c in cases:
     
     # Loop through the file slices
     for fileSlice in fileSlices:
-        print '......Processing %s' % fileSlice
+        print('......Processing %s' % fileSlice)
 
         # First check if outfile already exists
         outFile = os.path.join(outFolder,fileSlice + '.avg_pickle')
         if os.path.exists(outFile):
-            print '.........Already exists! (But running anyway)'
+            print('.........Already exists! (But running anyway)')
             continue        
-        # If it doesn't yet exist can compute the mean
-        p = mp.Process(target=doAverage, args=(inFolder,folderListFinal,outFile))
-        jobs.append(p)
-        p.start()
+        # If it doesn't yet exist can compute the mean, the time folders are spread over a bounded pool
+        doAverage(inFolder, folderListFinal, fileSlice, outFile, maxWorkers=maxWorkers)
 
         #pool.apply_async(doAverage, [inFolder,folderListFinal,outFile])
         #dataType, cellCenters, cellData = averageVTKs(inFolder, folderListFinal, fileSlice+'.vtk', createInterpolant=False)
@@ -91,8 +87,3 @@ for c in cases:
 
 #pool.close()
 #pool.join()
-
-
-for job in jobs:
-    job.join()
-    print "job back"
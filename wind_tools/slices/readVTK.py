@@ -1,6 +1,7 @@
+import re
+import time
 import numpy as np
 import matplotlib.pyplot as plt
-# import time
 
 class Timer(object):
     def __init__(self, name=None):
@@ -16,7 +17,7 @@ class Timer(object):
 
 
 
-def readVTK(filename, createInterpolant=False, conversionMatrix=[], conversionVector=[], projectionVector=[]):
+def readVTK(filename, createInterpolant=False, conversionMatrix=[], conversionVector=[], projectionVector=[], **interpolantArgs):
     """imports standard SOWFA vtk files
 
     input: file = location of vtk-file
@@ -29,6 +30,7 @@ def readVTK(filename, createInterpolant=False, conversionMatrix=[], conversionVe
     {cellCenter vector new frame} = conversionMatrix * {cellCenter vector VTK frame} +  conversionVector
 
     to output an interpolator that you can use to sample specific points, use createInterpolant = True
+    (a SliceInterpolant, further keyword arguments such as method, k and workers are passed on to it)
 
     see example below
 
@@ -36,84 +38,25 @@ def readVTK(filename, createInterpolant=False, conversionMatrix=[], conversionVe
     Pieter Gebraad, 2015
 
     Update Paul Fleming, is VTK file is not all triangles, use a slower, more general approach
-    """
 
-    file = open(filename, 'r')
-    lines = file.readlines()
-    file.close()
-
-    lineCounter = 0
-
-    while lineCounter < len(lines):
-        line = lines[lineCounter].strip()
-
-        if line == 'DATASET POLYDATA':
-            lineCounter += 1
-            line = lines[lineCounter].strip() # read 'POINTS nPoints float'
-            line = line.split()
-            nPoints = int(line[1])
-            #print 'npoints = %d' % nPoints
-            pointsXYZ = np.array([ x.split() for x in lines[lineCounter+1:lineCounter+1+nPoints]]).astype(np.float)
-            lineCounter = lineCounter+nPoints
-
-        if line[0:8] == 'POLYGONS': # read 'POLYGONS nPolygons ...' and compute cell means
-            line = line.split()
-            nPolygons = int(line[1])
-
-            # Test to see if this appears to be triangles ... TBD, just go with broader one for now
-            # try:
-
-            #     polygons = np.array([x.split() for x in lines[lineCounter+1:lineCounter+1+nPolygons]]).astype(np.int)
-            #     polygons = polygons[:, 1:]
-            #     pointsXYZ_tri = pointsXYZ.take(polygons.flatten(1), axis=0)
-            #     cellCenters = np.array([pointsXYZ_tri[:,0].reshape([3,-1]).mean(axis=0),pointsXYZ_tri[:,1].reshape([3,-1]).mean(axis=0),pointsXYZ_tri[:,2].reshape([3,-1]).mean(axis=0)]).transpose()
-            # except:
-            print('not triangular vtk, using lists')
-            # Instead use
-            polygons = [[int(xx) for xx in x.split()[1:]] for x in lines[lineCounter+1:lineCounter+1+nPolygons]]
-            
-            #print 'polygon1'
-            #print polygons[0]
-
-            #print 'xyz'
-            #print pointsXYZ[0,:]
-
-            cellCenters = np.array( [pointsXYZ[verts].mean(axis=0) for verts in polygons] )
-
-            #print 'cell1'
-            #print cellCenters[0,:]
-            ## END OF OLDER ELSE
-
-            lineCounter = lineCounter+nPolygons
-
-            
-
-
-        if line[0:9] == 'CELL_DATA':
-            lineCounter += 1
-            line = lines[lineCounter].strip()  # read 'FIELD attributes nAttributes'
-            line = line.split()
-            nAttributes = int(line[2])
-
-            cellData = list()
-            dataType = list()
-            for att in range(0, nAttributes):
-                lineCounter += 1
-                line = lines[lineCounter].strip()
-                fieldData = line.split()# read 'U 3 nPolygons float'
-                if fieldData[3] == 'float' and int(fieldData[2]) == nPolygons:
-                    dataType.append(fieldData[0])
-                    cd = np.array([ x.split() for x in lines[lineCounter+1:lineCounter+1+nPolygons]]).astype(np.float)
-                    if projectionVector != []:
-                        cd = np.dot(cd, projectionVector)
-                    cellData.append(cd)
-                else:
-                    print('readVTK FORMAT ERROR')
+    Sections are now converted in bulk with numpy, polygons of mixed sizes go through offsets/connectivity arrays
 
-        lineCounter += 1
+    Besides ASCII files, BINARY legacy files and XML PolyData (.vtp) files with raw appended (or ascii)
+    data arrays are read, binary arrays are used in place with np.frombuffer
+    """
 
+    with open(filename, 'rb') as f:
+        content = f.read()
+
+    if _isXML(content):
+        dataType, cellCenters, cellData, pointsXYZ = _readVTP(content, filename, projectionVector)
+    elif _isBinary(content):
+        dataType, cellCenters, cellData, pointsXYZ = _readBinaryPolyData(content, filename, projectionVector)
+    else:
+        dataType, cellCenters, cellData, pointsXYZ = _readASCIIPolyData(content, filename, projectionVector)
+    nAttributes = len(dataType)
 
-    if conversionMatrix != [] and conversionVector != []:
+    if len(conversionMatrix) > 0 and len(conversionVector) > 0:
         cellCenters = (np.dot(conversionMatrix, cellCenters.transpose()).transpose()) + conversionVector
 
     #Drop 3rd dimension (instead of using conversion matrix, looks like conversion matrix works fine)
@@ -130,57 +73,624 @@ def readVTK(filename, createInterpolant=False, conversionMatrix=[], conversionVe
             cellData = cellData[0]
         return dataType, cellCenters, cellData, pointsXYZ
     else:
-        from scipy.interpolate import griddata
-        from copy import copy
-        interpolants = list()
-        #print cellCenters.shape
-        #print cellData[att].shape
-        for att in range(0, nAttributes):
-            def interpolant(samplePoints):
-                sampledData = griddata(cellCenters, cellData[att], samplePoints, method='nearest')
-                return sampledData
-            interpolants.append(copy(interpolant))
+        interpolants = _createInterpolants(cellCenters, cellData, **interpolantArgs)
         if nAttributes == 1:
             dataType = dataType[0]
             interpolants = interpolants[0]
         return dataType, interpolants, pointsXYZ
 
 
+class SliceInterpolant(object):
+    """samples the cell data of a slice at arbitrary points
 
-def averageVTKs(basePath, timeFolders, filename=None, vtkfile='U_slice_1.vtk', createInterpolant=True, conversionMatrix=[], conversionVector=[], projectionVector=[]):
+    The spatial index (a cKDTree, or a Delaunay triangulation for method='linear') is built once,
+    every call only queries it, so the same slice can be sampled many times cheaply. Interpolants
+    of other data on the same cells can share the index through the tree and triangulation arguments.
 
-    from os import path
-    from sys import stdout
+    input: cellCenters = (nCells, nDims) centers of the cells
+    cellData = (nCells, ...) values at the cell centers
+    method = 'nearest' (the default, as before with griddata) or 'linear'
+    k = number of nearest cells to combine by inverse distance weighting, 1 is plain nearest neighbour
+    power = power of the inverse distance weights
+    workers = number of threads for the tree queries, -1 uses all cores
+    batchSize = maximum number of points per tree query, limits the memory of queries with large k
+    tree, triangulation = an index built earlier on the same cellCenters
 
-    nSamples = len(timeFolders)
+    call: interpolant(samplePoints, k=None, workers=None)
+    samplePoints = tuple of coordinate arrays (as for griddata) or an (..., nDims) array
+    returns the sampled data, of shape points shape + cell data shape
+    """
 
-    print('reading and averaging hub-height flow field')
-    for dataI in range(nSamples):
+    def __init__(self, cellCenters, cellData, method='nearest', k=1, power=2., workers=1, batchSize=None,
+                 tree=None, triangulation=None):
+
+        from scipy.spatial import cKDTree, Delaunay
+
+        self.cellCenters = np.asarray(cellCenters, dtype=float)
+        self.cellData = np.asarray(cellData)
+        if len(self.cellData) != len(self.cellCenters):
+            raise ValueError('cellData has %d rows for %d cells' % (len(self.cellData), len(self.cellCenters)))
+        self.method = method
+        self.k = k
+        self.power = power
+        self.workers = workers
+        self.batchSize = batchSize
+        self.tree = tree
+        self.triangulation = triangulation
+
+        if method == 'nearest':
+            if self.tree is None:
+                self.tree = cKDTree(self.cellCenters)
+        elif method == 'linear':
+            from scipy.interpolate import LinearNDInterpolator
+            if self.triangulation is None:
+                self.triangulation = Delaunay(self.cellCenters)
+            self._linear = LinearNDInterpolator(self.triangulation, self.cellData.reshape(len(self.cellData), -1))
+        else:
+            raise ValueError('Unknown interpolation method %s' % method)
 
-        # show progress
-        progress = 100.*(dataI+1)/nSamples
-        if dataI > 0:
-            stdout.write("\b"*16)
-        stdout.write("progress: %3s %%" % int(progress))
+    def __call__(self, samplePoints, k=None, workers=None):
 
-    if not filename:
-        filename = path.join(basePath,timeFolders[dataI],vtkfile)
-        dataType,cellCenters,cellData,pointsXYZ = readVTK(filename, False, np.array([[1.0, 0, 0], [0, 1.0, 0]]), np.array([[0.0, 0.0]]))
+        points, shape = self._samplePoints(samplePoints)
+        valueShape = self.cellData.shape[1:]
 
-        if dataI == 0:
-            cellDataMean = cellData/nSamples
+        if self.method == 'linear':
+            sampledData = self._linear(points)
         else:
-            cellDataMean += cellData/nSamples
+            k = self.k if k is None else k
+            workers = self.workers if workers is None else workers
+            batchSize = self.batchSize or max(len(points), 1)
+            sampledData = np.empty((len(points),) + valueShape, dtype=np.result_type(self.cellData, float))
+            for start in range(0, len(points), batchSize):
+                sampledData[start:start + batchSize] = self._nearest(points[start:start + batchSize], k, workers)
+
+        return sampledData.reshape(shape + valueShape)
+
+    def _samplePoints(self, samplePoints):
+        """(nPoints, nDims) array of the sample points and the shape to return them in"""
+
+        if isinstance(samplePoints, tuple):
+            arrays = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in samplePoints])
+            return np.column_stack([x.ravel() for x in arrays]), arrays[0].shape
+
+        samplePoints = np.asarray(samplePoints, dtype=float)
+        return samplePoints.reshape(-1, samplePoints.shape[-1]), samplePoints.shape[:-1]
+
+    def _nearest(self, points, k, workers):
+        """nearest neighbour or inverse distance weighted values at points"""
+
+        k = min(k, len(self.cellCenters))
+        if k <= 1:
+            distance, index = self.tree.query(points, workers=workers)
+            return self.cellData[index]
+
+        distance, index = self.tree.query(points, k=k, workers=workers)
+        with np.errstate(divide='ignore'):
+            weights = distance ** -self.power
+
+        # Points on a cell center take the value of that cell
+        exact = np.isinf(weights)
+        onCenter = exact.any(axis=1)
+        weights[onCenter] = exact[onCenter]
+        weights /= weights.sum(axis=1, keepdims=True)
+
+        return np.einsum('pk,pk...->p...', weights, self.cellData[index])
+
+
+def _createInterpolants(cellCenters, cellData, **interpolantArgs):
+    """one SliceInterpolant per attribute in cellData, all sharing the spatial index of the first"""
+
+    interpolants = list()
+    for cd in cellData:
+        if len(interpolants) > 0:
+            interpolantArgs['tree'] = interpolants[0].tree
+            interpolantArgs['triangulation'] = interpolants[0].triangulation
+        interpolants.append(SliceInterpolant(cellCenters, cd, **interpolantArgs))
+
+    return interpolants
+
+
+def _readASCIIPolyData(content, filename, projectionVector=[]):
+    """geometry and cell data of an ASCII legacy file"""
+
+    # Each section is located by its keyword and converted in bulk
+    pos = _findSection(content, b'DATASET POLYDATA', filename)
+    pos = _findSection(content, b'POINTS', filename, pos)
+    nPoints = int(_headerLine(content, pos)[1])
+    pointsXYZ = _parseNumbers(content, _nextLine(content, pos), 3 * nPoints, float).reshape(nPoints, 3)
+
+    pos = _findSection(content, b'POLYGONS', filename, pos)
+    header = _headerLine(content, pos)
+    nPolygons, size = int(header[1]), int(header[2])
+    polygonStart = _nextLine(content, pos)
+    polygons = _parseNumbers(content, polygonStart, size, np.int64)
+    cellCenters = _polygonCenters(pointsXYZ, polygons, nPolygons, content, polygonStart)
+
+    pos = _findSection(content, b'CELL_DATA', filename, pos)
+    dataType, cellData = _readCellData(content, pos, projectionVector)
+
+    return dataType, cellCenters, cellData, pointsXYZ
+
+
+def _readBinaryPolyData(content, filename, projectionVector=[]):
+    """geometry and cell data of a BINARY legacy file"""
+
+    sections = _binarySections(content, filename)
+    for keyword in ['POINTS', 'POLYGONS', 'CELL_DATA']:
+        if keyword not in sections:
+            raise ValueError('No %s in %s' % (keyword, filename))
+
+    header, pos = sections['POINTS']
+    nPoints = int(header[1])
+    pointsXYZ = np.frombuffer(content, dtype=_legacyType(header[2]), count=3 * nPoints, offset=pos).reshape(nPoints, 3)
+    pointsXYZ = pointsXYZ.astype(float)
+
+    header, pos = sections['POLYGONS']
+    nPolygons, size = int(header[1]), int(header[2])
+    polygons = np.frombuffer(content, dtype='>i4', count=size, offset=pos)
+    cellCenters = _polygonCenters(pointsXYZ, polygons, nPolygons)
+
+    header, pos = sections['CELL_DATA']
+    dataType, cellData = _readCellData(content, pos, projectionVector, binary=True)
+
+    return dataType, cellCenters, cellData, pointsXYZ
+
+
+# Legacy VTK binary data is always big-endian
+_LEGACY_TYPES = {'float': '>f4', 'double': '>f8',
+                 'char': '>i1', 'unsigned_char': '>u1', 'short': '>i2', 'unsigned_short': '>u2',
+                 'int': '>i4', 'unsigned_int': '>u4', 'long': '>i8', 'unsigned_long': '>u8',
+                 'vtktypeint64': '>i8', 'vtkIdType': '>i4'}
+
+
+def _legacyType(name):
+    """numpy dtype of a legacy VTK data type name"""
+
+    if name not in _LEGACY_TYPES:
+        raise ValueError('Unsupported VTK data type %s' % name)
+    return np.dtype(_LEGACY_TYPES[name])
+
+
+def _isBinary(content):
+    """True if the third header line of a legacy file says BINARY"""
+
+    lines = content[:1024].split(b'\n', 3)
+    return len(lines) > 3 and lines[2].strip().upper() == b'BINARY'
+
+
+def _skipSpace(content, pos):
+    """byte offset of the first non white space character from pos"""
+
+    while pos < len(content) and content[pos] in b' \t\r\n':
+        pos += 1
+    return pos
+
+
+def _skipMetadata(content, pos):
+    """skip an optional METADATA block (ended by a blank line) starting at pos"""
+
+    pos = _skipSpace(content, pos)
+    if content.startswith(b'METADATA', pos):
+        end = content.find(b'\n\n', pos)
+        pos = len(content) if end < 0 else _skipSpace(content, end)
+    return pos
+
+
+def _binarySections(content, filename):
+    """walk the sections of a BINARY legacy file
+
+    Keywords can't be searched for in binary files (the data could contain them), but the size
+    of every block follows from its header line, so the sections are stepped through in order
+
+    output: dict of keyword -> (words of the header line, byte offset of the data)
+    """
+
+    pos = _findSection(content, b'DATASET POLYDATA', filename)
+    pos = _nextLine(content, pos)
+    sections = dict()
+    while True:
+        pos = _skipMetadata(content, pos)
+        if pos >= len(content):
+            break
+        header = _headerLine(content, pos)
+        keyword = header[0]
+        if keyword in ['CELL_DATA', 'POINT_DATA']:
+            # Attributes are parsed by _readCellData from the header line
+            sections.setdefault(keyword, (header, pos))
+            if keyword == 'CELL_DATA':
+                break
+            raise ValueError('POINT_DATA before CELL_DATA is not supported in binary file %s' % filename)
+        dataStart = _nextLine(content, pos)
+        if keyword == 'POINTS':
+            nBytes = 3 * int(header[1]) * _legacyType(header[2]).itemsize
+        elif keyword in ['VERTICES', 'LINES', 'POLYGONS', 'TRIANGLE_STRIPS']:
+            nBytes = 4 * int(header[2])
+        else:
+            raise ValueError('Unsupported section %s in binary file %s' % (keyword, filename))
+        sections[keyword] = (header, dataStart)
+        pos = dataStart + nBytes
+
+    return sections
+
+
+def _isXML(content):
+    """True for XML (.vtp) files"""
+    return content[:1024].lstrip().startswith((b'<?xml', b'<VTKFile'))
+
+
+# XML VTK data types, the byte order is set by the file
+_XML_TYPES = {'Float32': 'f4', 'Float64': 'f8',
+              'Int8': 'i1', 'UInt8': 'u1', 'Int16': 'i2', 'UInt16': 'u2',
+              'Int32': 'i4', 'UInt32': 'u4', 'Int64': 'i8', 'UInt64': 'u8'}
+
+
+def _readVTP(content, filename, projectionVector=[], geometry=True):
+    """geometry and cell data of an XML PolyData (.vtp) file
+
+    Data arrays can be raw appended data or ascii, compressed and base64 encoded data are not supported
+    With geometry=False only dataType and cellData are returned
+    """
+
+    import xml.etree.ElementTree as ET
+
+    # The appended data is not valid XML, parse the header in front of it only
+    appended = content.find(b'<AppendedData')
+    if appended >= 0:
+        root = ET.fromstring(content[:appended] + b'</VTKFile>')
+        encoding = re.match(rb'<AppendedData[^>]*encoding="(\w+)"', content[appended:appended + 256])
+        if encoding is None or encoding.group(1) != b'raw':
+            raise ValueError('Only raw appended data is supported in %s' % filename)
+        rawStart = content.index(b'_', appended) + 1
+    else:
+        root = ET.fromstring(content)
+        rawStart = None
+
+    if root.get('type') != 'PolyData':
+        raise ValueError('%s is not a PolyData file' % filename)
+    if root.get('compressor'):
+        raise ValueError('Compressed data in %s is not supported' % filename)
+    order = '<' if root.get('byte_order', 'LittleEndian') == 'LittleEndian' else '>'
+    headerType = np.dtype(order + _XML_TYPES[root.get('header_type', 'UInt32')])
+
+    def readArray(element):
+        dtype = np.dtype(order + _XML_TYPES[element.get('type')])
+        nComponents = int(element.get('NumberOfComponents', 1))
+        dataFormat = element.get('format')
+        if dataFormat == 'appended' and rawStart is not None:
+            start = rawStart + int(element.get('offset'))
+            nBytes = int(np.frombuffer(content, dtype=headerType, count=1, offset=start)[0])
+            data = np.frombuffer(content, dtype=dtype, count=nBytes // dtype.itemsize, offset=start + headerType.itemsize)
+        elif dataFormat == 'ascii':
+            data = np.fromstring(element.text or '', dtype=dtype.newbyteorder('='), sep=' ')
+        else:
+            raise ValueError('Unsupported %s data array %s in %s' % (dataFormat, element.get('Name'), filename))
+        return data.reshape(-1, nComponents)
+
+    piece = root.find('PolyData/Piece')
+    if piece is None:
+        raise ValueError('No Piece in %s' % filename)
+    nPolygons = int(piece.get('NumberOfPolys', 0))
+
+    dataType = list()
+    cellData = list()
+    for element in piece.findall('CellData/DataArray'):
+        cd = readArray(element)
+        if len(cd) != nPolygons:
+            print('readVTK FORMAT ERROR')
+            continue
+        dataType.append(element.get('Name'))
+        if len(projectionVector) > 0:
+            cd = np.dot(cd, projectionVector)
+        cellData.append(cd)
+
+    if not geometry:
+        return dataType, cellData
+
+    pointsXYZ = readArray(piece.find('Points/DataArray')).astype(float)
+    polys = dict((element.get('Name'), readArray(element).ravel()) for element in piece.findall('Polys/DataArray'))
+    if 'connectivity' not in polys or 'offsets' not in polys:
+        raise ValueError('No Polys in %s' % filename)
+    counts = np.diff(polys['offsets'], prepend=0)
+    cellCenters = _csrCenters(pointsXYZ, polys['connectivity'], counts)
+
+    return dataType, cellCenters, cellData, pointsXYZ
+
+
+def _findSection(content, keyword, filename, start=0):
+    """byte offset of the line starting with keyword"""
+
+    if content.startswith(keyword, start):
+        return start
+    pos = content.find(b'\n' + keyword, start)
+    if pos < 0:
+        raise ValueError('No %s in %s' % (keyword.decode(), filename))
+    return pos + 1
+
+
+def _nextLine(content, pos):
+    """byte offset of the line after the one at pos"""
+    return content.index(b'\n', pos) + 1
+
+
+def _headerLine(content, pos):
+    """the words of the line at pos"""
+    return content[pos:_nextLine(content, pos)].decode('ascii').split()
+
+
+def _parseNumbers(content, start, count, dtype, end=None):
+    """bulk convert count whitespace separated numbers starting at byte offset start"""
+
+    if end is None:
+        # Rough upper bound of the section length, parsing stops after count numbers anyway
+        end = content.find(b'\n', start + 64 * count)
+        end = len(content) if end < 0 else end
+    data = np.fromstring(content[start:end], dtype=dtype, count=count, sep=' ')
+
+    return data
+
+
+def _polygonCenters(pointsXYZ, polygons, nPolygons, content=None, polygonStart=None):
+    """cell centers from the flat VTK polygon list (n, i_0, .. i_n-1, n, ...)
+
+    All triangles (or all quads, etc.) are reshaped directly, mixed polygons are
+    converted to offsets / connectivity and summed with np.add.reduceat
+    """
+
+    # Uniform polygons, the usual case
+    if len(polygons) % nPolygons == 0:
+        nVerts = len(polygons) // nPolygons - 1
+        table = polygons.reshape(nPolygons, nVerts + 1)
+        if nVerts > 0 and np.all(table[:, 0] == nVerts):
+            return np.column_stack([pointsXYZ[table[:, 1:], i].mean(axis=1) for i in range(3)])
+
+    offsets = _polygonOffsets(polygons, nPolygons, content, polygonStart)
+    counts = polygons[offsets]
+    isVertex = np.ones(len(polygons), dtype=bool)
+    isVertex[offsets] = False
+    connectivity = polygons[isVertex]
+
+    return _csrCenters(pointsXYZ, connectivity, counts)
+
+
+def _csrCenters(pointsXYZ, connectivity, counts):
+    """cell centers from the connectivity of all polygons and the number of vertices of each"""
+
+    starts = np.cumsum(counts) - counts
+
+    return np.column_stack([np.add.reduceat(pointsXYZ[connectivity, i], starts) / counts for i in range(3)])
+
+
+def _polygonOffsets(polygons, nPolygons, content=None, polygonStart=None):
+    """positions of the vertex counts in the flat polygon list"""
+
+    if content is not None:
+
+        # In ASCII files every polygon is on its own line, so count the numbers per line
+        polygonEnd = content.find(b'\nCELL_DATA', polygonStart)
+        polygonEnd = len(content) if polygonEnd < 0 else polygonEnd + 1
+        section = np.frombuffer(content, dtype=np.uint8, count=polygonEnd - polygonStart, offset=polygonStart)
+        lineEnds = np.flatnonzero(section == ord('\n'))
+        lineEnds = lineEnds[:nPolygons + 1]
+        section = section[:lineEnds[-1] + 1] if len(lineEnds) else section
+        isSpace = (section == ord(' ')) | (section == ord('\n')) | (section == ord('\t')) | (section == ord('\r'))
+        isStart = ~isSpace
+        isStart[1:] &= isSpace[:-1]
+        line = np.cumsum(section == ord('\n'))[isStart]
+        numbersPerLine = np.bincount(line)
+        numbersPerLine = numbersPerLine[numbersPerLine > 0][:nPolygons]
+        offsets = np.cumsum(numbersPerLine) - numbersPerLine
+        if len(offsets) == nPolygons and offsets[-1] < len(polygons) and np.all(polygons[offsets] == numbersPerLine - 1):
+            return offsets
+
+    # Otherwise walk the counts
+    offsets = np.empty(nPolygons, dtype=np.int64)
+    pos = 0
+    for i in range(nPolygons):
+        offsets[i] = pos
+        pos += polygons[pos] + 1
+
+    return offsets
+
+
+def _readCellData(content, pos, projectionVector=[], binary=False):
+    """parse the attributes of a CELL_DATA block
+
+    input: content = bytes of the vtk-file, pos = byte offset of the 'CELL_DATA nPolygons' line
+    binary = True for BINARY legacy files, the arrays are then used in place (big-endian, read-only)
+    outputs
+    dataType = list of attribute names
+    cellData = list of attribute arrays
+    """
+
+    nPolygons = int(_headerLine(content, pos)[1])
+    pos = _nextLine(content, pos)
+    line = _headerLine(content, pos)  # read 'FIELD attributes nAttributes'
+    nAttributes = int(line[2])
+    if binary:
+        # Binary blocks are stepped over by their size, pos is kept at the start of the next header
+        pos = _nextLine(content, pos)
+
+    cellData = list()
+    dataType = list()
+    for att in range(0, nAttributes):
+        pos = _skipMetadata(content, pos) if binary else _nextLine(content, pos)
+        fieldData = _headerLine(content, pos)# read 'U 3 nPolygons float'
+        if fieldData[3] in ['float', 'double'] and int(fieldData[2]) == nPolygons:
+            dataType.append(fieldData[0])
+            nComponents = int(fieldData[1])
+            dataStart = _nextLine(content, pos)
+
+            if binary:
+                dtype = _legacyType(fieldData[3])
+                cd = np.frombuffer(content, dtype=dtype, count=nComponents * nPolygons, offset=dataStart)
+                cd = cd.reshape(nPolygons, nComponents)
+                dataEnd = dataStart + cd.nbytes + 1
+            else:
+                # The next attribute starts at the next header line
+                if att < nAttributes - 1:
+                    match = _ATTRIBUTE_HEADER.search(content, dataStart)
+                    dataEnd = match.start() + 1
+                else:
+                    dataEnd = None
+                cd = _parseNumbers(content, dataStart, nComponents * nPolygons, float, dataEnd).reshape(nPolygons, nComponents)
+            if len(projectionVector) > 0:
+                cd = np.dot(cd, projectionVector)
+            cellData.append(cd)
+            if dataEnd is not None:
+                pos = dataEnd - 1
+        else:
+            print('readVTK FORMAT ERROR')
+
+    return dataType, cellData
+
+_ATTRIBUTE_HEADER = re.compile(rb'\n[A-Za-z_][^\s]* +\d+ +\d+ +[A-Za-z]+[ \t\r]*\n')
+
+
+def readVTKCellData(filename, projectionVector=[], offset=None):
+    """imports only the cell data of a SOWFA vtk file, skipping the geometry
+
+    input: file = location of vtk-file
+    projectionVector = as for readVTK
+    offset = byte offset of the CELL_DATA line, if known (e.g. from an earlier time step of the same slice,
+             which will have identical geometry), so the geometry doesn't even have to be read
+             (not used for .vtp files, which are located through their XML header)
+
+    outputs
+    dataType = OpenFOAM label of measurement, a list if there are several
+    cellData = sampling values, a list if there are several
+    offset = byte offset of the CELL_DATA line in this file
+    """
+
+    with open(filename, 'rb') as f:
+        head = f.read(1024)
+        f.seek(0)
+        if _isXML(head):
+            # Appended arrays are located from the XML header, the data itself is used in place
+            dataType, cellData = _readVTP(f.read(), filename, projectionVector, geometry=False)
+            offset = None
+        else:
+            binary = _isBinary(head)
+            content = None
+            if offset is not None:
+                f.seek(offset)
+                content = f.read()
+                if not content.startswith(b'CELL_DATA'):
+                    f.seek(0)
+                    content = None
+            if content is None:
+                content = f.read()
+                if binary:
+                    offset = _binarySections(content, filename)['CELL_DATA'][1]
+                else:
+                    offset = _findSection(content, b'CELL_DATA', filename)
+                content = content[offset:]
+            dataType, cellData = _readCellData(content, 0, projectionVector, binary)
+
+    if len(dataType) == 1:
+        dataType = dataType[0]
+        cellData = cellData[0]
+
+    return dataType, cellData, offset
+
+
+def averageVTKs(basePath, timeFolders, filename=None, vtkfile='U_slice_1.vtk', createInterpolant=True, conversionMatrix=[], conversionVector=[], projectionVector=[],
+                maxWorkers=None, returnVariance=False, **interpolantArgs):
+    """time-average a slice over several time folders
+
+    The geometry is parsed once, from the first time folder. For the other time folders only the
+    CELL_DATA block is read, and a running mean and variance are kept, so memory use does not
+    grow with the number of time steps.
+
+    input: basePath = folder holding the time folders
+    timeFolders = names of the time folders to average over
+    filename, vtkfile = name of the vtk-file in each time folder (filename takes precedence if given)
+    createInterpolant, conversionMatrix, conversionVector, projectionVector, interpolantArgs = as for readVTK,
+        by default the cell centers are converted to 2D (x, y)
+    maxWorkers = if more than 1, split the time folders over a pool of this many processes
+    returnVariance = also return the variance over time of the cell data
+
+    outputs
+    dataType, cellCenters, cellDataMean, pointsXYZ (and cellDataVariance if returnVariance)
+    or with createInterpolant dataType, interpolant, pointsXYZ
+    """
+
+    from os import path
+    from sys import stdout
+
+    if filename:
+        vtkfile = filename
+    filenames = [path.join(basePath, t, vtkfile) for t in timeFolders]
+    nSamples = len(filenames)
+
+    if len(conversionMatrix) == 0 and len(conversionVector) == 0:
+        conversionMatrix = np.array([[1.0, 0, 0], [0, 1.0, 0]])
+        conversionVector = np.array([[0.0, 0.0]])
+
+    # Geometry from the first file only
+    dataType, cellCenters, cellData, pointsXYZ = readVTK(filenames[0], False, conversionMatrix, conversionVector, projectionVector)
+
+    print('reading and averaging hub-height flow field')
+    if maxWorkers is not None and maxWorkers > 1:
+        import multiprocessing as mp
+
+        # Contiguous groups of files, a few per worker so progress can be shown
+        nGroups = min(nSamples, 4 * maxWorkers)
+        groups = [list(g) for g in np.array_split(filenames, nGroups)]
+        stats = None
+        nDone = 0
+        # The workers are terminated on leaving the block, also if a worker or combine raises
+        with mp.Pool(processes=maxWorkers) as pool:
+            for groupStats in pool.imap(_accumulateCellData, [(g, projectionVector) for g in groups]):
+                stats = groupStats if stats is None else [s.combine(gs) for s, gs in zip(stats, groupStats)]
+                nDone += 1
+                stdout.write("\rprogress: %3s %%" % int(100. * nDone / nGroups))
+            pool.close()
+            pool.join()
+    else:
+        stats = _accumulateCellData((filenames, projectionVector), progress=True)
     stdout.write("\n")
+
+    cellDataMean = [s.mean for s in stats]
+    cellDataVariance = [s.variance() for s in stats]
+    if len(stats) == 1:
+        cellDataMean = cellDataMean[0]
+        cellDataVariance = cellDataVariance[0]
+
     if createInterpolant==False:
+        if returnVariance:
+            return dataType, cellCenters, cellDataMean, pointsXYZ, cellDataVariance
         return dataType, cellCenters, cellDataMean, pointsXYZ
     else:
-        from scipy.interpolate import griddata
-        from copy import copy
-        def interpolant(samplePoints):
-            sampledData = griddata(cellCenters, cellDataMean, samplePoints, method='nearest')
-            return sampledData
-        return dataType, copy(interpolant), pointsXYZ
+        if len(stats) == 1:
+            interpolants = _createInterpolants(cellCenters, [cellDataMean], **interpolantArgs)[0]
+        else:
+            interpolants = _createInterpolants(cellCenters, cellDataMean, **interpolantArgs)
+        return dataType, interpolants, pointsXYZ
+
+
+def _accumulateCellData(args, progress=False):
+    """running statistics (one RunningStats per attribute) of the cell data of a list of files"""
+
+    from sys import stdout
+    from wind_tools.stats import RunningStats
+
+    filenames, projectionVector = args
+    stats = None
+    offset = None
+    for dataI, filename in enumerate(filenames):
+        dataType, cellData, offset = readVTKCellData(filename, projectionVector, offset)
+        if not isinstance(cellData, list):
+            cellData = [cellData]
+        if stats is None:
+            stats = [RunningStats() for cd in cellData]
+        for s, cd in zip(stats, cellData):
+            s.update(cd)
+
+        # show progress
+        if progress:
+            stdout.write("\rprogress: %3s %%" % int(100. * (dataI + 1) / len(filenames)))
+
+    return stats
 
 # Important note, example below probably doesn't work
 
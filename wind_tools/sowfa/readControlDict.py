@@ -1,23 +1,15 @@
-def readControlDict(file = 'controlDict'):
+from wind_tools.sowfa.read_foam_dict import read_foam_entries
 
-    f = open(file, "r")
-    lines = f.readlines()
-    f.close()
-    
-    turbineIndices = list()
-    properties = dict()
-    lineI = 0
 
-    def getfromline(line):
-        x = line.split(';')
-        x = x[0].split()
-        x = float(x[1])
-        return x
+def readControlDict(file = 'controlDict'):
+    # Read the properties of a controlDict with read_foam_entries, which resolves
+    # #include files and $variables, as in the SOWFA setUp files
 
-    while lineI < len(lines):
-        line = lines[lineI].strip()
-        if "startTime" in line and not "startFrom" in line:
-            properties['start time'] = getfromline(line)
-        lineI += 1
+    startTime = read_foam_entries(file, 'startTime')
+
+    properties = dict()
+    if startTime:
+        # A later entry overrides an earlier one
+        properties['start time'] = float(startTime[-1])
 
     return properties
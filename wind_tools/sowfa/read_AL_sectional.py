@@ -1,15 +1,21 @@
 ## Read AL sectional, based on Matt Chuchfields's MATLAB code
 # Paul Fleming
 # 4/27/2016
-# Code is a bit rough but works, not sure how much it will be needed going forward but good to have
+# Rewritten to parse with numpy in blocks, returning one (time, turbine, blade, node) array
 
 import numpy as np
 import os
 
+from wind_tools.cache import file_signature, get_cache_file, read_cache_meta, write_cache
 
-def read_AL_sectional(dirName,varName):
+
+def read_AL_sectional(dirName,varName,memmap=False,cache_dir=None):
     # Function to read section data from actuator line which is sectional by node
     # Inputs are the directory name and the filename (varName)
+    # memmap -- if True, convert the file once to a binary copy (kept as a wind_tools.cache file, by default next to
+    #           the file, or in cache_dir) and return a read-only memory map of it. The file is converted in blocks,
+    #           so it doesn't have to fit in memory
+    # An incomplete last time step (of a running case) is left out
 
     # Outputs
     #nTurbine
@@ -17,133 +23,278 @@ def read_AL_sectional(dirName,varName):
     #time
     #dt
     #nVal -- number of elements along blade
-    #data -- the data is a 2D list (turbine, blade) and then an np matrix where rows are time, columns are element 
-
-    # This is from Matt's code, not sure I need it yet
-    # Not yet converted from MATLAB
-    # Get list of times.
-    # t = dir(dirName);
-    # t = t(3:end);
-    # for j = 1:length(t)
-    #     times{j} = t(j).name;
+    #data -- (time, turbine, blade, element) array, data[:, t, b, :] has rows time and columns element
 
-    # Read in the file
     filename = os.path.join(dirName,varName)
-    print 'Reading file %s' % filename
-    file = open(filename, 'r')
-    lines = file.readlines()
-    file.close()
-
-    # Figure out how many turbines and blades on each turbine and elements per blade there are.
-    tIdx = 1 # skip the headerline
-    t = lines[tIdx]
-    nTurbine = 0
-    tNum = -1
-    bNum = -1
-    nVal = []
-    nBlade = []
-    while (len(t) > 1):
-        tNumP = tNum
-        bNumP = bNum
-        data = t.rstrip().split(' ')
-        tNum = int(data[0])
-        bNum = int(data[1])
-        if (tNum != tNumP):
-            nTurbine = nTurbine + 1
-            nVal.append(len(data) - 4)
-        if (bNum != bNumP):
-            nBlade.append(bNum + 1);
-            # nBlade = bNum + 1
-        #nVal[nTurbine] = len(data) - 4;
-        
-        tIdx+=1
-        t = lines[tIdx]
-
-    # Correct nBlade at the end to only last blade values
-    nBlade = nBlade[ len(nBlade)/nTurbine-1::len(nBlade)/nTurbine ]
-
-    # For simplicity for now, assume matching number of blades and values
-    nBlade = nBlade[0]
-    nVal = nVal[0]
-
-    # print nTurbine, nBlade, nVal
-
-    # Now trim the data down, remove empty rows and header
-    lines = [l for l in lines[1:] if len(l) > 2]
-
-    # get just the data components in the form of a 2D NP array
-    print '...extracting data'
-    data = np.array([[float(x) for x in l.rstrip().split(' ') ] for l in lines])
-
-    # print data[0:2,]
+    print('Reading file %s' % filename)
+
+    if memmap:
+        rows, layout = _read_AL_sectional_cache(filename, cache_dir)
+    else:
+        layout = _read_layout(filename)
+        rows = _read_rows(filename, layout)
+
+    nTurbine, nBlade, nVal = layout['nTurbine'], layout['nBlade'], layout['nVal']
 
     # can get time from data directly
-    time = data[::nTurbine*nBlade,2] - data[0,2]
-    dt = time[1] - time[0]
-    # print time[0:5] 
+    time = rows[::nTurbine*nBlade,2] - rows[0,2] if len(rows) > 0 else np.empty(0)
+    dt = time[1] - time[0] if len(time) > 1 else np.nan
+
+    # Rows are ordered by time, turbine and blade, so the data is a reshaped view
+    data = rows[:,4:].reshape(len(time), nTurbine, nBlade, nVal)
+
+    return (nTurbine,nBlade,time,dt,nVal,data)
+
+
+def _read_layout(filename):
+    # The number of turbines, blades and elements from the first time step of a sectional file
+    # Rows are: turbine blade time dt value_0 ... value_nVal-1, a time step can end with a blank line
+
+    with open(filename, 'rb') as f:
+        header = f.readline()
+        turbineBlades = []
+        firstTime = None
+        nVal = None
+        for line in f:
+            data = line.split()
+            if len(data) == 0:
+                if len(turbineBlades) > 0:
+                    break
+                continue
+            if firstTime is None:
+                firstTime = data[2]
+            elif data[2] != firstTime:
+                break
+            turbineBlades.append((int(data[0]), int(data[1])))
+            if nVal is None:
+                nVal = len(data) - 4
+            elif len(data) - 4 != nVal:
+                raise ValueError('Blades with different numbers of elements are not supported in %s' % filename)
+
+    if len(turbineBlades) == 0:
+        raise ValueError('No data in %s' % filename)
+
+    # For simplicity, assume matching number of blades on all turbines
+    nTurbine = len(set(t for t, b in turbineBlades))
+    nBlade = len(turbineBlades) // nTurbine
+    if nTurbine * nBlade != len(turbineBlades):
+        raise ValueError('Turbines with different numbers of blades are not supported in %s' % filename)
+
+    return {'headerBytes': len(header), 'nTurbine': nTurbine, 'nBlade': nBlade, 'nVal': nVal}
+
+
+def _iter_rows(filename, layout, blockBytes=2**26):
+    # Parse the rows of a sectional file as (nRows, 4 + nVal) arrays, in blocks of whole time steps
+
+    rowLength = layout['nVal'] + 4
+    rowsPerStep = layout['nTurbine'] * layout['nBlade']
+
+    with open(filename, 'rb') as f:
+        f.seek(layout['headerBytes'])
+        rest = b''
+        pending = np.empty((0, rowLength))
+        while True:
+            chunk = f.read(blockBytes)
+            if len(chunk) == 0:
+                break
+
+            # Parse up to the last complete line, the rest goes with the next block
+            chunk = rest + chunk
+            cut = chunk.rfind(b'\n') + 1
+            rest = chunk[cut:]
+            values = np.fromstring(chunk[:cut], dtype=float, sep=' ')
+            rows = values[:len(values) - len(values) % rowLength].reshape(-1, rowLength)
+
+            # Only whole time steps are handed out
+            if len(pending) > 0:
+                rows = np.concatenate([pending, rows])
+            nSteps = len(rows) // rowsPerStep
+            pending = rows[nSteps * rowsPerStep:]
+            if nSteps > 0:
+                yield rows[:nSteps * rowsPerStep]
+
+
+def _read_rows(filename, layout):
+    # All rows of a sectional file in one (nRows, 4 + nVal) array
+
+    blocks = list(_iter_rows(filename, layout))
+    if len(blocks) == 0:
+        return np.empty((0, layout['nVal'] + 4))
+
+    return np.concatenate(blocks)
+
+
+def _read_AL_sectional_cache(filename, cache_dir=None):
+    # Memory map of the parsed rows of a sectional file, converting it to the binary cache first if needed
+
+    cache_file = get_cache_file(filename, '.f8', cache_dir)
+    signatures = {'sectional': file_signature(filename)}
+    meta = read_cache_meta(cache_file, signatures)
+
+    if meta is None:
+        layout = _read_layout(filename)
+
+        def write_func(tmp_file):
+            with open(tmp_file, 'wb') as f:
+                for rows in _iter_rows(filename, layout):
+                    f.write(rows.tobytes())
+
+        if not write_cache(cache_file, signatures, write_func, layout=layout):
+            # The copy couldn't be written, fall back to parsing into memory
+            return _read_rows(filename, layout), layout
+    else:
+        layout = meta['layout']
+
+    rowLength = layout['nVal'] + 4
+    nRows = os.path.getsize(cache_file) // (8 * rowLength)
+    if nRows == 0:
+        return np.empty((0, rowLength)), layout
+
+    return np.memmap(cache_file, dtype=np.float64, mode='r', shape=(nRows, rowLength)), layout
+
+
+def iter_AL_sectional(dirName,varName,blockBytes=2**26,memmap=False,cache_dir=None):
+    # Iterate over a sectional file in blocks of whole time steps, for files that don't fit in memory
+    # Inputs are as for read_AL_sectional
+    # blockBytes -- roughly the number of bytes of the file (or of the binary copy, with memmap) per block
+
+    # Yields
+    #time -- times of the block, zeroed at the first time in the file as in read_AL_sectional
+    #data -- (time, turbine, blade, element) array of the block
+
+    filename = os.path.join(dirName,varName)
 
-    # break up the into a list of arrays
-    print '...reshaping data'
-    data = [[ data[ (t*nBlade) + b   ::nTurbine*nBlade,4:] for b in range(nBlade)] for t in range(nTurbine)]
-    # print data[0:2]
+    if memmap:
+        allRows, layout = _read_AL_sectional_cache(filename, cache_dir)
+        rowsPerStep = layout['nTurbine'] * layout['nBlade']
+        stepBytes = 8 * rowsPerStep * (layout['nVal'] + 4)
+        blockRows = max(1, blockBytes // stepBytes) * rowsPerStep
+        blocks = (allRows[i:i + blockRows] for i in range(0, len(allRows), blockRows))
+    else:
+        layout = _read_layout(filename)
+        blocks = _iter_rows(filename, layout, blockBytes=blockBytes)
+
+    nTurbine, nBlade, nVal = layout['nTurbine'], layout['nBlade'], layout['nVal']
+    firstTime = None
+    for rows in blocks:
+        if firstTime is None:
+            firstTime = rows[0,2]
+        time = rows[::nTurbine*nBlade,2] - firstTime
+        yield time, rows[:,4:].reshape(len(time), nTurbine, nBlade, nVal)
+
+
+def AL_sectional_stats(dirName,varName,nBins=None,azimuthName='azimuth',blockBytes=2**26,memmap=False,cache_dir=None):
+    # Streaming statistics per turbine, blade and element of a sectional file, holding one block in memory at a time
+    # Inputs are as for iter_AL_sectional
+    # nBins -- if given, also average over nBins azimuth bins of [0, 360) degrees. The rotor azimuth is read from the
+    #          turbineOutput channel azimuthName in the same folder; blade b is at azimuth + b * 360 / nBlade.
+    #          Steps without a rotor azimuth (e.g. the channels of a running case are at different times) are left
+    #          out of the binned mean
+
+    # Outputs a dict of
+    #count -- number of time steps
+    #mean, variance, min, max -- (turbine, blade, element) arrays over time
+    #azimuthBins -- (nBins + 1) bin edges in degrees
+    #azimuthMean -- (turbine, bin, element) mean over time and blades of the steps with the blade in the bin
+    #azimuthCount -- (turbine, bin) number of blade passages averaged in each bin
+
+    from wind_tools.stats import RunningStats
 
+    filename = os.path.join(dirName,varName)
+    print('Reading file %s' % filename)
 
-    print time.shape
-    print data[0][0].shape
+    stats = RunningStats()
+    if nBins is not None:
+        azimuthTime, azimuth = _read_rotor_azimuth(os.path.join(dirName, azimuthName))
+        firstTime = _read_first_time(filename)
+        sums = None
 
-    return (nTurbine,nBlade,time,dt,nVal,data) 
+    for time, data in iter_AL_sectional(dirName, varName, blockBytes, memmap, cache_dir):
+        stats.update_block(data)
+        if nBins is None:
+            continue
 
+        nSteps, nTurbine, nBlade, nVal = data.shape
+        if sums is None:
+            sums = np.zeros(nTurbine * nBins * nVal)
+            counts = np.zeros(nTurbine * nBins)
 
-    # OLD CODE FROM MATT
-    # Set up val and time structures
-    #val = [[ []  for m in range(nBlade[k]) ]   for k in range(nTurbine) ]
-    #time = []
+        # Rotor azimuth at the block's times, per turbine, NaN where there is none
+        bladeAzimuth = np.full((nSteps, nTurbine, nBlade), np.nan)
+        for t in range(min(nTurbine, len(azimuth))):
+            bladeAzimuth[:, t, :] = _match_time(azimuthTime[t], azimuth[t], time + firstTime)[:, None]
+        bladeAzimuth = np.mod(bladeAzimuth + np.arange(nBlade) * 360. / nBlade, 360.)
 
-    # Now read in the data into lists
-    #print '...extracting data'
-    #for line in lines[1:]: #skip header
-    #    if len(line) > 1:
-    #        #print line
-    #        #print line.rstrip().split(' ')[4:]
-    #        #print nVal, len(line.rstrip().split(' ')[4:])
-    #        data = np.array([float(l) for l in line.rstrip().split(' ')]) 
-    #        val[int(data[0])][int(data[1]].append(data[4:]) # Skip first four elements
+        valid = ~np.isnan(bladeAzimuth)
+        bins = np.minimum((bladeAzimuth[valid] * nBins / 360.).astype(int), nBins - 1)
+        turbineBins = np.broadcast_to(np.arange(nTurbine)[:, None], (nSteps, nTurbine, nBlade))[valid] * nBins + bins
 
-    # Now set up the dat variables
-    #val = [[ []  for m in range(nBlade[k]) ]   for k in range(nTurbine) ]
-    #for k in range(nTurbine):
-    #    for m in range(nBlade[k]):
-    #            val{k}{m} = [];
-    #            valI{k}{m} = zeros(bufferSize,nVal(k));
-    # print val
+        counts += np.bincount(turbineBins, minlength=nTurbine * nBins)
+        nodes = (turbineBins[:, None] * nVal + np.arange(nVal)).ravel()
+        sums += np.bincount(nodes, weights=data[valid].ravel(), minlength=sums.size)
 
+    result = {'count': stats.count, 'mean': stats.mean, 'variance': stats.variance(),
+              'min': stats.min, 'max': stats.max}
 
-# Some quick demo stuff
-if __name__ == '__main__':
+    if nBins is not None:
+        result['azimuthBins'] = np.linspace(0., 360., nBins + 1)
+        if sums is not None:
+            counts = counts.reshape(nTurbine, nBins)
+            with np.errstate(invalid='ignore'):
+                result['azimuthMean'] = sums.reshape(nTurbine, nBins, nVal) / counts[:, :, None]
+            result['azimuthCount'] = counts.astype(int)
 
-    import matplotlib.pyplot as plt
-    import matplotlib.ticker as ticker
+    return result
 
-    folderName = '/scratch/pfleming/runs/Envision/runCases/baseline_4_AL_twoTurb/turbineOutput/20000'
 
-    read_AL_sectional(folderName,'lift')
+def _read_first_time(filename):
+    # The (absolute) first time of a sectional file
+
+    layout = _read_layout(filename)
+    with open(filename, 'rb') as f:
+        f.seek(layout['headerBytes'])
+        for line in f:
+            data = line.split()
+            if len(data) > 0:
+                return float(data[2])
+
 
-    # signalsToPlot = ['Power (W)', 'powerRotor','thrust','pitch','rotSpeed','torqueRotor']
+def _read_rotor_azimuth(filename):
+    # Times and rotor azimuths per turbine of a turbineOutput channel file
 
-    # fig, axes = plt.subplots(len(signalsToPlot),1)
+    from wind_tools.sowfa.read_sowfa_df import _get_csv_engine, _read_channel_file
 
-    # formatter = ticker.ScalarFormatter()
-    # formatter.set_powerlimits((-3, 3))
+    df = _read_channel_file(filename, ['turbine', 'time', 'value'], _get_csv_engine())
+    turbines = df.turbine.to_numpy()
+    times = df.time.to_numpy()
+    values = df.value.to_numpy()
 
-    # for signalI in range(0, len(signalsToPlot)):
-    #     signal = signalsToPlot[signalI]
-    #     for turbineI in range(0,SCO.nTurbines):
-    #         axes[signalI].plot(SCO.time, SCO.data[turbineI][signal],label=turbineI)
-    #         axes[signalI].set_xlabel('time (s)')
-    #         axes[signalI].set_ylabel(signal)
+    nTurbine = turbines.max() + 1 if len(turbines) > 0 else 0
+    azimuthTime = [times[turbines == t] for t in range(nTurbine)]
+    azimuth = [values[turbines == t] for t in range(nTurbine)]
 
-    # for turbineI in range(0, SCO.nTurbines):
-    #     axes[0].yaxis.set_major_formatter(formatter)
+    return azimuthTime, azimuth
+
+
+def _match_time(times, values, sampleTimes, tolerance=1e-6):
+    # values at sampleTimes, matching the sorted times exactly (up to tolerance), NaN where there is no match
+
+    result = np.full(len(sampleTimes), np.nan)
+    if len(times) == 0:
+        return result
+
+    i = np.clip(np.searchsorted(times, sampleTimes - tolerance), 0, len(times) - 1)
+    match = np.abs(times[i] - sampleTimes) <= tolerance
+    result[match] = values[i[match]]
+
+    return result
+
+
+# Some quick demo stuff
+if __name__ == '__main__':
+
+    folderName = '/scratch/pfleming/runs/Envision/runCases/baseline_4_AL_twoTurb/turbineOutput/20000'
 
-    # plt.legend()
-    # plt.show()
+    nTurbine, nBlade, time, dt, nVal, data = read_AL_sectional(folderName,'lift')
+    print(time.shape)
+    print(data.shape)
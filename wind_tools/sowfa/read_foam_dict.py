@@ -0,0 +1,394 @@
+"""read_foam_dict module
+
+Parse OpenFOAM dictionary files (controlDict, turbineArrayProperties,
+turbineProperties, ...) into Python structures. Sub-dictionaries become
+dicts, lists become lists, numbers become int or float, switches become
+bool and everything else stays a str. #include directives and $variable
+references are resolved, comments are dropped.
+
+Parsed files are memoized on the modification time and size of the file and
+of every file it includes, so reading the metadata of many cases repeatedly
+only parses each file once.
+
+read_foam_entries reads a single keyword, such as the baseLocation of every
+turbine. The entries of each keyword are indexed once per memoized file, so
+repeated reads don't walk or copy the whole dictionary.
+"""
+
+import os
+import re
+import threading
+
+from wind_tools.cache import file_signature
+
+# Parentheses nested up to 8 deep, for keywords like div((nuEff*dev2(T(grad(U)))))
+_NESTED = r'[^()]*'
+for _ in range(8):
+    _NESTED = r'(?:[^()]|\(%s\))*' % _NESTED
+
+# Comments, verbatim #{ #} blocks, quoted strings (kept with their quotes), ${variables}, punctuation, list
+# sizes and words; a word runs on into parentheses right after it
+_TOKEN = re.compile(r'''\s*(
+    //[^\n]*
+  | /\*.*?\*/
+  | \#\{.*?\#\}
+  | "(?:[^"\\]|\\.)*"
+  | \$\{[^{}\s]*\}
+  | [{}()\[\];]
+  | [-+]?\d+(?=\()
+  | [^\s{}()\[\];"]+(?:\(%s\))?
+)''' % _NESTED, re.S | re.X)
+
+_NUMBER_START = set('0123456789+-.')
+_SPECIAL_START = set('{}()[];$#"')
+_SWITCHES = {'true': True, 'on': True, 'yes': True, 'false': False, 'off': False, 'no': False}
+_CONTAINERS = (dict, list)
+_INCLUDES = ['#include', '#includeIfPresent', '#sinclude']
+
+_memo = dict()
+_memo_lock = threading.Lock()
+
+
+def read_foam_dict(filename, memoize=True):
+    """
+    Read an OpenFOAM dictionary file
+
+    input:
+        filename: the dictionary file
+        memoize: if True, reuse the result of an earlier read of the file if neither
+            it nor any file it includes has changed since
+
+    output:
+        foam_dict: dict of the entries of the file, in file order
+    """
+
+    path = os.path.abspath(filename)
+
+    if memoize:
+        return _copy(_read_memoized(path)[1])
+
+    return _parse_path(path)[1]
+
+
+def parse_foam_dict(text, include_dir='.'):
+    """
+    Parse the text of an OpenFOAM dictionary
+
+    input:
+        text: the dictionary
+        include_dir: folder relative #include paths are found from
+
+    output:
+        foam_dict: dict of the entries, in order
+    """
+
+    foam_dict = dict()
+    _Parser(_tokenize(text), include_dir, dict()).parse_entries(foam_dict, [])
+
+    return foam_dict
+
+
+def read_foam_entries(filename, keyword, memoize=True):
+    """
+    Read the values of a keyword in an OpenFOAM dictionary file
+
+    input:
+        filename: the dictionary file
+        keyword: the keyword to read, e.g. baseLocation
+        memoize: as for read_foam_dict
+
+    output:
+        values: list of the value of every entry of keyword, at any depth, in file order
+    """
+
+    path = os.path.abspath(filename)
+
+    if not memoize:
+        return list(_iter_entries(_parse_path(path)[1], keyword))
+
+    _, foam_dict, index = _read_memoized(path)
+    values = index.get(keyword)
+    if values is None:
+        values = list(_iter_entries(foam_dict, keyword))
+        with _memo_lock:
+            index[keyword] = values
+
+    return [_copy(v) for v in values]
+
+
+def clear_memo():
+    """Forget all memoized files"""
+
+    with _memo_lock:
+        _memo.clear()
+
+
+def _signatures_match(signatures):
+    """True if none of the files of a memoized read has changed"""
+
+    for path, signature in signatures.items():
+        try:
+            if file_signature(path) != signature:
+                return False
+        except OSError:
+            return False
+
+    return True
+
+
+def _read_memoized(path):
+    """The memoized (signatures, foam_dict, index) of a file, parsing it if it is new or has changed"""
+
+    with _memo_lock:
+        memo = _memo.get(path)
+    if memo is not None and _signatures_match(memo[0]):
+        return memo
+
+    signatures, foam_dict = _parse_path(path)
+    # The index of entries by keyword is filled in by read_foam_entries
+    memo = (signatures, foam_dict, dict())
+    with _memo_lock:
+        _memo[path] = memo
+
+    return memo
+
+
+def _parse_path(path):
+    """The signatures of the files read and the dict of the entries of the file path"""
+
+    signatures = dict()
+    foam_dict = dict()
+    _parse_file(path, foam_dict, [], signatures)
+
+    return signatures, foam_dict
+
+
+def _parse_file(path, target, scopes, signatures):
+    """Parse the entries of the file path into the dict target"""
+
+    if path in signatures:
+        raise ValueError('%s is included more than once (or includes itself)' % path)
+    signatures[path] = file_signature(path)
+    with open(path, 'r') as f:
+        text = f.read()
+
+    _Parser(_tokenize(text), os.path.dirname(path), signatures).parse_entries(target, scopes)
+
+
+def _iter_entries(foam_dict, keyword):
+    """Values of the keyword entries of a parsed dict, depth first in order"""
+
+    for key, value in foam_dict.items():
+        if key == keyword:
+            yield value
+        elif isinstance(value, dict):
+            yield from _iter_entries(value, keyword)
+
+
+def _tokenize(text):
+    """Split the text of a dictionary into tokens, dropping comments, ending with None"""
+
+    tokens = [t for t in _TOKEN.findall(text) if t[:2] != '//' and t[:2] != '/*']
+    tokens.append(None)
+
+    return tokens
+
+
+class _Parser():
+    """Recursive descent over the tokens of one file"""
+
+    def __init__(self, tokens, include_dir, signatures):
+        self.tokens = tokens
+        self.pos = 0
+        self.include_dir = include_dir
+        self.signatures = signatures
+
+    def parse_entries(self, target, scopes, closing=None):
+        """Parse keyword entries into target up to closing (or the end)"""
+
+        tokens = self.tokens
+        scopes = scopes + [target]
+        pos = self.pos
+        while True:
+            token = tokens[pos]
+            if token is None:
+                self.pos = pos
+                if closing is not None:
+                    raise ValueError('Missing %s at end of dictionary' % closing)
+                return
+            pos += 1
+
+            if token == closing:
+                self.pos = pos
+                return
+            if token == ';':
+                continue
+
+            start = token[0]
+            if start == '#':
+                self.pos = pos
+                self.parse_directive(token, target, scopes)
+                pos = self.pos
+                continue
+            if start == '$':
+                # A $dict entry merges that dict in
+                value = self.lookup(token, scopes)
+                if not isinstance(value, dict):
+                    raise ValueError(('%s not found' if value is token else '%s is not a dictionary to merge in')
+                                     % token)
+                target.update(_copy(value))
+                if tokens[pos] == ';':
+                    pos += 1
+                continue
+
+            key = token[1:-1] if start == '"' else token
+            value = tokens[pos]
+            if value is None:
+                raise ValueError('Missing value of %s at end of dictionary' % key)
+
+            if value == '{':
+                self.pos = pos + 1
+                sub_dict = target[key] if isinstance(target.get(key), dict) else dict()
+                target[key] = sub_dict
+                self.parse_entries(sub_dict, scopes, '}')
+                pos = self.pos
+            elif tokens[pos + 1] == ';' and value[0] not in _SPECIAL_START:
+                # The common keyword value; entry
+                target[key] = _convert(value)
+                pos += 2
+            else:
+                self.pos = pos
+                values = self.parse_values(scopes, ';')
+                target[key] = values[0] if len(values) == 1 else (None if len(values) == 0 else values)
+                pos = self.pos
+
+    def parse_directive(self, directive, target, scopes):
+        """Handle the #include family, skip the arguments of other directives"""
+
+        if directive in _INCLUDES:
+            name = self.tokens[self.pos]
+            if name is None:
+                raise ValueError('%s without a file name' % directive)
+            self.pos += 1
+            path = os.path.join(self.include_dir, os.path.expandvars(name.strip('"')))
+            if os.path.isfile(path):
+                _parse_file(os.path.abspath(path), target, scopes[:-1], self.signatures)
+            elif directive == '#include':
+                raise ValueError('#include file %s not found' % path)
+        elif directive in ['#includeEtc', '#includeFunc', '#inputMode', '#remove', '#includeModel']:
+            self.parse_values(scopes, None, single=True)
+
+    def parse_values(self, scopes, closing, single=False):
+        """Parse the values of an entry up to closing, or just one value if single"""
+
+        tokens = self.tokens
+        pos = self.pos
+        values = list()
+        while True:
+            token = tokens[pos]
+            if token is None:
+                self.pos = pos
+                if closing in [None, ';']:
+                    return values
+                raise ValueError('Missing %s in dictionary' % closing)
+
+            if token == closing:
+                self.pos = pos + 1
+                return values
+            if token == '}' and closing == ';':
+                # A last entry without ; before the closing brace
+                self.pos = pos
+                return values
+            pos += 1
+
+            start = token[0]
+            if start not in _SPECIAL_START:
+                if tokens[pos] == '(' and token.lstrip('+-').isdigit():
+                    # Size of the list that follows
+                    continue
+                values.append(_convert(token))
+            elif start == '"':
+                values.append(token[1:-1])
+            elif token == '(' or token == '[':
+                self.pos = pos
+                values.append(self.parse_values(scopes, ')' if token == '(' else ']'))
+                pos = self.pos
+            elif token == '{':
+                self.pos = pos
+                sub_dict = dict()
+                self.parse_entries(sub_dict, scopes, '}')
+                values.append(sub_dict)
+                pos = self.pos
+            elif start == '$':
+                values.append(_copy(self.lookup(token, scopes)))
+            else:
+                values.append(token)
+
+            if single:
+                self.pos = pos
+                return values
+
+    def lookup(self, token, scopes):
+        """
+        The value of a variable: $name or ${name} from the innermost scope that has it, $a.b for
+        b of the dict a, $..b from the scope above (one more . for each scope up) and $:a.b from the
+        top level. A $name that isn't an entry, e.g. an environment variable, is kept as is
+        """
+
+        name = token[2:-1] if token[:2] == '${' else token[1:]
+        scoped = name[:1] in [':', '.']
+        if name[:1] == ':':
+            name = name[1:]
+            search = scopes[:1]
+        elif name[:1] == '.':
+            up = len(name) - len(name.lstrip('.'))
+            name = name[up:]
+            if up > len(scopes):
+                raise ValueError('%s goes up past the top level' % token)
+            search = [scopes[-up]]
+        else:
+            search = scopes[::-1]
+
+        keys = name.split('.')
+        if not name or '' in keys or _SPECIAL_START.intersection(name):
+            raise ValueError('Unsupported variable %s' % token)
+
+        for scope in search:
+            if name in scope:
+                return scope[name]
+            if keys[0] in scope:
+                value = scope[keys[0]]
+                for key in keys[1:]:
+                    if not isinstance(value, dict) or key not in value:
+                        raise ValueError('%s not found' % token)
+                    value = value[key]
+                return value
+
+        if scoped or len(keys) > 1:
+            raise ValueError('%s not found' % token)
+
+        return token
+
+
+def _convert(token):
+    """A word as an int, float or bool if it is one"""
+
+    if token[0] in _NUMBER_START:
+        digits = token[1:] if token[0] in '+-' else token
+        try:
+            return int(token) if digits.isdigit() else float(token)
+        except ValueError:
+            pass
+
+    return _SWITCHES.get(token, token)
+
+
+def _copy(value):
+    """Copy of the dicts and lists of a parsed value, the rest is immutable"""
+
+    if isinstance(value, dict):
+        return dict((k, _copy(v) if isinstance(v, _CONTAINERS) else v) for k, v in value.items())
+    if isinstance(value, list):
+        return [_copy(v) if isinstance(v, _CONTAINERS) else v for v in value]
+
+    return value
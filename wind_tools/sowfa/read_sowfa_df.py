@@ -1,6 +1,11 @@
 import numpy as np
 import pandas as pd
+import io
 import os
+import time
+
+from wind_tools.cache import file_signature, get_cache_file, read_cache_meta, write_cache
+from wind_tools.sowfa.read_foam_dict import read_foam_dict, read_foam_entries
 
 
 # class SuperCONOUT:
@@ -226,11 +231,27 @@ import os
 #     return dfAl, SCO.nTurbines
 
 
-def read_sowfa_df(folder_name, channels=[]):
+def read_sowfa_df(folder_name, channels=[], engine=None, cache=True, cache_dir=None,
+                  start_time=None, end_time=None, turbines=None, compact=False):
     """New function to use pandas to read in files using pandas
 
+    The first read of a folder saves all its simple channels as a Parquet cache
+    (when pyarrow is installed), later reads load only the requested channels from it.
+    The cache is rebuilt whenever the path, mtime or size of any of the channel files changes.
+
+    A time window is found by binary search in the (time sorted) channel files and only
+    that part of each file is parsed, or it is filtered while reading the cache. Such partial
+    reads don't write the cache.
+
     input: folder_name, where to find the outputs of AL
-            channels, not really used for now, but could be a list of desired channels to only read
+            channels, list of channels to read, by default all of the simple (one value per turbine) channels
+            engine, pandas csv engine, c by default; pyarrow is faster on complete files
+            cache: if True read from / write to the Parquet cache, False to always parse
+            cache_dir: folder for the cache, by default next to folder_name (see wind_tools.cache)
+            start_time, end_time: if given, only read rows in this window (s, inclusive), in the
+                zeroed time of the returned frame, i.e. from the first time in the files
+            turbines: if given, list of turbines to return
+            compact: if True return compact dtypes and a sorted (turbine, time) index, see compact_frame
     output:
 		df: a pandas table
 
@@ -238,18 +259,21 @@ def read_sowfa_df(folder_name, channels=[]):
     Paul Fleming, 2018 based on 
     Pieter Gebraad, 2015"""
 
+    if compact:
+        return compact_frame(read_sowfa_df(folder_name, channels, engine, cache, cache_dir, start_time, end_time, turbines))
+
     # Get the availble outputs
     outputNames = [f for f in os.listdir(folder_name) if os.path.isfile(os.path.join(folder_name, f))]
     
     
     # Remove the harder input files for now (undo someday)
     hardFiles = ['Vtangential','Cl','Cd','Vradial','x','y','z','alpha','axialForce']
-    simpleFiles = ['nacYaw','rotSpeedFiltered','rotSpeed','thrust','torqueGen','powerRotor','powerGenerator','torqueRotor',
-    								'azimuth','pitch']
+    simpleFiles = SIMPLE_CHANNELS
+    simpleOutputNames = [o for o in outputNames if o in simpleFiles]
 
     # Limit to files
     if len(channels) == 0:
-    	outputNames = [o for o in outputNames if o in simpleFiles]
+    	outputNames = simpleOutputNames
     else:
     	outputNames = channels	
 
@@ -260,50 +284,250 @@ def read_sowfa_df(folder_name, channels=[]):
     if num_channels == 0:
         raise ValueError('Is %s a data folder?' % folder_name)
 
+    partial = start_time is not None or end_time is not None or turbines is not None
 
+    if not (cache and _has_pyarrow()):
+        return _parse_channels(folder_name, outputNames, engine, start_time, end_time, turbines)
 
+    # The cache holds every simple channel, so any selection of them can be read from it
+    cache_channels = simpleOutputNames + [o for o in outputNames if o not in simpleOutputNames]
+    cache_file = get_cache_file(folder_name, '.parquet', cache_dir)
+    signatures = dict((chan, file_signature(os.path.join(folder_name, chan))) for chan in cache_channels)
+    if read_cache_meta(cache_file, signatures) is not None:
 
-    # Now loop through the files
-    for c_idx, chan in enumerate(outputNames):
-        
-        # print("Load %s" % chan)
-        filename = os.path.join(folder_name,chan)
+        # Row groups outside the window are skipped, the cache is sorted by time
+        filters = list()
+        if start_time is not None:
+            filters.append(('time', '>=', start_time - _TIME_TOLERANCE))
+        if end_time is not None:
+            filters.append(('time', '<=', end_time + _TIME_TOLERANCE))
+        if turbines is not None:
+            filters.append(('turbine', 'in', list(turbines)))
+        return pd.read_parquet(cache_file, columns=['time', 'turbine'] + outputNames, filters=filters or None)
+
+    if partial:
+        return _parse_channels(folder_name, outputNames, engine, start_time, end_time, turbines)
+
+    df = _parse_channels(folder_name, cache_channels, engine)
+    write_cache(cache_file, signatures,
+                lambda tmp_file: df.to_parquet(tmp_file, index=False, row_group_size=_CACHE_ROW_GROUP_SIZE),
+                channels=cache_channels)
 
-        # Load the file
-        df_inner = pd.read_csv(filename,sep=' ',header=None,skiprows=1)
+    return df[['time', 'turbine'] + outputNames]
 
-        # Rename the columns
-        df_inner.columns=['turbine','time','dt',chan]
 
-        # Drop dt
-        df_inner = df_inner[['time','turbine',chan]].set_index(['time','turbine'])
+def compact_frame(df, case_names=None):
+    """Return a frame of turbine data with compact dtypes and a sorted index
 
-        # On first run declare the new frame
-        if c_idx == 0:
-            # Declare the main data frame to return as copy
-            df = df_inner.copy(deep=True)
+    Channels are stored as float32, turbine as the smallest integer type that
+    holds it and case as a Categorical. The index is (case, turbine, time),
+    sorted, leaving out the keys that aren't in the frame. The time stays float64.
 
-        # On other loops just add the new frame
+    input: df: frame from read_sowfa_df or load_cases, keys as columns
+            case_names: order of the case categories, by default the order of appearance
+    output:
+        df_compact: the compact frame"""
+
+    keys = [k for k in ['case', 'turbine', 'time'] if k in df.columns]
+    columns = dict()
+    for c in df.columns:
+        if c == 'turbine':
+            columns[c] = pd.to_numeric(df[c], downcast='integer')
+        elif c == 'case':
+            columns[c] = df[c] if isinstance(df[c].dtype, pd.CategoricalDtype) else \
+                pd.Categorical(df[c], categories=pd.unique(pd.Series(case_names if case_names is not None else df[c])))
+        elif c not in keys and df[c].dtype == np.float64:
+            columns[c] = df[c].astype(np.float32)
         else:
-            df[chan] = df_inner[chan]
+            columns[c] = df[c]
+
+    return pd.DataFrame(columns).set_index(keys).sort_index()
+
+
+# Rows per row group of the Parquet cache, the unit in which a time window can skip data
+_CACHE_ROW_GROUP_SIZE = 100000
+
+# Times within this many seconds of the window edges are included
+_TIME_TOLERANCE = 1e-6
+
 
-    # Reset the index
-    df = df.reset_index()
+def _parse_channels(folder_name, outputNames, engine=None, start_time=None, end_time=None, turbines=None):
+    """Parse the channel files outputNames of a turbineOutput folder into one frame"""
 
-    # Zero the time
-    df['time'] = df.time - df.time.min()
+    engine = _get_csv_engine(engine)
+    filenames = [os.path.join(folder_name, chan) for chan in outputNames]
+
+    # Every channel file lists the same (turbine, time) rows in the same order, so the turbine
+    # and time columns are only read from the first file and the channels are lined up by position
+    if start_time is None and end_time is None:
+        sources = filenames
+        skiprows = 1
+        first_time = None
+    else:
+        windows = [_read_time_window(filename, start_time, end_time) for filename in filenames]
+        sources = [io.BytesIO(window) for window, first_time in windows]
+        skiprows = 0
+        first_time = windows[0][1]
+
+    df_first = _read_channel_file(sources[0], ['turbine', 'time', 'value'], engine, skiprows)
+    num_rows = len(df_first)
+    columns = {'time': df_first.time.to_numpy(), 'turbine': df_first.turbine.to_numpy(), outputNames[0]: df_first.value.to_numpy()}
+
+    for chan, source in zip(outputNames[1:], sources[1:]):
+        values = _read_channel_file(source, ['value'], engine, skiprows).value.to_numpy()
+
+        # A channel still being written may be a little shorter, pad it as aligning on the index did
+        if len(values) != num_rows:
+            values = np.concatenate([values[:num_rows], np.full(max(num_rows - len(values), 0), np.nan)])
+        columns[chan] = values
+
+    df = pd.DataFrame(columns)
+
+    # Zero the time, from the start of the files for a window
+    if first_time is None:
+        first_time = df.time.min()
+    df['time'] = df.time - first_time
+
+    # Turbines are interleaved within each time step, so they are picked after reading
+    if turbines is not None:
+        df = df[df.turbine.isin(turbines)].reset_index(drop=True)
 
     return df
 
-def load_cases(case_list,case_folder='.',case_names=[],sub_folder='turbineOutput/20000'):
+
+def _read_time_window(filename, start_time=None, end_time=None):
+    """Bytes of the rows of a channel file from start_time to end_time (from the first time in the file)
+
+    The rows are sorted by time, so the window is found by binary search over
+    the bytes of the file, and nothing outside it is read
+
+    output: window: bytes of the rows in the window
+            first_time: time of the first row of the file"""
+
+    import mmap
+
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b'', np.nan
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            data_start = content.find(b'\n') + 1
+            if data_start == 0:
+                return b'', np.nan
+            first_time = _line_time(content, data_start)
+
+            start = data_start
+            if start_time is not None:
+                start = _find_time(content, data_start, first_time + start_time - _TIME_TOLERANCE, False)
+            end = len(content)
+            if end_time is not None:
+                end = _find_time(content, start, first_time + end_time + _TIME_TOLERANCE, True)
+
+            return content[start:end], first_time
+
+
+def _find_time(content, lo, time, after):
+    """Byte offset of the first line from offset lo with a time >= time (> time if after)"""
+
+    hi = len(content)
+    while lo < hi:
+        mid = (lo + hi) // 2
+
+        # Start and end of the line holding mid
+        line_start = max(content.rfind(b'\n', lo, mid) + 1, lo)
+        line_end = content.find(b'\n', line_start)
+        line_end = len(content) if line_end < 0 else line_end
+
+        line_time = _line_time(content, line_start)
+        if line_time < time or (after and line_time == time):
+            lo = line_end + 1
+        else:
+            hi = line_start
+
+    return min(lo, len(content))
+
+
+def _line_time(content, pos):
+    """Time (second column) of the line at byte offset pos, inf for a blank or partly written line"""
+
+    line_end = content.find(b'\n', pos)
+    words = content[pos:len(content) if line_end < 0 else line_end].split()
+    try:
+        return float(words[1])
+    except (IndexError, ValueError):
+        return np.inf
+
+
+# Channels with one value per turbine and time step, read by default
+SIMPLE_CHANNELS = ['nacYaw','rotSpeedFiltered','rotSpeed','thrust','torqueGen','powerRotor','powerGenerator','torqueRotor',
+                   'azimuth','pitch']
+
+# Columns of a turbineOutput channel file
+_CHANNEL_COLUMNS = ['turbine', 'time', 'dt', 'value']
+_CHANNEL_DTYPES = {'turbine': np.int64, 'time': np.float64, 'dt': np.float64, 'value': np.float64}
+
+
+def _read_channel_file(filename, usecols, engine, skiprows=1):
+    """Read the columns usecols (of turbine, time, dt and value, in that order) of a turbineOutput channel file
+
+    filename can also be a file object holding part of the rows, with skiprows=0
+    """
+
+    if skiprows == 0 and isinstance(filename, io.BytesIO) and len(filename.getbuffer()) == 0:
+        return pd.DataFrame(dict((c, np.empty(0, dtype=_CHANNEL_DTYPES[c])) for c in usecols))
+
+    positions = [_CHANNEL_COLUMNS.index(c) for c in usecols]
+
+    # The pyarrow engine numbers the columns it keeps from 0, the c engine keeps their position in the file
+    keys = range(len(positions)) if engine == 'pyarrow' else positions
+    df = pd.read_csv(filename, sep=' ', header=None, skiprows=skiprows, usecols=positions,
+                     dtype=dict((k, _CHANNEL_DTYPES[c]) for k, c in zip(keys, usecols)), engine=engine)
+    df.columns = usecols
+
+    return df
+
+
+def _get_csv_engine(engine=None):
+    """The pandas csv engine to use, c unless engine is given
+
+    pyarrow is faster but raises on the half-written last line of the channel files of a
+    running case, which the c engine reads with the missing values as NaN
+    """
+
+    if engine is not None:
+        return engine
+
+    return 'c'
+
+
+def _has_pyarrow():
+    """True if pyarrow (used for the csv engine and the Parquet cache) is installed"""
+
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+
+    return True
+
+
+def load_cases(case_list,case_folder='.',case_names=[],sub_folder='turbineOutput/20000',
+               max_workers=None,use_processes=False,progress=None,return_report=False,compact=False,**read_args):
     """Load a list of cases and return a single data frame
 
     input: case_list: list of cases
             case_folder: if given, the root folder of all cases
             case_names: if given, cleaner names of each case, otherwise just use case_list
             sub_folder: path to folder below the case folder
+            max_workers: if more than 1, read the cases concurrently in a pool of this many workers
+            use_processes: use a process pool instead of a thread pool
+            progress: if given, called as progress(num_done, num_cases, case_name) after each case
+            return_report: also return a frame of per case load time, rows and error
+            compact: if True return compact dtypes and a sorted (case, turbine, time) index, see compact_frame
+            read_args: passed on to read_sowfa_df (channels, engine, cache, cache_dir,
+                start_time, end_time, turbines)
     output:
-		df: a pandas table with a new case_name column
+		df: a pandas table with a new case_name column, cases that fail to load are left out
+        report: (if return_report) frame with case, folder, rows, seconds and error of each case
 
 
     Paul Fleming, 2018 """
@@ -317,29 +541,134 @@ def load_cases(case_list,case_folder='.',case_names=[],sub_folder='turbineOutput
         print('Name and case list must be same length')
         return 0
 
-    # Loop through the cases and build up return frame
-    df = pd.DataFrame()
-    for case_folder_name, case_name in zip(case_list,case_names):
-        
-        # Load this case
-        folder_name = os.path.join(case_folder,case_folder_name,sub_folder)
-        df_inner = read_sowfa_df(folder_name)
+    folder_names = [os.path.join(case_folder,case_folder_name,sub_folder) for case_folder_name in case_list]
+    num_cases = len(folder_names)
+
+    # Cases are downcast as they are read, so the full size frame is never held
+    if compact:
+        read_args['compact'] = True
+    results = _load_all(_load_case, folder_names, case_names, read_args, max_workers, use_processes, progress)
+
+    # Build the return frame in one go, leaving out failed cases
+    df_list = list()
+    for case_name, (df_inner, seconds, error) in zip(case_names, results):
+        if error is not None:
+            print('Could not load case %s (%s)' % (case_name, error))
+            continue
 
         # Assign the case name
-        df_inner['case'] = case_name
+        if compact:
+            df_inner = df_inner.reset_index()
+            categories = pd.unique(pd.Series(case_names))
+            codes = np.full(len(df_inner), list(categories).index(case_name), dtype=np.int16)
+            df_inner['case'] = pd.Categorical.from_codes(codes, categories=categories)
+        else:
+            df_inner['case'] = case_name
 
-        # Append the larger df
-        df = df.append(df_inner)
+        df_list.append(df_inner)
 
-    # Zero the time
-    df['time'] = df.time - df.time.min()
+    if len(df_list) == 0:
+        raise ValueError('None of the %d cases could be loaded' % num_cases)
+
+    # The time of each case is already zeroed by read_sowfa_df
+    df = pd.concat(df_list, ignore_index=True)
+    if compact:
+        df = compact_frame(df)
+
+    if return_report:
+        report = pd.DataFrame({'case': case_names, 'folder': folder_names,
+                               'rows': [0 if r[0] is None else len(r[0]) for r in results],
+                               'seconds': [r[1] for r in results],
+                               'error': [r[2] for r in results]})
+        return df, report
 
     return df
 
 
+def warm_cache(campaign_folder, cache_dir=None, max_workers=None, use_processes=False, progress=None, **read_args):
+    """Parse every turbineOutput folder below a campaign folder into the Parquet cache
+
+    input: campaign_folder: folder holding the case folders
+            cache_dir: folder for the cache, by default next to each turbineOutput folder
+            max_workers, use_processes, progress: as for load_cases
+            read_args: passed on to read_sowfa_df (channels, engine)
+    output:
+        report: frame with folder, rows, seconds and error of each turbineOutput folder"""
+
+    folder_names = find_output_folders(campaign_folder)
+    read_args.update(cache=True, cache_dir=cache_dir)
+    results = _load_all(_warm_case, folder_names, folder_names, read_args, max_workers, use_processes, progress)
+
+    return pd.DataFrame({'folder': folder_names,
+                         'rows': [r[0] for r in results],
+                         'seconds': [r[1] for r in results],
+                         'error': [r[2] for r in results]})
+
+
+def find_output_folders(campaign_folder):
+    """All turbineOutput/<start time> folders below campaign_folder, sorted by path"""
+
+    folder_names = list()
+    for root, dirs, files in os.walk(campaign_folder):
+        if os.path.basename(root) == 'turbineOutput':
+            folder_names.extend(os.path.join(root, d) for d in dirs)
+            dirs[:] = []
+
+    return sorted(folder_names)
+
+
+def _load_all(load_func, folder_names, case_names, read_args, max_workers=None, use_processes=False, progress=None):
+    """Call load_func(folder_name, read_args) for all folders, in a pool if max_workers > 1, results in folder order"""
+
+    num_cases = len(folder_names)
+    results = [None] * num_cases
+
+    if max_workers is not None and max_workers > 1:
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=max_workers) as executor:
+            futures = dict((executor.submit(load_func, folder_name, read_args), i) for i, folder_name in enumerate(folder_names))
+
+            # Results are put back in case order whatever order they finish in
+            for num_done, future in enumerate(as_completed(futures)):
+                i = futures[future]
+                results[i] = future.result()
+                if progress is not None:
+                    progress(num_done + 1, num_cases, case_names[i])
+    else:
+        for i, folder_name in enumerate(folder_names):
+            results[i] = load_func(folder_name, read_args)
+            if progress is not None:
+                progress(i + 1, num_cases, case_names[i])
+
+    return results
+
+
+def _warm_case(folder_name, read_args):
+    """Read one case folder through the cache, returning (rows, seconds, error)"""
+
+    df, seconds, error = _load_case(folder_name, read_args)
+
+    return (0 if df is None else len(df)), seconds, error
+
+
+def _load_case(folder_name, read_args):
+    """Read one case folder, returning (df, seconds, error), df is None and error a message if it failed"""
+
+    start = time.time()
+    try:
+        df = read_sowfa_df(folder_name, **read_args)
+        error = None
+    except (OSError, ValueError) as e:
+        df = None
+        error = '%s: %s' % (type(e).__name__, e)
+
+    return df, time.time() - start, error
+
+
 
 def get_turbine_coord(case_folder):
-    import re
     """Read the turbine coordinates from the turbineArrayProperties file 
 
 
@@ -350,26 +679,36 @@ def get_turbine_coord(case_folder):
     Paul Fleming, 2018 """
 
     turbine_array_file = os.path.join(case_folder,'constant','turbineArrayProperties')
-    
-    x = list()
-    y = list()
 
+    # The baseLocation of every turbine, in file order
+    locations = read_foam_entries(turbine_array_file, 'baseLocation')
 
-    with open(turbine_array_file,'r') as f:
-        for line in f:
-            if 'baseLocation' in line:
-                # Extract the coordinates
-                data = re.findall(r"[-+]?\d*\.\d+|\d+", line)
-                
-                # Append the data
-                x.append(float(data[0]))
-                y.append(float(data[1]))
-
-    turbine_loc = pd.DataFrame({'x':x,'y':y})
+    turbine_loc = pd.DataFrame(np.array(locations, dtype=float).reshape(-1, 3)[:, :2], columns=['x','y'])
     turbine_loc.index.name = 'Turbine'
 
     return turbine_loc
 
+
+def get_turbine_properties(case_folder):
+    """Read the turbineProperties files of the turbine types used in a case
+
+    input: case_folder: name of case folder
+
+    output: turbine_properties: dict of the parsed constant/turbineProperties/<turbineType> file of
+        each turbineType in turbineArrayProperties
+    """
+
+    turbine_array = read_foam_dict(os.path.join(case_folder,'constant','turbineArrayProperties'))
+    turbine_types = [v['turbineType'] for v in turbine_array.values() if isinstance(v, dict) and 'turbineType' in v]
+
+    turbine_properties = dict()
+    for turbine_type in turbine_types:
+        if turbine_type not in turbine_properties:
+            turbine_properties[turbine_type] = read_foam_dict(
+                os.path.join(case_folder,'constant','turbineProperties',turbine_type))
+
+    return turbine_properties
+
 def read_sc_input(case_folder,filename='SC_INPUT.txt',wind_direction=270.):
 
     """Read the SC input file to get the wind farm control settings
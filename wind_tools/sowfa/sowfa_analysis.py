@@ -14,13 +14,13 @@ def get_average_channel(df,chan,start_time):
     outputs:
     df_out: df out averages, and if available by case"""
 
-    # If case is available include in average
-    if 'case' in df.columns:
-        df_out = df[['case','turbine',chan]].groupby(['case','turbine']).mean().reset_index()
+    # If case is available include in average (as a column, or an index level of a compact frame)
+    if _has_key(df, 'case'):
+        df_out = df.groupby(['case','turbine'], observed=True)[[chan]].mean().reset_index()
 
     # Otherwise just by turbine
     else:
-        df_out = df[['turbine',chan]].groupby(['turbine']).mean().reset_index()
+        df_out = df.groupby(['turbine'])[[chan]].mean().reset_index()
 
     return df_out
 
@@ -35,8 +35,8 @@ def get_total_frame(df):
 
 
     # If case is available include in average
-    if 'case' in df.columns:
-        df_total = df.groupby(['time', 'case']).sum().reset_index()
+    if _has_key(df, 'case'):
+        df_total = df.groupby(['time', 'case'], observed=True).sum().reset_index()
     else:
         df_total = df.groupby(['time']).sum().reset_index()
 
@@ -62,11 +62,15 @@ def compare_power(df,period=100.,ax=None,power_channel='powerGenerator',relative
     if not ax:
         fig, ax = plt.subplots()
 
+    # Keys in the index of a compact frame are turned back into columns, the case into plain labels
+    df = _key_columns(df)
+
     # Work out the number of turbines
     num_turbines = len(df.turbine.unique())
 
     # Make a power df
-    df_power = df[['case','turbine','time',power_channel]]
+    df_power = df[['case','turbine','time',power_channel]].copy()
+    df_power['case'] = df_power.case.astype(str)
 
     # Get the mean power and append it
     df_mean = get_total_frame(df_power)
@@ -74,7 +78,7 @@ def compare_power(df,period=100.,ax=None,power_channel='powerGenerator',relative
     df_mean['turbine'] = 'total'
 
     # Merge it in
-    df_power = df_power.append(df_mean)
+    df_power = pd.concat([df_power, df_mean])
 
     # # Add a period column
     # df_power['period'] = df_power.time/100
@@ -100,7 +104,7 @@ def compare_power(df,period=100.,ax=None,power_channel='powerGenerator',relative
         df_power = df_power.set_index(['time','turbine','case']).unstack()
         
         # Rename the baseline column
-        df_power = df_power.rename(index=str,columns={base_column:'baseline'})
+        df_power = df_power.rename(columns={base_column:'baseline'})
         
         # Flatten columns
         df_power.columns =df_power.columns.get_level_values(1)
@@ -126,11 +130,26 @@ def compare_power(df,period=100.,ax=None,power_channel='powerGenerator',relative
     ax = sns.barplot(data=df_power,x='turbine',y=power_channel,hue='case',ax=ax)
 
     # Print the mean values
-    print(df_power.groupby(['case','turbine']).median())
+    print(df_power.groupby(['case','turbine'])[[power_channel]].median())
 
     # Plot it
     # ax = sns.boxplot(data=df_power,x='turbine',y=power_channel,hue='case',ax=ax)
     
     
 
-    return ax
\ No newline at end of file
+    return ax
+
+
+def _has_key(df, key):
+    """True if key is a column or an index level of df"""
+    return key in df.columns or key in df.index.names
+
+
+def _key_columns(df):
+    """df with any case, turbine and time index levels moved back to columns"""
+
+    levels = [k for k in df.index.names if k in ['case', 'turbine', 'time']]
+    if len(levels) == 0:
+        return df
+
+    return df.reset_index(levels)
@@ -0,0 +1,236 @@
+"""tail_sowfa_df module
+
+Follow the turbineOutput channel files of a SOWFA case while it is running.
+Only the complete lines appended since the last update are parsed, so
+polling a long run costs about as much as the new data, not the whole file.
+"""
+
+import io
+import os
+import json
+import glob
+
+import numpy as np
+import pandas as pd
+
+from wind_tools.sowfa.read_sowfa_df import SIMPLE_CHANNELS, _get_csv_engine, _read_channel_file
+
+
+class TurbineOutputTail():
+    """
+    Incremental reader of the channel files of a turbineOutput folder
+
+    For every channel file the byte offset up to which rows have been taken is
+    kept. An update reads from there to the last complete line (a partly
+    written last line is left for the next update) and takes as many rows as
+    every channel has, so the channels stay lined up by position as in
+    read_sowfa_df. The new rows are kept in memory as a list of parts, only
+    joined into one frame when df is read, and, if
+    buffer_dir is given, written to it as Parquet parts together with the
+    offsets, so a later TurbineOutputTail on the same buffer_dir resumes
+    where this one stopped.
+
+    Time is zeroed at the first time in the files, as in read_sowfa_df.
+    """
+
+    def __init__(self, folder_name, channels=[], engine=None, buffer_dir=None, keep_time=None):
+        """
+        input:
+            folder_name: the turbineOutput/<start time> folder to follow
+            channels: channels to follow, by default the simple channels in the folder
+            engine: pandas csv engine, as for read_sowfa_df
+            buffer_dir: if given, folder to append the rows to as Parquet parts
+            keep_time: if given, only keep the last keep_time seconds in memory
+        """
+
+        self.folder_name = folder_name
+        self.channels = list(channels)
+        self.engine = _get_csv_engine(engine)
+        self.buffer_dir = buffer_dir
+        self.keep_time = keep_time
+
+        self.offsets = dict()
+        self.first_time = None
+        self.num_parts = 0
+        self._parts = list()
+
+        if buffer_dir is not None:
+            self._read_state()
+
+    @property
+    def df(self):
+        """All rows kept in memory, columns time, turbine and the channels"""
+
+        if len(self._parts) == 0:
+            return self._empty()
+
+        # Join the parts once, later reads reuse the joined frame
+        if len(self._parts) > 1:
+            self._parts = [pd.concat(self._parts, ignore_index=True)]
+        if self.keep_time is not None:
+            df = self._parts[0]
+            self._parts = [df[df.time >= df.time.iloc[-1] - self.keep_time].reset_index(drop=True)]
+
+        return self._parts[0]
+
+    def update(self):
+        """
+        Read the rows appended since the last update
+
+        output:
+            df_new: frame of the new rows (empty if there are none)
+        """
+
+        if len(self.channels) == 0:
+            self.channels = [c for c in SIMPLE_CHANNELS if os.path.isfile(os.path.join(self.folder_name, c))]
+            if len(self.channels) == 0:
+                return self._empty()
+
+        # Complete lines of each channel since its offset
+        chunks = dict()
+        for chan in self.channels:
+            chunks[chan] = self._read_new_lines(chan)
+        num_rows = min(chunk.count(b'\n') for chunk in chunks.values())
+        if num_rows == 0:
+            return self._empty()
+
+        # Take num_rows lines of every channel, the rest is read again next time
+        columns = dict()
+        for chan in self.channels:
+            chunk = chunks[chan]
+            end = _nth_line_end(chunk, num_rows)
+            usecols = ['turbine', 'time', 'value'] if len(columns) == 0 else ['value']
+            df_chan = _read_channel_file(io.BytesIO(chunk[:end]), usecols, self.engine, skiprows=0)
+            if len(columns) == 0:
+                columns['time'] = df_chan.time.to_numpy()
+                columns['turbine'] = df_chan.turbine.to_numpy()
+            columns[chan] = df_chan.value.to_numpy()
+            self.offsets[chan] += end
+
+        df_new = pd.DataFrame(columns)
+        if self.first_time is None:
+            self.first_time = float(df_new.time.iloc[0])
+        df_new['time'] = df_new.time - self.first_time
+
+        # Concatenating on every update would copy the whole history each time
+        self._parts.append(df_new)
+        if self.keep_time is not None:
+            # Drop the parts that ended before the window, df trims the first one left
+            start_time = df_new.time.iloc[-1] - self.keep_time
+            while self._parts[0].time.iloc[-1] < start_time:
+                self._parts.pop(0)
+
+        if self.buffer_dir is not None:
+            self._write_part(df_new)
+
+        return df_new
+
+    def read_buffer(self):
+        """
+        Read back every row written to buffer_dir
+
+        output:
+            df: frame of all buffered rows
+        """
+
+        parts = sorted(glob.glob(os.path.join(self.buffer_dir, 'part-*.parquet')))
+        if len(parts) == 0:
+            return self._empty()
+
+        return pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+
+    def _empty(self):
+        """Frame with the columns of df and no rows"""
+
+        return pd.DataFrame(columns=['time', 'turbine'] + self.channels)
+
+    def _read_new_lines(self, chan):
+        """Bytes of the complete lines of a channel file after its offset"""
+
+        filename = os.path.join(self.folder_name, chan)
+        if not os.path.isfile(filename):
+            return b''
+
+        with open(filename, 'rb') as f:
+
+            # Skip the header line the first time
+            if chan not in self.offsets:
+                header = f.readline()
+                if not header.endswith(b'\n'):
+                    return b''
+                self.offsets[chan] = len(header)
+
+            # A file shorter than the offset was restarted, the buffer no longer matches it
+            size = os.fstat(f.fileno()).st_size
+            if size < self.offsets[chan]:
+                raise ValueError('%s is shorter than what was already read, was the case restarted?' % filename)
+
+            f.seek(self.offsets[chan])
+            chunk = f.read()
+
+        return chunk[:chunk.rfind(b'\n') + 1]
+
+    def _write_part(self, df_new):
+        """Append the new rows to buffer_dir and save the offsets they were read up to"""
+
+        if not os.path.isdir(self.buffer_dir):
+            os.makedirs(self.buffer_dir)
+
+        df_new.to_parquet(os.path.join(self.buffer_dir, 'part-%08d.parquet' % self.num_parts), index=False)
+        self.num_parts += 1
+
+        state = {'folder_name': os.path.abspath(self.folder_name), 'channels': self.channels,
+                 'offsets': self.offsets, 'first_time': self.first_time, 'num_parts': self.num_parts}
+        tmp_file = os.path.join(self.buffer_dir, 'state.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, os.path.join(self.buffer_dir, 'state.json'))
+
+    def _read_state(self):
+        """Resume from the offsets saved in buffer_dir, if any"""
+
+        state_file = os.path.join(self.buffer_dir, 'state.json')
+        if not os.path.isfile(state_file):
+            return
+
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+
+        if state['folder_name'] != os.path.abspath(self.folder_name):
+            raise ValueError('%s buffers %s, not %s' % (self.buffer_dir, state['folder_name'], self.folder_name))
+
+        self.channels = state['channels']
+        self.offsets = state['offsets']
+        self.first_time = state['first_time']
+        self.num_parts = state['num_parts']
+
+
+def find_case_output_folder(case_folder):
+    """
+    The turbineOutput folder of a case to follow
+
+    input:
+        case_folder: a case folder, or a turbineOutput/<start time> folder itself
+
+    output:
+        folder_name: the latest turbineOutput/<start time> folder of the case
+    """
+
+    output_folder = os.path.join(case_folder, 'turbineOutput')
+    if not os.path.isdir(output_folder):
+        return case_folder
+
+    start_times = [d for d in os.listdir(output_folder) if os.path.isdir(os.path.join(output_folder, d))]
+    start_times = sorted(start_times, key=lambda d: float(d) if d.replace('.', '', 1).isdigit() else -np.inf)
+    if len(start_times) == 0:
+        raise ValueError('No output folders in %s' % output_folder)
+
+    return os.path.join(output_folder, start_times[-1])
+
+
+def _nth_line_end(chunk, n):
+    """Byte offset just after the n-th newline of chunk"""
+
+    line_ends = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n'))
+
+    return int(line_ends[n - 1]) + 1
@@ -0,0 +1,105 @@
+"""stats module
+
+Streaming statistics, for reducing data sets that are too big (or arrive
+too slowly) to hold in memory at once.
+"""
+
+import numpy as np
+
+
+class RunningStats():
+    """
+    Running element-wise mean, variance, min and max over a stream of arrays
+
+    Samples are added one at a time (update) or as blocks along the first
+    axis (update_block), using Welford's update and the pairwise merge of
+    Chan et al. so no samples are kept. Two accumulators over separate parts
+    of the stream can be merged with combine, e.g. after parallel workers.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.min = None
+        self.max = None
+        self._m2 = None
+
+    def update(self, x):
+        """
+        Add one sample (an array of any shape, matching earlier samples)
+        """
+
+        x = np.asarray(x, dtype=float)
+        if self.count == 0:
+            self.count = 1
+            self.mean = x.copy()
+            self._m2 = np.zeros_like(self.mean)
+            self.min = x.copy()
+            self.max = x.copy()
+            return
+
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        np.minimum(self.min, x, out=self.min)
+        np.maximum(self.max, x, out=self.max)
+
+    def update_block(self, x):
+        """
+        Add a block of samples stacked along the first axis
+        """
+
+        x = np.asarray(x, dtype=float)
+        if len(x) == 0:
+            return
+
+        block = RunningStats()
+        block.count = len(x)
+        block.mean = x.mean(axis=0)
+        block._m2 = ((x - block.mean)**2).sum(axis=0)
+        block.min = x.min(axis=0)
+        block.max = x.max(axis=0)
+        self.combine(block)
+
+    def combine(self, other):
+        """
+        Merge the statistics of another RunningStats into this one
+        """
+
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count = other.count
+            self.mean = np.array(other.mean, dtype=float)
+            self._m2 = np.array(other._m2, dtype=float)
+            self.min = np.array(other.min, dtype=float)
+            self.max = np.array(other.max, dtype=float)
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * (float(other.count) / count)
+        self._m2 += other._m2 + delta**2 * (float(self.count) * other.count / count)
+        self.count = count
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+
+        return self
+
+    def variance(self, ddof=0):
+        """
+        Return the variance, by default of the population (ddof=0)
+        """
+
+        if self.count - ddof <= 0:
+            return np.full_like(self.mean, np.nan)
+
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        """
+        Return the standard deviation, by default of the population (ddof=0)
+        """
+
+        return np.sqrt(self.variance(ddof=ddof))